@@ -1,5 +1,32 @@
+import orjson
 from celery import Celery
+from kombu import Queue
+from kombu.serialization import register
+from app.core.compression import compress, decompress
 from app.core.config import settings
+# Registers the signal handlers propagating traces from publishers to workers
+from app.core import tracing  # noqa: F401
+
+
+def _dumps(obj) -> bytes:
+    return compress(orjson.dumps(obj))
+
+
+def _loads(data: bytes):
+    return orjson.loads(decompress(data))
+
+
+# orjson produces the same (compact) JSON as the default serializer at a fraction
+# of the CPU cost, and large payloads (task results) are compressed, so they take
+# far less of the Redis memory shared with the broker. Readers of the result
+# backend, e.g. the API's, decode it with app.core.compression.decompress().
+register(
+    "orjson",
+    _dumps,
+    _loads,
+    content_type="application/x-orjson",
+    content_encoding="binary",
+)
 
 # This is the central Celery application instance
 celery_app = Celery(
@@ -15,4 +42,26 @@ celery_app = Celery(
 celery_app.conf.update(
     task_track_started=True,
     result_extended=True,
+    result_serializer="orjson",
+    result_accept_content=["orjson", "json"],
+    accept_content=["orjson", "json"],
+    # Small and large PRs are routed to separate queues (see app.services.task_routing)
+    # so that each can be served by its own workers, e.g.:
+    #   celery -A app.core.celery_app:celery_app worker -Q reviews.small --concurrency=8
+    #   celery -A app.core.celery_app:celery_app worker -Q reviews.large --concurrency=2
+    task_queues=(Queue("reviews.small"), Queue("reviews.large")),
+    task_default_queue="reviews.small",
+    # Acknowledge only after a task finishes, and take one task at a time, so a
+    # long review never holds other tasks hostage in a worker's prefetch buffer
+    # and tasks of a crashed worker are redelivered.
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=1,
+    # Enable message priorities on the Redis transport
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
 )
+
+# In async mode a worker is a single process running tasks on threads (the pool is
+# switched in app.services.tasks), up to ASYNC_WORKER_CONCURRENCY at once.
+if settings.WORKER_MODE == "async":
+    celery_app.conf.worker_concurrency = settings.ASYNC_WORKER_CONCURRENCY
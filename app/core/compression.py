@@ -0,0 +1,40 @@
+"""
+Compression of payloads stored in Redis (task results, cached responses).
+
+Payloads above a size threshold are compressed with zstd when the `zstandard`
+package is installed, and with zlib otherwise. Compressed payloads are
+recognised by their magic bytes, so readers accept compressed and plain JSON
+payloads alike: JSON never starts with either magic.
+"""
+import zlib
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency; zlib is always available
+    zstandard = None
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# zlib streams start with 0x78 (deflate, 32K window) for every compression level
+ZLIB_MAGIC = b"\x78"
+
+
+def compress(data: bytes) -> bytes:
+    """Compresses a payload if it is at least RESULT_COMPRESSION_MIN_BYTES long."""
+    if len(data) < settings.RESULT_COMPRESSION_MIN_BYTES:
+        return data
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=settings.RESULT_COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, min(settings.RESULT_COMPRESSION_LEVEL, 9))
+
+
+def decompress(data: bytes) -> bytes:
+    """Returns the original payload, whether or not it was compressed."""
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd-compressed but the zstandard package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if data.startswith(ZLIB_MAGIC):
+        return zlib.decompress(data)
+    return data
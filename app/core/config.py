@@ -1,6 +1,8 @@
 """
 Application configuration management.
 """
+from typing import Dict
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -12,6 +14,109 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str= ""
     GITHUB_ACCESS_TOKEN:str= ""
 
+    # GitHub client settings
+    GITHUB_API_URL: str = "https://api.github.com"
+    GITHUB_POOL_SIZE: int = 10  # Keep-alive connections per token
+    GITHUB_CLIENT_CACHE_SIZE: int = 64  # Tokens whose pooled clients are kept
+    GITHUB_TIMEOUT_SECONDS: float = 30.0
+    GITHUB_ETAG_CACHE_SIZE: int = 256  # Cached responses per token for conditional requests
+    GITHUB_MAX_RETRIES: int = 3  # Retries after a rate-limited response
+    GITHUB_RATE_LIMIT_MIN_REMAINING: int = 5  # Wait for the reset below this many remaining calls
+    GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS: float = 900.0
+    GITHUB_ETAG_MAX_BODY_BYTES: int = 256 * 1024  # Larger downloads are not kept for revalidation
+
+    # Bulk analysis settings
+    BULK_MAX_PRS: int = 500  # Per repository
+    BULK_ANALYSIS_TTL_SECONDS: int = 7 * 24 * 60 * 60
+
+    # GitHub webhook settings
+    GITHUB_WEBHOOK_SECRET: str = ""  # Webhook deliveries are rejected while unset
+    WEBHOOK_DEBOUNCE_SECONDS: int = 30  # Pushes within this window are reviewed once, at the latest head
+    PR_LATEST_HEAD_TTL_SECONDS: int = 24 * 60 * 60
+
+    # Diff download limits
+    DIFF_MAX_BYTES: int = 20 * 1024 * 1024  # The download stops after this many bytes
+    DIFF_SPOOL_THRESHOLD_BYTES: int = 1024 * 1024  # Larger diffs are spooled to disk
+    DIFF_MAX_FILES: int = 300  # Files beyond this are skipped
+    DIFF_MAX_FILE_BYTES: int = 200_000  # Larger file diffs are skipped
+
+    # Where PR diffs come from: "rest" downloads them from the GitHub API, "git"
+    # computes them in a bare mirror of the repository kept on the worker's disk
+    DIFF_SOURCE: str = "rest"
+    GIT_MIRROR_DIR: str = "data/git-mirrors"
+    GIT_CLONE_URL_TEMPLATE: str = "https://github.com/{repo}.git"
+    GIT_DIFF_CONTEXT_LINES: int = 3
+    GIT_FETCH_TIMEOUT_SECONDS: float = 300.0
+    GIT_FETCH_MAX_AGE_SECONDS: float = 60.0  # A head already fetched within this window is not fetched again
+
+    # Review cache settings (content-addressed, shared across workers)
+    REVIEW_CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+    REVIEW_CACHE_MAX_ENTRIES: int = 10_000
+    HUNK_CACHE_TTL_SECONDS: int = 30 * 24 * 60 * 60  # Findings per hunk, shared across PRs and rebases
+    # How long the per-PR state used for incremental re-reviews is kept
+    REVIEW_STATE_TTL_SECONDS: int = 30 * 24 * 60 * 60
+
+    # Result store settings (completed results served by the API)
+    RESULTS_LOCAL_CACHE_SIZE: int = 1_000  # Per API process
+    RESULTS_LOCAL_CACHE_TTL_SECONDS: float = 300.0
+    RESULTS_REDIS_TTL_SECONDS: int = 60 * 60  # Older results are read back from the archive
+    RESULT_COMPRESSION_MIN_BYTES: int = 1024  # Smaller payloads are stored uncompressed
+    RESULT_COMPRESSION_LEVEL: int = 6  # zstd, or zlib (capped at 9)
+    # Results older than this are moved from Redis to the API's SQLite archive
+    RESULTS_ARCHIVE_PATH: str = "data/results_archive.sqlite3"
+    RESULTS_ARCHIVE_AFTER_SECONDS: int = 60 * 60
+    RESULTS_ARCHIVE_INTERVAL_SECONDS: float = 600.0  # 0 disables archiving
+    RESULTS_ARCHIVE_BATCH_SIZE: int = 500
+    RESULTS_ARCHIVE_RETENTION_SECONDS: int = 30 * 24 * 60 * 60  # Archived results are deleted after this; 0 keeps them
+
+    # PRs above either limit are routed to the large-PR queue
+    SMALL_PR_MAX_CHANGED_LINES: int = 500
+    SMALL_PR_MAX_FILES: int = 20
+
+    # Upper bound on how long a deduplicated (single-flight) analysis holds its lock
+    SINGLE_FLIGHT_TTL_SECONDS: int = 60 * 60
+
+    # Seconds between keep-alive comments on idle task event streams
+    TASK_EVENTS_KEEPALIVE_SECONDS: float = 15.0
+
+    # Analyzer settings
+    ANALYZER_MAX_CONCURRENCY: int = 8  # Parallel LLM calls per review
+    ANALYZER_MAX_CHUNK_CHARS: int = 60_000  # Larger file diffs are split by hunk
+    ANALYZER_CONTEXT_LINES: int = 3  # Unchanged lines kept around each change
+    ANALYZER_PROMPT_TOKEN_BUDGET: int = 8_000  # Small files are packed into prompts up to this size
+
+    # Local pre-checks run before the LLM
+    PRECHECK_MAX_LINE_LENGTH: int = 120
+    PRECHECK_PROCESSES: int = 2
+    PRECHECK_POOL_MIN_FILES: int = 50  # Smaller diffs are checked in-process
+
+    # LLM rate limits, shared by all workers (per model)
+    LLM_REQUESTS_PER_MINUTE: int = 60
+    LLM_TOKENS_PER_MINUTE: int = 1_000_000
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0  # Longer waits put the task back on the queue
+    LLM_MIN_RATE_MULTIPLIER: float = 0.1  # Lower bound of the adaptive rate after throttling
+    LLM_RATE_INCREASE_STEP: float = 0.01  # Rate recovered per successful call
+    LLM_THROTTLE_COOLDOWN_SECONDS: float = 5.0  # Throttles within this window back off only once
+    LLM_MAX_RETRIES: int = 8  # Task retries while rate-limited
+
+    # Worker execution model: "prefork" runs one analysis per process; "async" runs
+    # up to ASYNC_WORKER_CONCURRENCY analyses on threads of one process, with their
+    # LLM calls multiplexed on a single event loop
+    WORKER_MODE: str = "prefork"
+    ASYNC_WORKER_CONCURRENCY: int = 32
+
+    # Fair scheduling of analyses across tenants (token or repository owner)
+    FAIR_SCHEDULING: bool = False
+    FAIR_MAX_DISPATCHED: int = 16  # Tasks handed to Celery at once; about the total worker concurrency
+    FAIR_DISPATCH_INTERVAL_SECONDS: float = 1.0
+    FAIR_RUNNING_TTL_SECONDS: int = 60 * 60  # Slots of tasks not reported finished by then are freed
+    TENANT_MAX_CONCURRENCY: int = 4  # Running analyses per tenant
+    TENANT_MAX_PENDING: int = 1000  # Queued analyses per tenant; more are rejected
+    TENANT_WEIGHTS: Dict[str, float] = {}  # Share of capacity by tenant, e.g. {"owner:acme": 2}; default 1
+
+    # Port on which each Celery worker serves its Prometheus metrics (0 disables it)
+    WORKER_METRICS_PORT: int = 9100
+
     # Pydantic settings configuration
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
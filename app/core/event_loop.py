@@ -0,0 +1,54 @@
+"""
+Process-wide asyncio event loop of a worker in async mode.
+
+With WORKER_MODE=async, Celery runs tasks on a pool of threads (see
+app.core.celery_app) and the tasks hand their LLM calls to a single event loop
+running in a background thread, so one process multiplexes the I/O of dozens
+of in-flight reviews instead of dedicating a process, and a thread per call,
+to each of them.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Returns the process's event loop, starting its thread on first use (and again after a fork)."""
+    global _loop, _loop_pid
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            threading.Thread(target=_loop.run_forever, name="worker-event-loop", daemon=True).start()
+            logger.info("Started the worker event loop.")
+        return _loop
+
+
+async def _run_in_context(coro: Coroutine[Any, Any, T], context: contextvars.Context) -> T:
+    return await asyncio.get_running_loop().create_task(coro, context=context)
+
+
+def submit(coro: Coroutine[Any, Any, T]) -> "concurrent.futures.Future[T]":
+    """
+    Schedules a coroutine on the event loop and returns a future for its result.
+    The coroutine runs in a copy of the caller's context, so its spans join the
+    caller's trace. Cancelling the future cancels the coroutine.
+    """
+    return asyncio.run_coroutine_threadsafe(_run_in_context(coro, contextvars.copy_context()), get_loop())
+
+
+def run(coro: Coroutine[Any, Any, T]) -> T:
+    """Runs a coroutine on the event loop and waits for its result."""
+    return submit(coro).result()
@@ -0,0 +1,114 @@
+"""
+Prometheus metrics and tracing spans for the review pipeline.
+
+Every stage of a review (queue wait, diff fetch, parsing, pre-checks, LLM
+calls, validation, ...) is timed into one histogram labelled by stage, and
+wrapped in an OpenTelemetry span so a trace shows where a slow review spent
+its time. Spans are no-ops unless an OpenTelemetry SDK is configured.
+
+The API serves the metrics on /metrics and workers on WORKER_METRICS_PORT.
+Processes forked by Celery's prefork pool (or several uvicorn workers) must
+share a PROMETHEUS_MULTIPROC_DIR so the exporter sees all of their samples.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Multiprocess mode writes samples to files in this directory as soon as metrics
+# are created, so it must exist before prometheus_client is imported.
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from opentelemetry import trace
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+from app.core.config import settings
+
+tracer = trace.get_tracer("acra")
+
+# From a few milliseconds (cache lookups, parsing) to minutes (LLM reviews of large PRs)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "acra_stage_duration_seconds",
+    "Time spent in each stage of the review pipeline.",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+DIFF_SIZE_BYTES = Histogram(
+    "acra_diff_size_bytes",
+    "Size of the fetched PR diffs.",
+    buckets=(1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000),
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "acra_llm_request_duration_seconds",
+    "Latency of LLM calls.",
+    ["model"],
+    buckets=DURATION_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "acra_llm_tokens",
+    "Tokens per LLM call.",
+    ["model", "direction"],
+    buckets=(100, 500, 1_000, 2_000, 4_000, 8_000, 16_000, 32_000, 64_000),
+)
+CACHE_LOOKUPS = Counter(
+    "acra_cache_lookups_total",
+    "Cache lookups by cache and outcome (hit or miss).",
+    ["cache", "result"],
+)
+# Tenants without a configured weight share this label, so the number of series
+# stays bounded however many tokens and owners submit analyses
+OTHER_TENANT = "other"
+
+TENANT_QUEUE_WAIT_SECONDS = Histogram(
+    "acra_tenant_queue_wait_seconds",
+    "Time from submission to the start of a fairly scheduled analysis, by tenant.",
+    ["tenant"],
+    buckets=DURATION_BUCKETS,
+)
+TASKS = Counter(
+    "acra_tasks_total",
+    "Finished analysis task runs by final state.",
+    ["state"],
+)
+
+
+def tenant_label(tenant: str) -> str:
+    """Returns the metrics label of a tenant: itself if it is in TENANT_WEIGHTS, otherwise "other"."""
+    return tenant if tenant in settings.TENANT_WEIGHTS else OTHER_TENANT
+
+
+@contextmanager
+def time_stage(stage: str, **attributes) -> Iterator[None]:
+    """Times a pipeline stage into STAGE_SECONDS, inside a span of the same name."""
+    with tracer.start_as_current_span(stage, attributes=attributes):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def get_registry() -> CollectorRegistry:
+    """Returns the registry to export: all processes' samples in multiprocess mode, this process's otherwise."""
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> bytes:
+    """Renders the metrics in the Prometheus text format."""
+    return generate_latest(get_registry())
+
+
+def start_metrics_server(port: int) -> None:
+    """Serves the metrics over HTTP from a background thread (used by workers)."""
+    start_http_server(port, registry=get_registry())
+
@@ -0,0 +1,27 @@
+"""
+Shared Redis client used for application data (caches, locks, counters).
+"""
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+
+from app.core.config import settings
+
+
+@lru_cache(maxsize=1)
+def get_redis() -> redis.Redis:
+    """
+    Returns a process-wide Redis client. The client owns a connection pool,
+    so it is safe to share between threads and across tasks in a worker.
+    """
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+@lru_cache(maxsize=1)
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Returns a process-wide asyncio Redis client for use on the API's event loop,
+    so request handlers never block on Redis I/O.
+    """
+    return redis.asyncio.Redis.from_url(settings.REDIS_URL)
@@ -0,0 +1,93 @@
+"""
+Trace context propagation and queue/run timing for Celery tasks.
+
+When a task is published, the current trace context (e.g. the span of the
+`analyze_pr` request) and the publish time are added to the message headers.
+When a worker runs the task, it continues that trace and records how long the
+task waited in the queue (and, for fairly scheduled tasks, since submission,
+by tenant), how long it ran, and how it ended.
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from celery.signals import before_task_publish, task_prerun, task_postrun
+from opentelemetry import context, propagate, trace
+from opentelemetry.propagators.textmap import Getter
+
+from app.core.metrics import STAGE_SECONDS, TASKS, TENANT_QUEUE_WAIT_SECONDS, tenant_label, tracer
+
+# Header holding the (epoch) time a task was published
+PUBLISHED_AT_HEADER = "published_at"
+
+# Headers of fairly scheduled tasks (see app.services.fair_scheduler)
+TENANT_HEADER = "tenant"
+SUBMITTED_AT_HEADER = "submitted_at"
+
+# Span, context token and start time of each running task
+_running: Dict[str, Tuple[trace.Span, object, float]] = {}
+
+
+class _RequestGetter(Getter):
+    """Reads propagation fields from a task request, which exposes message headers as attributes."""
+
+    def get(self, carrier: Any, key: str) -> Optional[list]:
+        value = getattr(carrier, key, None)
+        return [value] if value is not None else None
+
+    def keys(self, carrier: Any) -> list:
+        return []
+
+
+def queue_wait_seconds(request: Any, now: float) -> Optional[float]:
+    """
+    Returns how long a task waited to be picked up. Tasks scheduled with a
+    countdown (webhook debounce, rate-limit retries) are counted from their ETA.
+    """
+    published_at = getattr(request, PUBLISHED_AT_HEADER, None)
+    if published_at is None:
+        return None
+    ready_at = float(published_at)
+    eta = getattr(request, "eta", None)
+    if eta:
+        ready_at = max(ready_at, datetime.fromisoformat(eta).timestamp())
+    return max(0.0, now - ready_at)
+
+
+@before_task_publish.connect
+def inject_trace_context(headers: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+    if headers is None:
+        return
+    propagate.inject(headers)
+    headers[PUBLISHED_AT_HEADER] = time.time()
+
+
+@task_prerun.connect
+def start_task_span(task_id: str = None, task: Any = None, **kwargs) -> None:
+    now = time.time()
+    wait = queue_wait_seconds(task.request, now)
+    if wait is not None:
+        STAGE_SECONDS.labels(stage="queue_wait").observe(wait)
+    tenant = getattr(task.request, TENANT_HEADER, None)
+    submitted_at = getattr(task.request, SUBMITTED_AT_HEADER, None)
+    if tenant is not None and submitted_at is not None:
+        # Includes the wait for the tenant's turn before the task was published
+        TENANT_QUEUE_WAIT_SECONDS.labels(tenant=tenant_label(tenant)).observe(max(0.0, now - float(submitted_at)))
+
+    parent = propagate.extract(task.request, getter=_RequestGetter())
+    span = tracer.start_span(task.name, context=parent, kind=trace.SpanKind.CONSUMER)
+    token = context.attach(trace.set_span_in_context(span, parent))
+    _running[task_id] = (span, token, time.perf_counter())
+
+
+@task_postrun.connect
+def end_task_span(task_id: str = None, state: Optional[str] = None, **kwargs) -> None:
+    running = _running.pop(task_id, None)
+    if running is None:
+        return
+    span, token, start = running
+    STAGE_SECONDS.labels(stage="total").observe(time.perf_counter() - start)
+    TASKS.labels(state=state or "UNKNOWN").inc()
+    span.set_attribute("celery.state", state or "UNKNOWN")
+    span.end()
+    context.detach(token)
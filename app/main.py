@@ -1,6 +1,7 @@
 from fastapi import FastAPI
-from .routes import analysis
+from .routes import analysis, metrics, webhooks
 from .core.logging import setup_logging
+from .services.lifespan import api_lifespan
 
 # Set up logging as soon as the application starts
 setup_logging()
@@ -9,10 +10,15 @@ app = FastAPI(
     title="Autonomous Code Review Agent API",
     description="An API for an AI-powered code review agent that analyzes GitHub pull requests.",
     version="0.1.0",
+    # Archives old results and dispatches fairly scheduled analyses in the background
+    lifespan=api_lifespan,
 )
 
 # Include the API router
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
+app.include_router(webhooks.router, prefix="/api/v1", tags=["webhooks"])
+# Prometheus scrape endpoint
+app.include_router(metrics.router, tags=["metrics"])
 
 @app.get("/", tags=["root"])
 async def read_root():
@@ -17,6 +17,12 @@ class TaskStatusResponse(BaseModel):
     status: str
     detail: Optional[str] = None
 
+class TaskStatusBatchRequest(BaseModel):
+    """
+    Request model for the batch status endpoint.
+    """
+    task_ids: List[str] = Field(..., max_length=1000, example=["a1b2c3d4-...", "e5f6a7b8-..."])
+
 # --- Nested Models for the Result ---
 
 class Issue(BaseModel):
@@ -43,12 +49,34 @@ class AnalysisSummary(BaseModel):
     total_issues: int = Field(..., example=10)
     critical_issues: int = Field(..., example=2)
 
+class TokenUsage(BaseModel):
+    """
+    LLM token usage of an analysis.
+    """
+    input_tokens: int = Field(0, example=5400)
+    output_tokens: int = Field(0, example=820)
+    llm_calls: int = Field(0, example=3)
+
 class AnalysisResultData(BaseModel):
     """
     The main data structure for the analysis results.
     """
     files: List[FileAnalysis]
     summary: AnalysisSummary
+    usage: Optional[TokenUsage] = None
+
+    @classmethod
+    def from_files(cls, files: List[FileAnalysis], usage: Optional[TokenUsage] = None) -> "AnalysisResultData":
+        """Builds a result from per-file analyses, computing the summary."""
+        summary = AnalysisSummary(
+            total_files=len(files),
+            total_issues=sum(len(file.issues) for file in files),
+            critical_issues=sum(
+                1 for file in files
+                for issue in file.issues if issue.type.lower() == 'bug'
+            ),
+        )
+        return cls(files=files, summary=summary, usage=usage)
 
 class TaskResultResponse(BaseModel):
     """
@@ -58,3 +86,54 @@ class TaskResultResponse(BaseModel):
     status: str
     results: AnalysisResultData
 
+
+class CacheStatsResponse(BaseModel):
+    """
+    Response model for the review cache statistics endpoint.
+    """
+    hits: int = Field(..., example=120)
+    misses: int = Field(..., example=40)
+    entries: int = Field(..., example=35)
+    hit_rate: float = Field(..., example=0.75)
+
+
+class WebhookResponse(BaseModel):
+    """
+    Response model for the GitHub webhook endpoint.
+    """
+    message: str = Field(..., example="Review scheduled.")
+    task_id: Optional[str] = Field(None, example="a1b2c3d4-e5f6-7890-1234-567890abcdef")
+
+
+class BulkAnalysisRequest(BaseModel):
+    """
+    Request model for the /analyze-bulk endpoint. Every open, non-draft PR of the
+    repositories is analyzed, optionally narrowed down by base branch, labels or numbers.
+    """
+    repo_urls: List[HttpUrl] = Field(..., min_length=1, max_length=20, example=["https://github.com/user/repo"])
+    base: Optional[str] = Field(None, example="main")
+    labels: Optional[List[str]] = Field(None, example=["needs-review"])
+    pr_numbers: Optional[List[int]] = Field(None, example=[12, 15])
+    github_token: Optional[str] = Field(None, example="ghp_...")
+
+class BulkTaskStatus(BaseModel):
+    """
+    Status of one PR's analysis within a bulk run.
+    """
+    task_id: str
+    repo_url: str
+    pr_number: int
+    status: str
+
+class BulkAnalysisResponse(BaseModel):
+    """
+    Response model for the bulk analysis endpoints.
+    """
+    bulk_id: str
+    status: str = Field(..., example="PROCESSING")
+    total: int = Field(..., example=40)
+    completed: int = Field(..., example=25)
+    failed: int = Field(..., example=1)
+    revoked: int = Field(0, example=2)  # Superseded by a newer push, not failed
+    summary: AnalysisSummary
+    tasks: List[BulkTaskStatus]
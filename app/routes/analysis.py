@@ -1,48 +1,241 @@
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException, status, Body
-from celery.result import AsyncResult
-from typing import Dict, Any
+import uuid
+from typing import Dict, List
+from fastapi import APIRouter, HTTPException, Response, status, Body
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from celery import group
 
-from ..models.analysis import PRAnalysisRequest, TaskStatusResponse, TaskResultResponse
 from ..core.celery_app import celery_app
-from app.services.tasks import run_code_analysis_task
+from ..core.config import settings
+from ..core.metrics import tracer
+from ..models.analysis import (
+    PRAnalysisRequest, TaskStatusResponse, TaskStatusBatchRequest, TaskResultResponse, CacheStatsResponse,
+    BulkAnalysisRequest, BulkAnalysisResponse
+)
+from app.services.github_helper import get_pr_metadata, list_open_prs, GitHubConnectionError, GitHubRateLimitError
+from app.services import fair_scheduler
+from app.services.fair_scheduler import TenantQuotaExceeded, make_entry, tenant_for
+from app.services.bulk_analysis import select_prs, save_bulk, load_bulk, summarize_bulk
+from app.services.review_cache import get_cache_stats
+from app.services.task_routing import route_for_pr, ANALYSIS_TASK, QUEUE_LARGE, PRIORITY_LARGE
+from app.services.single_flight import make_flight_key, claim_flight, arelease_flight
+from app.services.result_store import results_store
+from app.services.task_events import stream_task_events, format_sse
+from app.services.task_meta import get_task_meta, get_task_metas, describe_task_status, READY_STATES
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# In-memory cache for completed task results. For production, use a distributed cache like Redis.
-results_cache: Dict[str, Any] = {}
+# Completed task results, pre-serialized: a bounded in-process LRU in front of Redis.
+results_cache = results_store
 
 @router.post("/analyze-pr", status_code=status.HTTP_202_ACCEPTED, response_model=TaskStatusResponse)
 async def analyze_pr(request: PRAnalysisRequest = Body(...)):
-    """Accepts GitHub PR details and queues the analysis."""
-    logger.info(f"Received analysis request for {request.repo_url} PR #{request.pr_number}")
-    task = run_code_analysis_task.delay(str(request.repo_url), request.pr_number, request.github_token)
-    logger.info(f"Task {task.id} queued for analysis.")
-    return {"task_id": task.id, "status": "PENDING"}
+    """
+    Accepts GitHub PR details and queues the analysis. Concurrent requests for
+    the same PR at the same head commit share a single task.
+    """
+    # The task continues this span's trace (see app.core.tracing)
+    with tracer.start_as_current_span("analyze_pr", attributes={"pr.number": request.pr_number}):
+        return await _queue_analysis(request)
+
+
+async def _queue_analysis(request: PRAnalysisRequest) -> dict:
+    repo_url = str(request.repo_url)
+    logger.info(f"Received analysis request for {repo_url} PR #{request.pr_number}")
+
+    # The metadata gives the head SHA, which identifies what would be reviewed, and
+    # the PR size used for queue routing. If it cannot be fetched, the request is
+    # queued without deduplication and the task reports the error. The request never
+    # waits out GitHub's rate limit; the worker does.
+    pr = None
+    flight_key = None
+    try:
+        pr = await run_in_threadpool(get_pr_metadata, repo_url, request.pr_number, request.github_token, wait=False)
+        flight_key = make_flight_key(repo_url, request.pr_number, pr["head"]["sha"])
+    except GitHubConnectionError as e:
+        logger.warning(f"Could not fetch PR metadata, skipping deduplication: {e}")
+
+    route = route_for_pr(pr)
+    task_id = str(uuid.uuid4())
+    if flight_key is not None:
+        existing_task_id = await claim_flight(flight_key, task_id)
+        if existing_task_id is not None:
+            logger.info(f"Identical analysis already in flight as task {existing_task_id}.")
+            return {"task_id": existing_task_id, "status": "PENDING"}
+
+    args = [repo_url, request.pr_number, request.github_token]
+    kwargs = {"flight_key": flight_key}
+    try:
+        if settings.FAIR_SCHEDULING:
+            # Waits for its tenant's turn before it reaches the Celery queue
+            tenant = tenant_for(repo_url, request.github_token)
+            await fair_scheduler.submit(tenant, [make_entry(task_id, args, kwargs, **route)])
+        else:
+            # Publishing is blocking I/O
+            await run_in_threadpool(
+                celery_app.send_task,
+                ANALYSIS_TASK,
+                args=args,
+                kwargs=kwargs,
+                task_id=task_id,
+                # Route by PR size so small PRs never wait behind large ones
+                **route,
+            )
+    except TenantQuotaExceeded as e:
+        if flight_key is not None:
+            await arelease_flight(flight_key, task_id)
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    except Exception:
+        if flight_key is not None:
+            await arelease_flight(flight_key, task_id)
+        raise
+    if settings.FAIR_SCHEDULING:
+        await _dispatch()
+    logger.info(f"Task {task_id} queued for analysis on {route['queue']}.")
+    return {"task_id": task_id, "status": "PENDING"}
+
+
+async def _dispatch() -> None:
+    """Starts newly submitted tasks right away if capacity allows; else the background dispatcher will."""
+    try:
+        await fair_scheduler.dispatch_pending()
+    except Exception as e:
+        logger.warning(f"Dispatching pending analyses failed, leaving them to the dispatcher: {e}")
+
+
+@router.post("/analyze-bulk", status_code=status.HTTP_202_ACCEPTED, response_model=BulkAnalysisResponse)
+async def analyze_bulk(request: BulkAnalysisRequest = Body(...)):
+    """
+    Queues the analysis of every open PR of one or more repositories matching
+    the filters, and returns a bulk ID tracking all of them. PRs already being
+    analyzed at the same head commit reuse the task in flight.
+    """
+    with tracer.start_as_current_span("analyze_bulk"):
+        return await _queue_bulk_analysis(request)
+
+
+async def _queue_bulk_analysis(request: BulkAnalysisRequest) -> dict:
+    repo_urls = [str(repo_url) for repo_url in request.repo_urls]
+    logger.info(f"Received bulk analysis request for {len(repo_urls)} repository(ies)")
+
+    try:
+        listings = await asyncio.gather(*(
+            run_in_threadpool(list_open_prs, repo_url, request.github_token, request.base, wait=False)
+            for repo_url in repo_urls
+        ))
+    except GitHubRateLimitError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after) + 1)},
+        )
+    except GitHubConnectionError as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=str(e))
+
+    tasks = []
+    entries_by_tenant: Dict[str, List[dict]] = {}
+    claimed = []
+    for repo_url, prs in zip(repo_urls, listings):
+        for pr in select_prs(prs, request.pr_numbers, request.labels):
+            head_sha = pr["head"]["sha"]
+            task_id = str(uuid.uuid4())
+            flight_key = make_flight_key(repo_url, pr["number"], head_sha)
+            existing_task_id = await claim_flight(flight_key, task_id)
+            if existing_task_id is not None:
+                task_id = existing_task_id
+            else:
+                claimed.append((flight_key, task_id))
+                # Bulk runs are background work: keep them off the queue of interactive reviews
+                entries_by_tenant.setdefault(tenant_for(repo_url, request.github_token), []).append(make_entry(
+                    task_id,
+                    [repo_url, pr["number"], request.github_token],
+                    {"flight_key": flight_key, "head_sha": head_sha},
+                    queue=QUEUE_LARGE, priority=PRIORITY_LARGE,
+                ))
+            tasks.append({"task_id": task_id, "repo_url": repo_url, "pr_number": pr["number"], "head_sha": head_sha})
+
+    bulk_id = str(uuid.uuid4())
+    await save_bulk(bulk_id, tasks)
+    entries = [entry for tenant_entries in entries_by_tenant.values() for entry in tenant_entries]
+    if settings.FAIR_SCHEDULING:
+        submitted = set()
+        try:
+            for tenant, tenant_entries in entries_by_tenant.items():
+                await fair_scheduler.submit(tenant, tenant_entries)
+                submitted.update(entry["task_id"] for entry in tenant_entries)
+        except Exception as e:
+            # Tasks already submitted keep their flights, so a resubmitted bulk reuses them
+            for flight_key, task_id in claimed:
+                if task_id not in submitted:
+                    await arelease_flight(flight_key, task_id)
+            if isinstance(e, TenantQuotaExceeded):
+                raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+            raise
+        await _dispatch()
+    elif entries:
+        signatures = [
+            celery_app.signature(
+                ANALYSIS_TASK, args=entry["args"], kwargs=entry["kwargs"],
+            ).set(task_id=entry["task_id"], queue=entry["queue"], priority=entry["priority"])
+            for entry in entries
+        ]
+        try:
+            await run_in_threadpool(group(signatures).apply_async, task_id=bulk_id)
+        except Exception:
+            for flight_key, task_id in claimed:
+                await arelease_flight(flight_key, task_id)
+            raise
+    logger.info(f"Bulk analysis {bulk_id} queued {len(entries)} of {len(tasks)} PR(s).")
+    return await summarize_bulk(bulk_id, tasks)
+
+
+@router.get("/bulk/{bulk_id}", response_model=BulkAnalysisResponse)
+async def get_bulk_status(bulk_id: str):
+    """Reports the progress of a bulk analysis and the combined summary of its completed reviews."""
+    tasks = await load_bulk(bulk_id)
+    if tasks is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Bulk analysis {bulk_id} not found.")
+    return await summarize_bulk(bulk_id, tasks)
 
 
 @router.get("/status/{task_id}", response_model=TaskStatusResponse)
 async def get_task_status(task_id: str):
     """Checks the status of an analysis task."""
     logger.info(f"Checking status for task {task_id}")
-    task_result = AsyncResult(task_id, app=celery_app)
-    task_status = task_result.state
-    detail = None
-
-    if task_status == 'PROCESSING':
-        detail = task_result.info.get('status', 'The task is currently being processed.')
-    elif task_status == 'FAILURE':
-        # Safely access error information
-        result = task_result.result
-        if isinstance(result, Exception):
-            detail = f"Task failed with an error: {result}"
-        else:
-            detail = "Task failed with an unknown error."
-        logger.error(f"Task {task_id} failed: {detail}")
+    response_data = describe_task_status(task_id, await get_task_meta(task_id))
+    if response_data["status"] == 'FAILURE':
+        logger.error(f"Task {task_id} failed: {response_data['detail']}")
+    return response_data
+
+
+@router.post("/status/batch", response_model=List[TaskStatusResponse])
+async def get_task_statuses(request: TaskStatusBatchRequest = Body(...)):
+    """Checks the status of many analysis tasks in one pipelined Redis round-trip."""
+    metas = await get_task_metas(request.task_ids)
+    return [describe_task_status(task_id, meta) for task_id, meta in zip(request.task_ids, metas)]
 
-    return {"task_id": task_id, "status": task_status, "detail": detail}
+
+@router.get("/stream/{task_id}")
+async def stream_task(task_id: str):
+    """
+    Streams a task's progress as Server-Sent Events: `status` on every state
+    change, `partial` with per-file findings as they finish, and a final
+    `result` (or `failure`) event, after which the stream ends.
+    """
+    logger.info(f"Streaming events for task {task_id}")
+
+    async def event_stream():
+        async for event in stream_task_events(task_id):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/results/{task_id}", response_model=TaskResultResponse)
@@ -50,35 +243,46 @@ async def get_task_results(task_id: str):
     """Retrieves the results of a completed analysis task."""
     logger.info(f"Fetching results for task {task_id}")
 
-    # Check our in-memory cache first
-    if task_id in results_cache:
+    # Check the result store first; payloads are already serialized, so return them as-is
+    cached_payload = await results_cache.aget(task_id)
+    if cached_payload is not None:
         logger.info(f"Returning cached result for task {task_id}")
-        return results_cache[task_id]
+        return Response(content=cached_payload, media_type="application/json")
 
-    # If not in cache, check with the Celery backend
-    task_result = AsyncResult(task_id, app=celery_app)
+    # If not in cache, read the task's metadata from the Celery result backend
+    meta = await get_task_meta(task_id)
+    task_status = meta["status"]
 
-    if not task_result.ready():
+    if task_status not in READY_STATES:
         raise HTTPException(
             status_code=status.HTTP_202_ACCEPTED,
-            detail=f"Task is not complete. Current status: {task_result.state}"
+            detail=f"Task is not complete. Current status: {task_status}"
         )
 
-    if task_result.failed():
+    if task_status != "SUCCESS":
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Task failed. Use the status endpoint for more details."
         )
 
-    # Task succeeded, prepare the response
-    response_data = {
-        "task_id": task_id,
-        "status": "COMPLETED",
-        "results": task_result.get()
-    }
-    
+    # Task succeeded, prepare the response. It is validated once here and
+    # stored serialized, so later reads skip validation entirely.
+    response_data = TaskResultResponse(
+        task_id=task_id,
+        status="COMPLETED",
+        results=meta["result"]
+    )
+    # Results from before token usage was reported have no "usage" key.
+    payload = response_data.model_dump_json(exclude_none=True).encode("utf-8")
+
     # Store the successful result in the cache
-    results_cache[task_id] = response_data
+    await results_cache.aset(task_id, payload)
     logger.info(f"Result for task {task_id} cached.")
 
-    return response_data
+    return Response(content=payload, media_type="application/json")
+
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+def get_review_cache_stats():
+    """Reports review cache hits and misses, i.e. how many LLM calls were avoided."""
+    return get_cache_stats()
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE_LATEST, render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Exposes the API's metrics in the Prometheus text format."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,111 @@
+import json
+import logging
+import uuid
+from typing import Optional, Tuple
+from fastapi import APIRouter, HTTPException, Header, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from ..core.config import settings
+from ..core.celery_app import celery_app
+from ..models.analysis import WebhookResponse
+from app.services.task_routing import route_for_pr, ANALYSIS_TASK
+from app.services.github_webhooks import REVIEW_ACTIONS, verify_signature, set_latest_head, mark_pr_closed
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def _revoke(task_id: Optional[str]) -> None:
+    """Revokes a scheduled review. Workers drop it when its countdown ends."""
+    if task_id:
+        # Broadcasting over the broker is blocking I/O
+        await run_in_threadpool(celery_app.control.revoke, task_id)
+        logger.info(f"Revoked superseded task {task_id}.")
+
+
+def _parse_pull_request_event(request: Request, body: bytes) -> Tuple[Optional[str], dict, str]:
+    """
+    Returns the action, pull request and repository URL of a `pull_request` delivery.
+    Raises a 400 for deliveries that are not JSON (webhooks must be configured
+    with the application/json content type) or lack those fields, so GitHub
+    records a client error instead of redelivering them.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "application/json":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported content type '{content_type}'; configure the webhook with application/json.",
+        )
+    try:
+        payload = json.loads(body)
+        pr = payload["pull_request"]
+        if not isinstance(pr["number"], int) or not isinstance(pr["head"]["sha"], str):
+            raise ValueError("invalid pull request number or head SHA")
+        return payload.get("action"), pr, payload["repository"]["html_url"]
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Rejected a malformed pull_request delivery: {e!r}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed pull_request payload.")
+
+
+@router.post("/webhooks/github", status_code=status.HTTP_202_ACCEPTED, response_model=WebhookResponse)
+async def github_webhook(
+    request: Request,
+    x_github_event: Optional[str] = Header(None),
+    x_hub_signature_256: Optional[str] = Header(None),
+):
+    """
+    Receives GitHub `pull_request` webhooks. Reviews are scheduled after a
+    debounce window; a push within the window replaces the scheduled review,
+    so only the latest head of a burst of pushes is reviewed.
+    """
+    if not settings.GITHUB_WEBHOOK_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="GitHub webhooks are not configured."
+        )
+    body = await request.body()
+    if not verify_signature(settings.GITHUB_WEBHOOK_SECRET, body, x_hub_signature_256):
+        logger.warning("Rejected a webhook delivery with an invalid signature.")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid webhook signature.")
+
+    if x_github_event == "ping":
+        return {"message": "pong"}
+    if x_github_event != "pull_request":
+        return {"message": f"Ignored '{x_github_event}' event."}
+
+    action, pr, repo_url = _parse_pull_request_event(request, body)
+    pr_number = pr["number"]
+
+    if action == "closed":
+        _, scheduled_task_id = await mark_pr_closed(repo_url, pr_number)
+        await _revoke(scheduled_task_id)
+        return {"message": "PR closed; scheduled review cancelled."}
+    if action not in REVIEW_ACTIONS or pr.get("draft"):
+        return {"message": f"Ignored '{action}' action."}
+
+    head_sha = pr["head"]["sha"]
+    task_id = str(uuid.uuid4())
+    previous_head, previous_task_id = await set_latest_head(repo_url, pr_number, head_sha, task_id)
+    if previous_head == head_sha:
+        # Redelivery, or several events for the same push
+        return {"message": "Review already scheduled.", "task_id": previous_task_id}
+    await _revoke(previous_task_id)
+
+    # Not fair-scheduled: the review is already debounced per PR, and waiting in
+    # a tenant's pending list would lose its countdown.
+    route = route_for_pr(pr)
+    await run_in_threadpool(
+        celery_app.send_task,
+        ANALYSIS_TASK,
+        args=[repo_url, pr_number],
+        kwargs={"head_sha": head_sha},
+        task_id=task_id,
+        countdown=settings.WEBHOOK_DEBOUNCE_SECONDS,
+        **route,
+    )
+    logger.info(
+        f"Review of {repo_url} PR #{pr_number} at {head_sha[:7]} scheduled as task {task_id} "
+        f"on {route['queue']} in {settings.WEBHOOK_DEBOUNCE_SECONDS}s."
+    )
+    return {"message": "Review scheduled.", "task_id": task_id}
@@ -1,53 +1,78 @@
-import os
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from google.api_core import exceptions as google_exceptions
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+from ..core import event_loop
 from ..core.config import settings
+from ..core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS, time_stage, tracer
+from ..models.analysis import AnalysisResultData, FileAnalysis, Issue, TokenUsage
+from .diff_parser import FileDiff, parse_diff, chunk_diff
+from .hunk_cache import lookup_hunks, store_hunk_findings
+from .prechecks import registered_checks, run_prechecks
+from .prompt_packer import (
+    LIGHT_EXTENSIONS, LIGHT_FILENAMES, TIER_RULES, TIER_LIGHT, TIER_FULL,
+    classify_file, trim_context, pack_chunks, estimate_tokens,
+)
+from . import rate_limiter
 
-class Issue(BaseModel):
+logger = logging.getLogger(__name__)
+
+# Identify the model and prompt used for a review. Bump PROMPT_VERSION whenever the
+# prompt changes so cached reviews produced by the old prompt are not reused.
+MODEL_NAME = "gemini-2.5-flash"
+# Cheaper, faster model for docs and config changes
+LIGHT_MODEL_NAME = "gemini-2.5-flash-lite"
+TEMPERATURE = 0.1
+PROMPT_VERSION = "v3"
+
+# Output schema the model is constrained to. Only the findings are requested; the
+# summary is computed from them. Parsed outputs are converted to the canonical
+# result models of app.models.analysis without being validated a second time.
+class ReviewIssue(BaseModel):
     """Represents a single issue found in a file."""
     type: str = Field(..., description="The type of issue (e.g., 'bug', 'style', 'performance', 'best-practice').")
     line: int = Field(..., description="The line number where the issue occurs.")
     description: str = Field(..., description="A detailed description of the issue.")
     suggestion: str = Field(..., description="A concrete suggestion for how to fix the issue.")
 
-class FileAnalysis(BaseModel):
+class ReviewedFile(BaseModel):
     """Contains the analysis results for a single file."""
     name: str = Field(..., description="The full path of the file being analyzed.")
-    issues: List[Issue] = Field(..., description="A list of issues found in the file.")
-
-class AnalysisSummary(BaseModel):
-    """A high-level summary of the analysis results."""
-    total_files: int = Field(..., description="The total number of files analyzed.")
-    total_issues: int = Field(..., description="The total number of issues found across all files.")
-    critical_issues: int = Field(..., description="The number of issues classified as critical bugs.")
+    issues: List[ReviewIssue] = Field(..., description="A list of issues found in the file.")
 
-class AnalysisResultData(BaseModel):
-    """The main data structure for the analysis results, matching the required JSON output."""
-    files: List[FileAnalysis]
-    summary: AnalysisSummary
+class ReviewOutput(BaseModel):
+    """The issues found in the reviewed diff, by file."""
+    files: List[ReviewedFile]
 
-def analyze_code_with_langchain(pr_diff: str) -> str:
-    """
-    Analyzes a PR diff using a direct LangChain chain with Google Gemini
-    and returns a structured JSON string.
-    """
+def _build_chain(model: str = MODEL_NAME, temperature: float = TEMPERATURE):
+    """Builds the prompt | structured-output LLM chain used to review a diff."""
     llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0.1,
+        model=model,
+        temperature=temperature,
         google_api_key=settings.GOOGLE_API_KEY
     )
 
+    # Findings of the local pre-checks are reported separately, so the model skips them.
+    skipped_categories = ", ".join(check.category for check in registered_checks())
+
     # The prompt provides the LLM with a role and the task.
     prompt = ChatPromptTemplate.from_messages([
         (
             "system",
-            """You are an expert Senior Software Engineer with a meticulous eye for detail.
+            f"""You are an expert Senior Software Engineer with a meticulous eye for detail.
             Your task is to analyze a provided code diff and provide a structured analysis.
             Identify code style issues, potential bugs, performance improvements,
             and adherence to best practices. Your output must be a valid JSON object.
+            Do not report {skipped_categories}; these are checked separately.
             """
         ),
         (
@@ -62,41 +87,321 @@ def analyze_code_with_langchain(pr_diff: str) -> str:
         )
     ])
 
-    # Create a chain that forces the LLM to return a JSON object matching the AnalysisResultData model.
-    structured_llm = llm.with_structured_output(AnalysisResultData)
-    chain = prompt | structured_llm
+    # Create a chain that forces the LLM to return a JSON object matching the ReviewOutput model.
+    # The raw message is kept alongside the parsed result for its token usage.
+    structured_llm = llm.with_structured_output(ReviewOutput, include_raw=True)
+    return prompt | structured_llm
+
+
+# Chains are expensive to build (client setup, schema generation, new connections),
+# so each process builds one per (model, temperature, prompt version) and reuses it.
+def review_fingerprint() -> str:
+    """
+    Describes everything besides the diff that shapes a whole-PR review: the
+    models, the prompt, how files are tiered, trimmed and packed, and the
+    pre-checks. Cached reviews are keyed on it, so changing any of these does
+    not keep serving reviews produced under the old configuration.
+    """
+    return "\0".join(str(part) for part in (
+        MODEL_NAME, LIGHT_MODEL_NAME, TEMPERATURE, PROMPT_VERSION,
+        settings.ANALYZER_CONTEXT_LINES, settings.ANALYZER_MAX_CHUNK_CHARS, settings.ANALYZER_PROMPT_TOKEN_BUDGET,
+        sorted(LIGHT_EXTENSIONS), sorted(LIGHT_FILENAMES),
+        sorted(check.name for check in registered_checks()), settings.PRECHECK_MAX_LINE_LENGTH,
+    ))
+
 
-    # Invoke the chain with the PR diff.
-    result_object = chain.invoke({"pr_diff": pr_diff})
+_chains: Dict[Tuple[str, float, str], Any] = {}
+_chains_lock = threading.Lock()
 
+
+def get_chain(model: str = MODEL_NAME, temperature: float = TEMPERATURE):
+    """
+    Returns the process-wide review chain for a model and temperature, building
+    it on first use. The chain and its LLM client (with its connection pool)
+    are shared by every task and thread in the process.
+    """
+    key = (model, temperature, PROMPT_VERSION)
+    chain = _chains.get(key)
+    if chain is None:
+        with _chains_lock:
+            chain = _chains.get(key)
+            if chain is None:
+                logger.info(f"Building review chain for {model} (temperature={temperature}, prompt {PROMPT_VERSION}).")
+                chain = _chains[key] = _build_chain(model, temperature)
+    return chain
+
+
+def merge_results(results: List[AnalysisResultData]) -> AnalysisResultData:
+    """
+    Merges the per-chunk results into a single result. Chunks of the same file
+    (hunk groups of a large file) are combined, filtered issues are dropped and
+    the summary is recomputed from the merged files.
+    """
     FILTER_STRING = "Missing newline at the end of the file"
 
-    # Create a new list of files, filtering issues within each file
-    filtered_files = []
-    for file_analysis in result_object.files:
-        # Use a list comprehension to keep only the issues that DON'T match the filter string
-        filtered_issues = [
-            issue for issue in file_analysis.issues 
-            if FILTER_STRING not in issue.description
-        ]
-        
-        # If the file still has issues after filtering, add it to our new list
-        if filtered_issues:
-            file_analysis.issues = filtered_issues
-            filtered_files.append(file_analysis)
-
-    # Replace the original files list with the filtered one
-    result_object.files = filtered_files
-
-    # Recalculate the summary based on the filtered results
-    total_issues = sum(len(file.issues) for file in result_object.files)
-    critical_issues = sum(
-        1 for file in result_object.files 
-        for issue in file.issues if issue.type.lower() == 'bug'
+    issues_by_file: Dict[str, List[Issue]] = {}
+    for result in results:
+        for file_analysis in result.files:
+            # Keep only the issues that DON'T match the filter string
+            issues_by_file.setdefault(file_analysis.name, []).extend(
+                issue for issue in file_analysis.issues
+                if FILTER_STRING not in issue.description
+            )
+
+    # Files without any remaining issues are left out of the result
+    return AnalysisResultData.from_files([
+        FileAnalysis(name=name, issues=issues)
+        for name, issues in issues_by_file.items() if issues
+    ])
+
+
+def _to_result(output: ReviewOutput) -> AnalysisResultData:
+    """Converts a parsed (hence validated) model output to the canonical result models."""
+    return AnalysisResultData.from_files([
+        FileAnalysis.model_construct(name=file.name, issues=[
+            Issue.model_construct(
+                type=issue.type, line=issue.line, description=issue.description, suggestion=issue.suggestion
+            )
+            for issue in file.issues
+        ])
+        for file in output.files
+    ])
+
+
+def model_for_file(file_diff: FileDiff) -> Optional[str]:
+    """Returns the model a file diff is reviewed with, or None if it is handled by rules."""
+    tier = classify_file(file_diff)
+    if tier == TIER_RULES:
+        return None
+    return LIGHT_MODEL_NAME if tier == TIER_LIGHT else MODEL_NAME
+
+
+def plan_prompts(file_diffs: List[FileDiff]) -> List[Tuple[str, str]]:
+    """
+    Splits the file diffs of a PR into the (model, prompt diff) pairs to review.
+
+    Renames and mode changes are left out entirely, docs, config and deletions
+    go to the light model and other code to the main model. Context beyond
+    ANALYZER_CONTEXT_LINES is dropped, and small files of the same tier are
+    packed into shared prompts of up to ANALYZER_PROMPT_TOKEN_BUDGET tokens.
+    """
+    files_by_tier: Dict[str, list] = {TIER_FULL: [], TIER_LIGHT: []}
+    for file_diff in file_diffs:
+        tier = classify_file(file_diff)
+        if tier == TIER_RULES:
+            logger.debug(f"Skipping {file_diff.path}: no changed lines to review.")
+            continue
+        files_by_tier[tier].append(trim_context(file_diff, settings.ANALYZER_CONTEXT_LINES))
+
+    prompts: List[Tuple[str, str]] = []
+    for tier, model in ((TIER_FULL, MODEL_NAME), (TIER_LIGHT, LIGHT_MODEL_NAME)):
+        chunks = chunk_diff(files_by_tier[tier], settings.ANALYZER_MAX_CHUNK_CHARS)
+        prompts.extend(
+            (model, prompt) for prompt in pack_chunks(chunks, settings.ANALYZER_PROMPT_TOKEN_BUDGET)
+        )
+    return prompts
+
+
+# Provider errors that mean "slow down" rather than "this request is broken"
+THROTTLING_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable)
+
+
+@contextmanager
+def _llm_call(model: str) -> Iterator[None]:
+    """Times an LLM call."""
+    with tracer.start_as_current_span("llm", attributes={"llm.model": model}):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            LLM_REQUEST_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+
+
+def _throttled(model: str, error: Exception) -> rate_limiter.LLMRateLimitError:
+    """Provider throttling is raised as LLMRateLimitError, so the task is retried later."""
+    return rate_limiter.LLMRateLimitError(f"LLM provider throttled {model}: {error}")
+
+
+def _usage_metadata(output: Dict[str, Any]) -> Dict[str, int]:
+    return getattr(output.get("raw"), "usage_metadata", None) or {}
+
+
+def _used_tokens(output: Dict[str, Any]) -> Optional[int]:
+    """Tokens a call actually used, to settle with the rate limiter; None if the provider did not say."""
+    usage_metadata = _usage_metadata(output)
+    if not usage_metadata:
+        return None
+    return usage_metadata.get("input_tokens", 0) + usage_metadata.get("output_tokens", 0)
+
+
+def _review_output(model: str, output: Dict[str, Any]) -> Tuple[AnalysisResultData, Dict[str, int]]:
+    """Converts the output of a successful call and returns it with the call's token usage."""
+    if output.get("parsing_error") is not None or output.get("parsed") is None:
+        raise ValueError(f"The AI returned a malformed JSON response: {output.get('parsing_error')}")
+    usage_metadata = _usage_metadata(output)
+    usage = {
+        "input_tokens": usage_metadata.get("input_tokens", 0),
+        "output_tokens": usage_metadata.get("output_tokens", 0),
+        "llm_calls": 1,
+    }
+    if usage_metadata:
+        LLM_TOKENS.labels(model=model, direction="input").observe(usage["input_tokens"])
+        LLM_TOKENS.labels(model=model, direction="output").observe(usage["output_tokens"])
+    with time_stage("validate"):
+        return _to_result(output["parsed"]), usage
+
+
+def _review(model: str, pr_diff: str) -> Tuple[AnalysisResultData, Dict[str, int]]:
+    """
+    Reviews one prompt and returns its result with the token usage of the call.
+    The call is admitted by the shared rate limiter first; provider throttling
+    is raised as LLMRateLimitError so the task is retried later.
+    """
+    reserved_tokens = estimate_tokens(pr_diff)
+    with time_stage("rate_limit_wait"):
+        rate_limiter.acquire(model, reserved_tokens)
+    try:
+        with _llm_call(model):
+            output = get_chain(model).invoke({"pr_diff": pr_diff})
+    except THROTTLING_ERRORS as e:
+        rate_limiter.record_throttled(model)
+        raise _throttled(model, e) from e
+    rate_limiter.record_success(model)
+    used_tokens = _used_tokens(output)
+    if used_tokens is not None:
+        rate_limiter.settle(model, reserved_tokens, used_tokens)
+    return _review_output(model, output)
+
+
+async def _areview(model: str, pr_diff: str, limit: asyncio.Semaphore) -> Tuple[AnalysisResultData, Dict[str, int]]:
+    """
+    Like _review(), on the worker's event loop, with at most `limit` calls of
+    the review at once. The rate limiter is only used through its async
+    variants, so no call blocks the other reviews on the loop.
+    """
+    reserved_tokens = estimate_tokens(pr_diff)
+    async with limit:
+        with time_stage("rate_limit_wait"):
+            await rate_limiter.aacquire(model, reserved_tokens)
+        try:
+            with _llm_call(model):
+                # Built on the event loop, the chain's LLM client gets a native async transport
+                output = await get_chain(model).ainvoke({"pr_diff": pr_diff})
+        except THROTTLING_ERRORS as e:
+            await rate_limiter.arecord_throttled(model)
+            raise _throttled(model, e) from e
+    await rate_limiter.arecord_success(model)
+    used_tokens = _used_tokens(output)
+    if used_tokens is not None:
+        await rate_limiter.asettle(model, reserved_tokens, used_tokens)
+    return _review_output(model, output)
+
+
+@contextmanager
+def _review_pool(max_workers: int) -> Iterator[Callable[[str, str], "Future[Tuple[AnalysisResultData, Dict[str, int]]]"]]:
+    """
+    Yields a function starting the review of one (model, prompt) pair and
+    returning its future, running at most `max_workers` reviews at once: on the
+    worker's event loop in async mode, else on a thread pool. Each review runs
+    in a copy of the caller's context, so its spans join the task's trace.
+    """
+    if settings.WORKER_MODE == "async":
+        limit = asyncio.Semaphore(max_workers)
+        futures: List[Future] = []
+
+        def submit(model: str, prompt: str) -> Future:
+            futures.append(event_loop.submit(_areview(model, prompt, limit)))
+            return futures[-1]
+
+        try:
+            yield submit
+        finally:
+            # Don't leave calls running on the loop once the review has failed
+            for future in futures:
+                future.cancel()
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield lambda model, prompt: executor.submit(contextvars.copy_context().run, _review, model, prompt)
+
+
+def review_diff(
+    pr_diff: str,
+    on_chunk_reviewed: Optional[Callable[[AnalysisResultData], None]] = None,
+) -> AnalysisResultData:
+    """
+    Analyzes a PR diff using a direct LangChain chain with Google Gemini
+    and returns the result, including the token usage of the review.
+
+    Local pre-checks run first and their findings are reported before any LLM
+    call, followed by the findings of hunks found in the hunk cache. The
+    remaining hunks are split into prompts by plan_prompts(), which are
+    reviewed concurrently, so wall-clock time scales with the largest prompt
+    rather than the size of the whole PR. If given, `on_chunk_reviewed` is
+    called with each prompt's (filtered) result as soon as it is available.
+    """
+    lookup = None
+    with time_stage("parse"):
+        file_diffs = parse_diff(pr_diff)
+        if file_diffs:
+            # Hunks are cached as trimmed, so the same change with different
+            # surrounding code further away still matches.
+            trimmed = [trim_context(file_diff, settings.ANALYZER_CONTEXT_LINES) for file_diff in file_diffs]
+            lookup = lookup_hunks(trimmed, model_for_file, PROMPT_VERSION)
+            if lookup.hits:
+                logger.info(f"Reusing cached findings of {lookup.hits} hunk(s).")
+            prompts = plan_prompts(lookup.pending)
+        else:
+            # Not a git-formatted diff; review it as a whole.
+            prompts = [(MODEL_NAME, pr_diff)] if pr_diff.strip() else []
+
+    with time_stage("prechecks"):
+        precheck_issues = run_prechecks(file_diffs)
+    precheck_result = merge_results([AnalysisResultData.from_files([
+        FileAnalysis(name=path, issues=[Issue(**issue) for issue in issues])
+        for path, issues in precheck_issues.items()
+    ])])
+    if precheck_result.files:
+        logger.info(f"Pre-checks found {precheck_result.summary.total_issues} issue(s).")
+        if on_chunk_reviewed is not None:
+            on_chunk_reviewed(precheck_result)
+
+    cached_result = merge_results([AnalysisResultData.from_files(lookup.cached_files if lookup else [])])
+    if cached_result.files and on_chunk_reviewed is not None:
+        on_chunk_reviewed(cached_result)
+
+    usage = {"input_tokens": 0, "output_tokens": 0, "llm_calls": 0}
+    results: List[Optional[AnalysisResultData]] = [precheck_result, cached_result] + [None] * len(prompts)
+    if prompts:
+        max_workers = max(1, min(settings.ANALYZER_MAX_CONCURRENCY, len(prompts)))
+        logger.info(f"Reviewing {len(prompts)} prompt(s) with {max_workers} worker(s).")
+        with time_stage("llm_review", prompts=len(prompts)):
+            with _review_pool(max_workers) as submit:
+                futures = {
+                    submit(model, prompt): index
+                    for index, (model, prompt) in enumerate(prompts, start=2)
+                }
+                for future in as_completed(futures):
+                    result, call_usage = future.result()
+                    results[futures[future]] = result
+                    for key, value in call_usage.items():
+                        usage[key] += value
+                    if on_chunk_reviewed is not None:
+                        on_chunk_reviewed(merge_results([result]))
+
+    logger.info(
+        f"Review used {usage['input_tokens']} input and {usage['output_tokens']} output tokens "
+        f"in {usage['llm_calls']} LLM call(s)."
     )
-    result_object.summary.total_files = len(result_object.files)
-    result_object.summary.total_issues = total_issues
-    result_object.summary.critical_issues = critical_issues
+    if lookup is not None:
+        store_hunk_findings(lookup, merge_results(results[2:]).files)
+    result = merge_results(results)
+    result.usage = TokenUsage(**usage)
+    return result
+
 
-    # Return the Pydantic model as a JSON string.
-    return result_object.json()
\ No newline at end of file
+def analyze_code_with_langchain(
+    pr_diff: str,
+    on_chunk_reviewed: Optional[Callable[[AnalysisResultData], None]] = None,
+) -> str:
+    """Like review_diff(), but returns the result as a JSON string."""
+    return review_diff(pr_diff, on_chunk_reviewed).model_dump_json()
@@ -0,0 +1,136 @@
+"""
+Bulk analysis of many pull requests under one ID.
+
+The open PRs of each repository are listed page by page; every listing entry
+already carries the head SHA and draft flag, so no per-PR metadata request is
+needed before dispatch. Tasks get the head SHA too; they only confirm it, with
+a conditional request, once their diff is downloaded.
+The analyses are dispatched as one Celery group whose ID identifies the bulk
+run, or, with FAIR_SCHEDULING, queued for their tenants like any other. Its
+record (the task of each PR) is kept in Redis. Every finished review also
+stores its summary on its own, so progress and the combined summary are read
+with one MGET of those small summaries; only tasks without one (not finished
+yet, failed or revoked) have their metadata read.
+"""
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+from app.services.task_meta import get_task_metas, READY_STATES
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "bulk-analysis"
+SUMMARY_PREFIX = "task-summary"
+
+# A task revoked because a newer push superseded it is not a failure
+REVOKED = "REVOKED"
+
+
+def _bulk_key(bulk_id: str) -> str:
+    return f"{KEY_PREFIX}:{bulk_id}"
+
+
+def _summary_key(task_id: str) -> str:
+    return f"{SUMMARY_PREFIX}:{task_id}"
+
+
+def store_task_summary(task_id: str, summary: Dict[str, Any]) -> None:
+    """Stores the summary of a finished review for the progress of bulk runs."""
+    try:
+        get_redis().set(_summary_key(task_id), json.dumps(summary), ex=settings.BULK_ANALYSIS_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to store the summary of task {task_id}: {e}")
+
+
+def select_prs(
+    prs: Iterable[Dict[str, Any]],
+    pr_numbers: Optional[List[int]] = None,
+    labels: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Filters a PR listing: drafts are always left out, `pr_numbers` keeps only the
+    given PRs and `labels` keeps PRs carrying at least one of the labels.
+    """
+    wanted_numbers = set(pr_numbers) if pr_numbers else None
+    wanted_labels = set(labels) if labels else None
+    selected = []
+    for pr in prs:
+        if pr.get("draft"):
+            continue
+        if wanted_numbers is not None and pr["number"] not in wanted_numbers:
+            continue
+        if wanted_labels is not None and not wanted_labels & {label["name"] for label in pr.get("labels", [])}:
+            continue
+        selected.append(pr)
+    return selected
+
+
+async def save_bulk(bulk_id: str, tasks: List[Dict[str, Any]]) -> None:
+    """Stores the tasks of a bulk run (task_id, repo_url, pr_number, head_sha each)."""
+    await get_async_redis().set(
+        _bulk_key(bulk_id), json.dumps({"tasks": tasks}), ex=settings.BULK_ANALYSIS_TTL_SECONDS
+    )
+
+
+async def load_bulk(bulk_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Returns the tasks of a bulk run, or None if it is unknown or has expired."""
+    raw = await get_async_redis().get(_bulk_key(bulk_id))
+    if raw is None:
+        return None
+    return json.loads(raw)["tasks"]
+
+
+async def summarize_bulk(bulk_id: str, tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Builds the BulkAnalysisResponse payload: overall progress, per-task status and a combined summary."""
+    task_ids = [task["task_id"] for task in tasks]
+    stored = await get_async_redis().mget([_summary_key(task_id) for task_id in task_ids]) if task_ids else []
+    result_summaries: Dict[str, Dict[str, Any]] = {
+        task_id: json.loads(raw) for task_id, raw in zip(task_ids, stored) if raw is not None
+    }
+    # Only tasks without a stored summary have their (possibly large) metadata read
+    unsummarized = [task_id for task_id in task_ids if task_id not in result_summaries]
+    metas = dict(zip(unsummarized, await get_task_metas(unsummarized))) if unsummarized else {}
+
+    completed = failed = revoked = 0
+    summary = {"total_files": 0, "total_issues": 0, "critical_issues": 0}
+    task_statuses = []
+    for task in tasks:
+        task_id = task["task_id"]
+        if task_id in result_summaries:
+            task_status, result_summary = "SUCCESS", result_summaries[task_id]
+        else:
+            meta = metas[task_id]
+            task_status = meta["status"]
+            result_summary = (meta.get("result") or {}).get("summary", {}) if task_status == "SUCCESS" else {}
+        if task_status == "SUCCESS":
+            completed += 1
+            for key in summary:
+                summary[key] += result_summary.get(key, 0)
+        elif task_status == REVOKED:
+            revoked += 1
+        elif task_status in READY_STATES:
+            failed += 1
+        task_statuses.append({**task, "status": task_status})
+
+    if completed + failed + revoked == len(tasks):
+        bulk_status = "COMPLETED"
+    elif completed + failed + revoked or any(task["status"] != "PENDING" for task in task_statuses):
+        bulk_status = "PROCESSING"
+    else:
+        bulk_status = "PENDING"
+
+    return {
+        "bulk_id": bulk_id,
+        "status": bulk_status,
+        "total": len(tasks),
+        "completed": completed,
+        "failed": failed,
+        "revoked": revoked,
+        "summary": summary,
+        "tasks": task_statuses,
+    }
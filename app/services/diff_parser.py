@@ -0,0 +1,224 @@
+"""
+Parsing of unified diffs (as returned by GitHub) into per-file and per-hunk pieces.
+"""
+import hashlib
+import re
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# Files whose diffs are machine-generated and not worth an LLM review.
+GENERATED_FILE_PATTERNS = [
+    "*package-lock.json", "*yarn.lock", "*pnpm-lock.yaml", "*poetry.lock", "*Pipfile.lock",
+    "*Cargo.lock", "*go.sum", "*composer.lock", "*Gemfile.lock",
+    "*.min.js", "*.min.css", "*.map", "*.pb.go", "*_pb2.py",
+    "vendor/*", "*/vendor/*", "node_modules/*", "*/node_modules/*", "dist/*",
+]
+
+
+@dataclass
+class Hunk:
+    """A single `@@ ... @@` section of a file diff."""
+    header: str
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    lines: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header, *self.lines])
+
+
+@dataclass
+class FileDiff:
+    """The diff of a single file: its git header lines followed by its hunks."""
+    path: str
+    header_lines: List[str] = field(default_factory=list)
+    hunks: List[Hunk] = field(default_factory=list)
+    truncated: bool = False  # Set when the diff was too large and its hunks were dropped
+
+    @property
+    def header(self) -> str:
+        return "\n".join(self.header_lines)
+
+    @property
+    def text(self) -> str:
+        return "\n".join([self.header, *(hunk.text for hunk in self.hunks)])
+
+    @property
+    def size(self) -> int:
+        """Approximate size of the file diff in characters."""
+        return sum(len(line) + 1 for line in self.header_lines) + sum(
+            len(hunk.header) + 1 + sum(len(line) + 1 for line in hunk.lines) for hunk in self.hunks
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Identifies the content of this file diff. Git's `index <old>..<new>` line
+        holds the blob SHAs on both sides, so it changes exactly when the file's
+        diff does; diffs without one (e.g. mode-only changes) fall back to a hash.
+        """
+        for line in self.header_lines:
+            if line.startswith("index "):
+                return line.split()[1]
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+
+def _path_from_git_header(line: str) -> str:
+    # "diff --git a/path b/path" -> "path". Paths may contain spaces, so split on the last " b/".
+    _, _, path = line[len("diff --git "):].rpartition(" b/")
+    return path
+
+
+def _parse_hunk_header(line: str) -> Optional[Hunk]:
+    match = HUNK_HEADER_RE.match(line)
+    if not match:
+        return None
+    old_start, old_count, new_start, new_count = match.groups()
+    return Hunk(
+        header=line,
+        old_start=int(old_start),
+        old_count=int(old_count) if old_count is not None else 1,
+        new_start=int(new_start),
+        new_count=int(new_count) if new_count is not None else 1,
+    )
+
+
+def iter_file_diffs(
+    lines: Iterable[str],
+    max_file_bytes: Optional[int] = None,
+    input_truncated: bool = False,
+) -> Iterator[FileDiff]:
+    """
+    Lazily splits the lines of a unified git diff into FileDiff objects, yielding
+    each file as soon as the next one starts. Only one file is held at a time,
+    so a diff streamed from disk is never fully loaded into memory. Files larger
+    than `max_file_bytes` are yielded without hunks and marked as truncated, as
+    is the last file when `input_truncated` says the diff itself was cut off.
+    Lines before the first `diff --git` line are ignored.
+    """
+    current_file: Optional[FileDiff] = None
+    current_hunk: Optional[Hunk] = None
+    current_size = 0
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            if current_file is not None:
+                yield current_file
+            current_file = FileDiff(path=_path_from_git_header(line), header_lines=[line])
+            current_hunk = None
+            current_size = 0
+            continue
+        if current_file is None or current_file.truncated:
+            continue
+
+        current_size += len(line) + 1
+        if max_file_bytes is not None and current_size > max_file_bytes:
+            current_file.truncated = True
+            current_file.hunks = []
+            current_hunk = None
+            continue
+
+        if line.startswith("@@"):
+            hunk = _parse_hunk_header(line)
+            if hunk is not None:
+                current_hunk = hunk
+                current_file.hunks.append(hunk)
+                continue
+
+        if current_hunk is not None:
+            current_hunk.lines.append(line)
+        else:
+            current_file.header_lines.append(line)
+            if line.startswith("+++ b/"):
+                current_file.path = line[len("+++ b/"):]
+
+    if current_file is not None:
+        if input_truncated:
+            current_file.truncated = True
+            current_file.hunks = []
+        yield current_file
+
+
+def iter_file_lines(diff_file: BinaryIO) -> Iterator[str]:
+    """Yields the lines of a binary diff file, decoded and without line terminators."""
+    for raw_line in diff_file:
+        yield raw_line.decode("utf-8", errors="replace").rstrip("\r\n")
+
+
+def parse_diff(diff: str) -> List[FileDiff]:
+    """
+    Splits a unified git diff into FileDiff objects.
+    Text before the first `diff --git` line is ignored.
+    """
+    return list(iter_file_diffs(diff.splitlines()))
+
+
+def skip_reason(file_diff: FileDiff, max_file_bytes: int) -> Optional[str]:
+    """Returns why a file should not be sent to the analyzer, or None if it should be."""
+    if any(line.startswith(("Binary files ", "GIT binary patch")) for line in file_diff.header_lines):
+        return "binary file"
+    if any(fnmatch(file_diff.path, pattern) for pattern in GENERATED_FILE_PATTERNS):
+        return "generated or vendored file"
+    if file_diff.truncated:
+        return "diff too large"
+    if file_diff.size > max_file_bytes:
+        return f"diff larger than {max_file_bytes} bytes"
+    return None
+
+
+def select_reviewable_files(
+    file_diffs: Iterable[FileDiff],
+    max_files: int,
+    max_file_bytes: int,
+) -> Tuple[List[FileDiff], List[str]]:
+    """
+    Keeps the files worth reviewing and describes the skipped ones, e.g.
+    "package-lock.json (generated or vendored file)". Skipped files are dropped
+    as they are read, so only reviewable content is held in memory.
+    """
+    selected: List[FileDiff] = []
+    skipped: List[str] = []
+    for file_diff in file_diffs:
+        reason = skip_reason(file_diff, max_file_bytes)
+        if reason is None and len(selected) >= max_files:
+            reason = f"over the {max_files} file limit"
+        if reason is None:
+            selected.append(file_diff)
+        else:
+            skipped.append(f"{file_diff.path} ({reason})")
+    return selected, skipped
+
+
+def chunk_diff(files: List[FileDiff], max_chunk_chars: int) -> List[str]:
+    """
+    Produces review chunks: one per file, or, for files whose diff exceeds
+    `max_chunk_chars`, groups of consecutive hunks that each fit the limit.
+    Every chunk repeats the file header so it can be reviewed on its own.
+    """
+    chunks: List[str] = []
+    for file_diff in files:
+        text = file_diff.text
+        if len(text) <= max_chunk_chars or len(file_diff.hunks) <= 1:
+            chunks.append(text)
+            continue
+
+        header = file_diff.header
+        group: List[str] = []
+        group_size = len(header)
+        for hunk in file_diff.hunks:
+            hunk_text = hunk.text
+            if group and group_size + len(hunk_text) + 1 > max_chunk_chars:
+                chunks.append("\n".join([header, *group]))
+                group, group_size = [], len(header)
+            group.append(hunk_text)
+            group_size += len(hunk_text) + 1
+        if group:
+            chunks.append("\n".join([header, *group]))
+
+    return chunks
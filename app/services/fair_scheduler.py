@@ -0,0 +1,289 @@
+"""
+Fair scheduling of analysis tasks across tenants.
+
+With FAIR_SCHEDULING enabled, the API does not send analysis tasks straight to
+Celery's FIFO queues. Each tenant (the submitter's GitHub token, or the owner
+of the repository when no token is given) gets its own pending list in Redis,
+and a dispatcher hands tasks to Celery by deficit round-robin: every round, a
+tenant's deficit grows by its weight (TENANT_WEIGHTS, default 1) and it may
+dispatch tasks while their cost (1 for a small PR, LARGE_PR_COST for a large
+one) fits in its deficit. Only FAIR_MAX_DISPATCHED tasks are handed to Celery
+at once, and at most TENANT_MAX_CONCURRENCY per tenant, so the order in which
+reviews start is decided here: a tenant that bulk-submits 500 PRs drains its
+backlog at its share of the capacity while other tenants' reviews start
+within a round. A tenant can have at most TENANT_MAX_PENDING tasks waiting.
+
+The dispatcher runs after each submission and every FAIR_DISPATCH_INTERVAL_SECONDS
+in the API; a Redis lock lets only one API process run a pass at a time.
+Workers free a tenant's slot when its task finishes; a TTL guards against
+workers that die without doing so.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+from app.core.tracing import TENANT_HEADER, SUBMITTED_AT_HEADER
+from app.services.github_helper import parse_repo_name
+from app.services.task_routing import ANALYSIS_TASK, QUEUE_LARGE
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "fair"
+TENANTS_KEY = f"{KEY_PREFIX}:tenants"  # Set of tenants with pending tasks
+DEFICIT_KEY = f"{KEY_PREFIX}:deficit"  # Hash of the tenants' deficit counters
+CURSOR_KEY = f"{KEY_PREFIX}:cursor"  # Tenant served last, so the next pass starts after it
+RUNNING_KEY = f"{KEY_PREFIX}:running"  # Sorted set of dispatched tasks, scored by dispatch time
+LOCK_KEY = f"{KEY_PREFIX}:lock"
+
+
+# Large PRs take several times longer to review, so they use more of a tenant's share
+LARGE_PR_COST = 4
+
+# KEYS: tenant's pending list, tenants set
+# ARGV: maximum pending tasks, tenant, entries...
+# Returns the new length of the list, or -1 if the entries would exceed the maximum.
+SUBMIT_SCRIPT = """
+local pending = redis.call('llen', KEYS[1])
+if pending + #ARGV - 2 > tonumber(ARGV[1]) then
+    return -1
+end
+for i = 3, #ARGV do
+    redis.call('rpush', KEYS[1], ARGV[i])
+end
+redis.call('sadd', KEYS[2], ARGV[2])
+return pending + #ARGV - 2
+"""
+
+# KEYS: tenant's pending list, tenants set
+# ARGV: tenant
+# Drops the tenant from the set only if it has no pending tasks, so a task
+# submitted meanwhile is never stranded.
+RETIRE_SCRIPT = """
+if redis.call('llen', KEYS[1]) == 0 then
+    redis.call('srem', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# Deletes the dispatcher lock only if it still holds our token, so a pass that
+# outlived the lock's TTL never releases the lock of the process after it.
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Floor of the tenant weights, so every tenant with pending tasks makes progress
+MIN_WEIGHT = 0.1
+
+
+class TenantQuotaExceeded(Exception):
+    """Raised when a submission would exceed the tenant's TENANT_MAX_PENDING."""
+    pass
+
+
+def _pending_key(tenant: str) -> str:
+    return f"{KEY_PREFIX}:pending:{tenant}"
+
+
+def _running_key(tenant: str) -> str:
+    return f"{KEY_PREFIX}:running:{tenant}"
+
+
+def tenant_for(repo_url: str, github_token: Optional[str] = None) -> str:
+    """
+    Returns the tenant a request is scheduled under: its GitHub token (by
+    digest, so tokens never appear in Redis keys or metrics), or else the
+    owner of the repository.
+    """
+    if github_token:
+        return f"token:{hashlib.sha256(github_token.encode('utf-8')).hexdigest()[:12]}"
+    owner = parse_repo_name(repo_url).split("/")[0]
+    return f"owner:{owner.lower()}"
+
+
+def make_entry(task_id: str, args: List[Any], kwargs: Dict[str, Any], queue: str, priority: int) -> Dict[str, Any]:
+    """Describes an analysis task to dispatch later."""
+    return {
+        "task_id": task_id, "args": args, "kwargs": kwargs, "queue": queue, "priority": priority,
+        "cost": LARGE_PR_COST if queue == QUEUE_LARGE else 1,
+        "submitted_at": time.time(),
+    }
+
+
+async def submit(tenant: str, entries: List[Dict[str, Any]]) -> None:
+    """
+    Adds tasks to the tenant's pending list, all or none of them. Raises
+    TenantQuotaExceeded if the tenant would have more than TENANT_MAX_PENDING.
+    """
+    if not entries:
+        return
+    pending = await get_async_redis().eval(
+        SUBMIT_SCRIPT, 2, _pending_key(tenant), TENANTS_KEY,
+        settings.TENANT_MAX_PENDING, tenant, *(json.dumps(entry) for entry in entries),
+    )
+    if pending < 0:
+        raise TenantQuotaExceeded(
+            f"Tenant {tenant} cannot queue {len(entries)} more analyses "
+            f"(at most {settings.TENANT_MAX_PENDING} may be pending)."
+        )
+    logger.info(f"Queued {len(entries)} analysis(es) for tenant {tenant}; {pending} pending.")
+
+
+def _send(tenant: str, entry: Dict[str, Any]) -> None:
+    celery_app.send_task(
+        ANALYSIS_TASK,
+        args=entry["args"],
+        kwargs=entry["kwargs"],
+        task_id=entry["task_id"],
+        queue=entry["queue"],
+        priority=entry["priority"],
+        headers={TENANT_HEADER: tenant, SUBMITTED_AT_HEADER: entry["submitted_at"]},
+    )
+
+
+def _rotate(tenants: List[str], cursor: Optional[str]) -> List[str]:
+    """Orders tenants round-robin, starting after the one served last."""
+    tenants = sorted(tenants)
+    if cursor in tenants:
+        index = tenants.index(cursor) + 1
+        tenants = tenants[index:] + tenants[:index]
+    return tenants
+
+
+async def dispatch_pending() -> int:
+    """
+    Runs one dispatch pass, handing pending tasks to Celery by deficit
+    round-robin until FAIR_MAX_DISPATCHED tasks are running or every tenant
+    with pending tasks is at TENANT_MAX_CONCURRENCY. Returns the number of
+    tasks dispatched (0 if another process holds the dispatcher lock).
+    """
+    client = get_async_redis()
+    token = str(uuid.uuid4())
+    if not await client.set(LOCK_KEY, token, nx=True, ex=max(10, int(settings.FAIR_DISPATCH_INTERVAL_SECONDS * 10))):
+        return 0
+
+    dispatched = 0
+    try:
+        # Tasks of workers that died without freeing their slot
+        expired_before = time.time() - settings.FAIR_RUNNING_TTL_SECONDS
+        await client.zremrangebyscore(RUNNING_KEY, "-inf", expired_before)
+        capacity = settings.FAIR_MAX_DISPATCHED - await client.zcard(RUNNING_KEY)
+        cursor = await client.get(CURSOR_KEY)
+        tenants = _rotate(
+            [tenant.decode() for tenant in await client.smembers(TENANTS_KEY)],
+            cursor.decode() if cursor else None,
+        )
+        deficits = {
+            tenant.decode(): float(value) for tenant, value in (await client.hgetall(DEFICIT_KEY)).items()
+            if tenant.decode() in tenants
+        }
+
+        running = {}
+        for tenant in tenants:
+            await client.zremrangebyscore(_running_key(tenant), "-inf", expired_before)
+            running[tenant] = await client.zcard(_running_key(tenant))
+        # Tenants at their concurrency limit sit the pass out without building up a deficit
+        eligible = [tenant for tenant in tenants if running[tenant] < settings.TENANT_MAX_CONCURRENCY]
+
+        while capacity > 0 and eligible:
+            for tenant in list(eligible):
+                if capacity <= 0:
+                    break
+                deficit = deficits.get(tenant, 0.0) + max(settings.TENANT_WEIGHTS.get(tenant, 1.0), MIN_WEIGHT)
+                while capacity > 0 and running[tenant] < settings.TENANT_MAX_CONCURRENCY:
+                    raw = await client.lindex(_pending_key(tenant), 0)
+                    if raw is None:
+                        break
+                    entry = json.loads(raw)
+                    if entry["cost"] > deficit:
+                        break
+                    await client.lpop(_pending_key(tenant))
+                    # The slot is taken before the task is sent, so a task that finishes
+                    # at once cannot free it before it has been recorded
+                    now = time.time()
+                    async with client.pipeline(transaction=False) as pipe:
+                        pipe.zadd(RUNNING_KEY, {entry["task_id"]: now})
+                        pipe.zadd(_running_key(tenant), {entry["task_id"]: now})
+                        pipe.expire(_running_key(tenant), settings.FAIR_RUNNING_TTL_SECONDS)
+                        await pipe.execute()
+                    try:
+                        await asyncio.to_thread(_send, tenant, entry)
+                    except Exception:
+                        async with client.pipeline(transaction=False) as pipe:
+                            pipe.zrem(RUNNING_KEY, entry["task_id"])
+                            pipe.zrem(_running_key(tenant), entry["task_id"])
+                            pipe.lpush(_pending_key(tenant), raw)
+                            await pipe.execute()
+                        raise
+                    deficit -= entry["cost"]
+                    running[tenant] += 1
+                    capacity -= 1
+                    dispatched += 1
+
+                deficits[tenant] = deficit
+                if await client.eval(RETIRE_SCRIPT, 2, _pending_key(tenant), TENANTS_KEY, tenant):
+                    # An idle tenant does not keep its deficit (the rule of deficit round-robin)
+                    del deficits[tenant]
+                    eligible.remove(tenant)
+                elif running[tenant] >= settings.TENANT_MAX_CONCURRENCY:
+                    eligible.remove(tenant)
+                await client.set(CURSOR_KEY, tenant)
+
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(DEFICIT_KEY)
+            if deficits:
+                pipe.hset(DEFICIT_KEY, mapping=deficits)
+            await pipe.execute()
+    finally:
+        await client.eval(UNLOCK_SCRIPT, 1, LOCK_KEY, token)
+    if dispatched:
+        logger.info(f"Dispatched {dispatched} analysis task(s).")
+    return dispatched
+
+
+def release(tenant: str, task_id: str) -> None:
+    """Frees the slot of a finished task, so the tenant can start another one."""
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.zrem(RUNNING_KEY, task_id)
+        pipe.zrem(_running_key(tenant), task_id)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to free the scheduling slot of task {task_id}: {e}")
+
+
+async def run_dispatcher() -> None:
+    """Dispatches pending tasks every FAIR_DISPATCH_INTERVAL_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(settings.FAIR_DISPATCH_INTERVAL_SECONDS)
+        try:
+            await dispatch_pending()
+        except Exception as e:
+            # Redis or the broker may be briefly unavailable; the next pass retries
+            logger.warning(f"Dispatching pending analyses failed: {e}")
+
+
+@asynccontextmanager
+async def dispatcher_lifespan(app):
+    """FastAPI lifespan running the dispatcher in the background while the API is up."""
+    task = None
+    if settings.FAIR_SCHEDULING:
+        task = asyncio.create_task(run_dispatcher())
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
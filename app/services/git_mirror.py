@@ -0,0 +1,177 @@
+"""
+Local bare mirrors of repositories, for computing PR diffs with git.
+
+Instead of downloading a server-rendered diff for every task, a worker keeps a
+bare mirror of each repository on disk and fetches just the PR head and its
+base branch, so only objects it doesn't have yet are transferred. The diff is
+then computed locally, with as much context as configured. A file lock per
+mirror serializes fetches, and a task whose commits were fetched moments ago
+by another task on the same repository skips its own fetch.
+"""
+import base64
+import fcntl
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bytes copied from `git diff` at a time
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class GitMirrorError(Exception):
+    """Raised when a git command on a mirror fails."""
+    pass
+
+
+def mirror_path(clone_url: str) -> str:
+    """Returns the directory of the bare mirror of a repository."""
+    digest = hashlib.sha256(clone_url.rstrip("/").lower().encode("utf-8")).hexdigest()[:32]
+    return os.path.join(settings.GIT_MIRROR_DIR, f"{digest}.git")
+
+
+def _git_env(token: Optional[str]) -> Dict[str, str]:
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+    if token:
+        # Passed through the environment so the token never appears on a command line or on disk
+        credentials = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+        })
+    return env
+
+
+def _run_git(args: List[str], token: Optional[str] = None, timeout: Optional[float] = None) -> str:
+    try:
+        completed = subprocess.run(
+            ["git", *args], env=_git_env(token), capture_output=True, timeout=timeout, check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise GitMirrorError(f"git {args[0]} failed: {e}") from e
+    if completed.returncode != 0:
+        message = completed.stderr.decode("utf-8", errors="replace").strip()
+        raise GitMirrorError(f"git {args[0]} failed: {message}")
+    return completed.stdout.decode("utf-8", errors="replace")
+
+
+@contextmanager
+def _locked(path: str) -> Iterator[None]:
+    """Holds an exclusive lock on a mirror, shared by all processes on the host."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _has_commit(path: str, sha: str) -> bool:
+    try:
+        _run_git(["--git-dir", path, "cat-file", "-e", f"{sha}^{{commit}}"])
+        return True
+    except GitMirrorError:
+        return False
+
+
+def _recently_fetched(path: str, base_ref: str) -> bool:
+    """Whether the last fetch into the mirror, within the freshness window, included the base branch."""
+    fetch_head = os.path.join(path, "FETCH_HEAD")
+    try:
+        if time.time() - os.path.getmtime(fetch_head) > settings.GIT_FETCH_MAX_AGE_SECONDS:
+            return False
+        with open(fetch_head, encoding="utf-8", errors="replace") as f:
+            return f"branch '{base_ref}' of" in f.read()
+    except OSError:
+        return False
+
+
+def fetch_pr_refs(
+    clone_url: str,
+    pr_number: int,
+    base_ref: str,
+    head_sha: Optional[str] = None,
+    token: Optional[str] = None,
+) -> Tuple[str, str, str]:
+    """
+    Brings the mirror up to date with a PR's head and base branch, creating the
+    mirror on first use. Returns the mirror path and the base and head commit
+    SHAs to diff. The fetch is skipped if the head commit is already present
+    and the base branch was fetched within GIT_FETCH_MAX_AGE_SECONDS.
+    """
+    path = mirror_path(clone_url)
+    head_ref = f"refs/pull/{pr_number}/head"
+    with _locked(path):
+        if not os.path.isdir(path):
+            logger.info(f"Creating bare mirror of {clone_url} at {path}")
+            _run_git(["init", "--bare", "--quiet", path])
+
+        if head_sha and _has_commit(path, head_sha) and _recently_fetched(path, base_ref):
+            logger.info(f"PR #{pr_number} head {head_sha[:7]} is already in the mirror; skipping fetch.")
+        else:
+            start = time.perf_counter()
+            _run_git(
+                ["--git-dir", path, "fetch", "--quiet", "--no-tags", clone_url,
+                 f"+{head_ref}:{head_ref}", f"+refs/heads/{base_ref}:refs/heads/{base_ref}"],
+                token=token, timeout=settings.GIT_FETCH_TIMEOUT_SECONDS,
+            )
+            logger.info(f"Fetched PR #{pr_number} and '{base_ref}' into the mirror in {time.perf_counter() - start:.2f}s.")
+
+        base = _run_git(["--git-dir", path, "rev-parse", f"refs/heads/{base_ref}"]).strip()
+        # Review the expected head even if the PR has moved on since the task was queued
+        if head_sha and _has_commit(path, head_sha):
+            head = head_sha
+        else:
+            head = _run_git(["--git-dir", path, "rev-parse", head_ref]).strip()
+    return path, base, head
+
+
+def diff_to_file(path: str, base: str, head: str, context_lines: int, max_bytes: int) -> Tuple[BinaryIO, bool]:
+    """
+    Computes the PR diff (changes on `head` since its merge base with `base`,
+    as GitHub shows them) into a spooled temp file of at most `max_bytes`.
+    Returns the file, positioned at the start, and whether it was truncated.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.DIFF_SPOOL_THRESHOLD_BYTES)
+    # stderr goes to a file rather than a pipe: git would block on a full stderr
+    # pipe while stdout is still being read, and neither side would move
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            ["git", "--git-dir", path, "diff", "--no-color", "--no-ext-diff", "--find-renames",
+             f"-U{context_lines}", f"{base}...{head}"],
+            stdout=subprocess.PIPE, stderr=stderr_file, env=_git_env(None),
+        )
+        size, truncated = 0, False
+        try:
+            while True:
+                chunk = process.stdout.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                if size + len(chunk) > max_bytes:
+                    spool.write(chunk[:max_bytes - size])
+                    truncated = True
+                    break
+                spool.write(chunk)
+                size += len(chunk)
+        finally:
+            if truncated:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0 and not truncated:
+            spool.close()
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode("utf-8", errors="replace").strip()
+            raise GitMirrorError(f"git diff failed: {stderr}")
+    spool.seek(0)
+    return spool, truncated
@@ -0,0 +1,244 @@
+"""
+Reusable GitHub REST client.
+
+One client (and therefore one keep-alive `requests.Session` with its own
+connection pool) is kept per token, for the GITHUB_CLIENT_CACHE_SIZE most
+recently used tokens. GET requests are conditional: responses are cached with
+their ETag and revalidated with `If-None-Match`, and GitHub does not count 304
+responses against the rate limit. The client also tracks
+`X-RateLimit-Remaining`/`X-RateLimit-Reset` and waits for the window to reset
+instead of letting requests fail once the quota is exhausted; callers that must
+not block (the API) pass `wait=False` and get GitHubRateLimited instead.
+"""
+import email.utils
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from contextlib import closing
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+JSON_MEDIA_TYPE = "application/vnd.github+json"
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+
+
+class GitHubAPIError(Exception):
+    """Raised when the GitHub API returns an unsuccessful response."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+class GitHubRateLimited(GitHubAPIError):
+    """Raised instead of waiting when the rate limit is exhausted and the caller asked not to wait."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(429, f"GitHub rate limit exhausted; retry in {retry_after:.0f}s.")
+        self.retry_after = retry_after
+
+
+class GitHubClient:
+    """A pooled, conditional-request GitHub REST client bound to one token."""
+
+    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None):
+        self.token = token
+        self.base_url = (base_url or settings.GITHUB_API_URL).rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=settings.GITHUB_POOL_SIZE, pool_maxsize=settings.GITHUB_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["User-Agent"] = "code-review-agent"
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+
+        self._etag_cache = LRUCache(maxsize=settings.GITHUB_ETAG_CACHE_SIZE)
+        self._rate_limit_lock = threading.Lock()
+        self._rate_limit_remaining: Optional[int] = None
+        self._rate_limit_reset: float = 0.0
+
+    def get_json(self, path: str, params: Optional[Dict[str, Any]] = None, wait: bool = True) -> Any:
+        """GETs a JSON resource."""
+        return self.get(path, accept=JSON_MEDIA_TYPE, params=params, wait=wait).json()
+
+    def get(
+        self, path: str, accept: str = JSON_MEDIA_TYPE, params: Optional[Dict[str, Any]] = None, wait: bool = True
+    ) -> requests.Response:
+        """
+        Performs a conditional GET. A 304 returns the cached response, rate-limit
+        exhaustion waits for the reset (or raises GitHubRateLimited if `wait` is
+        False), and other errors raise GitHubAPIError.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        cache_key = (url, accept, tuple(sorted((params or {}).items())))
+        cached: Optional[requests.Response] = self._etag_cache.get(cache_key)
+
+        headers = {"Accept": accept}
+        if cached is not None and cached.headers.get("ETag"):
+            headers["If-None-Match"] = cached.headers["ETag"]
+
+        response = self._send(url, headers, params, wait=wait)
+        if response.status_code == 304 and cached is not None:
+            logger.debug(f"GitHub 304 Not Modified for {url}; using cached response.")
+            return cached
+
+        if not response.ok:
+            raise GitHubAPIError(response.status_code, self._error_message(response))
+
+        if response.headers.get("ETag"):
+            self._etag_cache.set(cache_key, response)
+        return response
+
+    def download(self, path: str, accept: str, max_bytes: int) -> Tuple[BinaryIO, bool]:
+        """
+        Streams a resource into a temporary file that stays in memory only up to
+        DIFF_SPOOL_THRESHOLD_BYTES and spills to disk beyond that. At most
+        `max_bytes` are read. Returns the file (positioned at the start) and
+        whether the body was truncated. Small bodies are kept for conditional requests.
+        """
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        cache_key = ("download", url, accept)
+        cached: Optional[Tuple[str, bytes]] = self._etag_cache.get(cache_key)
+
+        headers = {"Accept": accept}
+        if cached is not None:
+            headers["If-None-Match"] = cached[0]
+
+        spool = tempfile.SpooledTemporaryFile(max_size=settings.DIFF_SPOOL_THRESHOLD_BYTES)
+        with closing(self._send(url, headers, stream=True)) as response:
+            if response.status_code == 304 and cached is not None:
+                logger.debug(f"GitHub 304 Not Modified for {url}; using cached body.")
+                spool.write(cached[1])
+                spool.seek(0)
+                return spool, False
+            if not response.ok:
+                spool.close()
+                raise GitHubAPIError(response.status_code, self._error_message(response))
+
+            size, truncated = 0, False
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if size + len(chunk) > max_bytes:
+                    spool.write(chunk[:max_bytes - size])
+                    truncated = True
+                    break
+                spool.write(chunk)
+                size += len(chunk)
+            etag = response.headers.get("ETag")
+
+        spool.seek(0)
+        if etag and not truncated and size <= settings.GITHUB_ETAG_MAX_BODY_BYTES:
+            self._etag_cache.set(cache_key, (etag, spool.read()))
+            spool.seek(0)
+        return spool, truncated
+
+    def _send(
+        self, url: str, headers: Dict[str, str], params: Optional[Dict[str, Any]] = None,
+        stream: bool = False, wait: bool = True,
+    ) -> requests.Response:
+        """Sends a GET, waiting out the rate limit and retrying rate-limited responses."""
+        for attempt in range(settings.GITHUB_MAX_RETRIES + 1):
+            self._wait_for_rate_limit(wait)
+            response = self.session.get(url, headers=headers, params=params, stream=stream, timeout=settings.GITHUB_TIMEOUT_SECONDS)
+            self._record_rate_limit(response)
+            if self._is_rate_limited(response) and attempt < settings.GITHUB_MAX_RETRIES:
+                response.close()
+                self._backoff(response, wait)
+                continue
+            return response
+
+    def _record_rate_limit(self, response: requests.Response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        with self._rate_limit_lock:
+            self._rate_limit_remaining = int(remaining)
+            self._rate_limit_reset = float(reset)
+
+    def _wait_for_rate_limit(self, wait: bool = True) -> None:
+        """
+        Sleeps until the rate-limit window resets once the remaining quota runs
+        low, or raises GitHubRateLimited if `wait` is False.
+        """
+        with self._rate_limit_lock:
+            remaining, reset = self._rate_limit_remaining, self._rate_limit_reset
+        if remaining is None or remaining > settings.GITHUB_RATE_LIMIT_MIN_REMAINING:
+            return
+        delay = reset - time.time()
+        if delay <= 0:
+            return
+        delay = min(delay, settings.GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS)
+        if not wait:
+            raise GitHubRateLimited(delay)
+        logger.warning(f"GitHub rate limit nearly exhausted ({remaining} left); waiting {delay:.0f}s for reset.")
+        time.sleep(delay)
+        with self._rate_limit_lock:
+            self._rate_limit_remaining = None
+
+    @staticmethod
+    def _is_rate_limited(response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers
+        )
+
+    def _backoff(self, response: requests.Response, wait: bool = True) -> None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            delay = _retry_after_seconds(retry_after)
+        else:
+            delay = float(response.headers.get("X-RateLimit-Reset", time.time())) - time.time()
+        delay = min(max(delay, 1.0), settings.GITHUB_RATE_LIMIT_MAX_WAIT_SECONDS)
+        if not wait:
+            raise GitHubRateLimited(delay)
+        logger.warning(f"GitHub rate limit hit ({response.status_code}); retrying in {delay:.0f}s.")
+        time.sleep(delay)
+
+    @staticmethod
+    def _error_message(response: requests.Response) -> str:
+        try:
+            return response.json().get("message", response.reason)
+        except ValueError:
+            return response.reason or f"HTTP {response.status_code}"
+
+
+def _retry_after_seconds(retry_after: str) -> float:
+    """Parses a Retry-After header, given in seconds or as an HTTP date."""
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+    except (TypeError, ValueError):
+        logger.warning(f"Unparsable Retry-After header {retry_after!r}; retrying shortly.")
+        return 0.0
+
+
+# Clients of tokens not used for a while are evicted; their sessions are closed
+# by garbage collection once no request uses them any more.
+_clients = LRUCache(maxsize=settings.GITHUB_CLIENT_CACHE_SIZE)
+_clients_lock = threading.Lock()
+
+
+def get_github_client(token: Optional[str] = None) -> GitHubClient:
+    """Returns the process-wide client for a token, creating it on first use."""
+    # Key on a digest so raw tokens are not kept around as dictionary keys.
+    key = hashlib.sha256((token or "").encode("utf-8")).hexdigest()
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = GitHubClient(token)
+            _clients.set(key, client)
+        return client
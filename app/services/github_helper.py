@@ -1,75 +1,235 @@
 import logging
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterator, List, Optional
 from urllib.parse import urlparse
-import requests
-from github import Github, UnknownObjectException, GithubException
+
+from app.core.config import settings
+from app.services.diff_parser import FileDiff, iter_file_diffs, iter_file_lines, parse_diff, select_reviewable_files
+from app.services.github_client import get_github_client, GitHubAPIError, GitHubRateLimited, DIFF_MEDIA_TYPE
+from app.services.git_mirror import GitMirrorError, fetch_pr_refs, diff_to_file
 
 logger = logging.getLogger(__name__)
 
+# Largest page size of GitHub's list endpoints
+PAGE_SIZE = 100
+
+# Downloads of a PR whose head keeps moving before giving up
+DIFF_DOWNLOAD_ATTEMPTS = 2
+
 class GitHubConnectionError(Exception):
     """Custom exception for GitHub-related connection or access errors."""
     pass
 
+class GitHubRateLimitError(GitHubConnectionError):
+    """Raised to callers that asked not to wait when the GitHub rate limit is exhausted."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class PRDiff:
+    """
+    The reviewable part of a pull request's diff together with the head commit it
+    was taken at. Files skipped by the size and generated-file filters are only
+    listed by name in `skipped_files`. Fetched diffs are kept as their parsed
+    files only; the text of the whole diff is joined by text() where it is needed.
+    """
+    head_sha: str
+    diff: Optional[str] = None  # Set for diffs built from an in-memory text
+    files: List[FileDiff] = field(default_factory=list)
+    skipped_files: List[str] = field(default_factory=list)
+
+    def file_texts(self) -> Iterator[str]:
+        """Yields the diff piece by piece (one file at a time unless it was given as a whole)."""
+        if self.diff is not None:
+            yield self.diff
+            return
+        for file_diff in self.files:
+            yield file_diff.text
+
+    def text(self) -> str:
+        """Returns the whole diff as one string."""
+        if self.diff is not None:
+            return self.diff
+        return "\n".join(self.file_texts())
+
+    @classmethod
+    def from_diff(cls, head_sha: str, diff: str) -> "PRDiff":
+        """Builds a PRDiff from an in-memory diff without applying any filters."""
+        return cls(head_sha=head_sha, diff=diff, files=parse_diff(diff))
+
 def get_pr_diff(repo_url: str, pr_number: int, token: str | None = None) -> str:
     """
     Fetches the diff of a specific GitHub Pull Request.
     """
+    return fetch_pr_diff(repo_url, pr_number, token).text()
+
+def parse_repo_name(repo_url: str) -> str:
+    """Extracts "owner/repo" from a GitHub repository URL."""
+    parsed_url = urlparse(repo_url)
+    path_parts = parsed_url.path.strip('/').split('/')
+    if len(path_parts) < 2:
+        raise ValueError("Invalid GitHub repository URL format.")
+    owner, repo_slug = path_parts[:2]
+    return f"{owner}/{repo_slug}"
+
+def get_pr_metadata(repo_url: str, pr_number: int, token: str | None = None, wait: bool = True) -> dict:
+    """
+    Fetches the metadata of a specific GitHub Pull Request (head SHA, draft flag, size, ...).
+    The request is conditional, so repeated lookups of an unchanged PR cost no rate limit.
+    With `wait` False, an exhausted rate limit raises GitHubRateLimitError instead of
+    waiting for the reset.
+    """
     repo_name = None # Initialize repo_name
     try:
         if not token:
             logger.warning("No GitHub token provided. Rate limits will be low.")
-        g = Github(token)
-        
-        parsed_url = urlparse(repo_url)
-        path_parts = parsed_url.path.strip('/').split('/')
-        if len(path_parts) < 2:
-            raise ValueError("Invalid GitHub repository URL format.")
-        
-        owner, repo_slug = path_parts[:2]
-        repo_name = f"{owner}/{repo_slug}"
-        logger.info(f"Accessing repository: {repo_name}")
-        
-        repo = g.get_repo(repo_name)
-        
-        logger.info(f"Fetching PR #{pr_number}")
-        pr = repo.get_pull(pr_number)
-        
-        # *** ADDED THIS LINE ***
-        # Access an attribute to force an API call and confirm the PR exists.
-        # If it doesn't, this will raise UnknownObjectException.
-        _ = pr.title 
-        
-        # Check if the PR is a draft, as they don't have a diff_url that works.
-        if pr.draft:
-            error_msg = f"Pull Request #{pr_number} in repository '{repo_name}' is a draft. Draft PRs cannot be analyzed."
-            raise GitHubConnectionError(error_msg)
-
-        headers = {'Accept': 'application/vnd.github.v3.diff'}
-        if token:
-            headers['Authorization'] = f'token {token}'
-        
-        # Now we are more confident that pr.diff_url will point to a valid resource
-        response = requests.get(pr.diff_url, headers=headers)
-        response.raise_for_status() # Will raise an HTTPError for bad responses (4xx or 5xx)
-        
-        diff = response.text
-        logger.info(f"Successfully fetched diff for PR #{pr_number}")
-        return diff
-        
-    except UnknownObjectException:
+        repo_name = parse_repo_name(repo_url)
+        logger.info(f"Fetching PR #{pr_number} from repository: {repo_name}")
+        return get_github_client(token).get_json(f"/repos/{repo_name}/pulls/{pr_number}", wait=wait)
+    except Exception as e:
+        raise _to_connection_error(e, repo_name, pr_number) from e
+
+def list_open_prs(repo_url: str, token: str | None = None, base: str | None = None, wait: bool = True) -> List[dict]:
+    """
+    Lists the open Pull Requests of a repository (optionally only those targeting
+    `base`), 100 per request, up to BULK_MAX_PRS. Each entry has the head SHA and
+    draft flag, so the PRs need no further metadata requests. `wait` is as for
+    get_pr_metadata().
+    """
+    repo_name = None
+    try:
+        repo_name = parse_repo_name(repo_url)
+        client = get_github_client(token)
+        params = {"state": "open", "per_page": PAGE_SIZE}
+        if base:
+            params["base"] = base
+        prs: List[dict] = []
+        page = 1
+        while len(prs) < settings.BULK_MAX_PRS:
+            batch = client.get_json(f"/repos/{repo_name}/pulls", params={**params, "page": page}, wait=wait)
+            prs.extend(batch)
+            if len(batch) < PAGE_SIZE:
+                break
+            page += 1
+        logger.info(f"Found {len(prs)} open PR(s) in {repo_name} in {page} request(s).")
+        return prs[:settings.BULK_MAX_PRS]
+    except Exception as e:
+        if isinstance(e, GitHubAPIError) and e.status_code == 404:
+            raise GitHubConnectionError(f"Repository '{repo_name}' not found. Please check the URL and your token permissions for private repos.") from e
+        raise _to_connection_error(e, repo_name, 0) from e
+
+def fetch_pr_diff(repo_url: str, pr_number: int, token: str | None = None, head_sha: str | None = None) -> PRDiff:
+    """
+    Fetches the diff of a specific GitHub Pull Request along with its head SHA.
+    Callers that already have the head SHA (from a PR listing or a webhook) pass
+    it and are responsible for leaving out drafts. The download is always taken
+    at the PR's current head, so the head is read again once it is done (a
+    conditional request, free while the PR is unchanged): if the PR moved, the
+    diff is downloaded again at the new head rather than stored under the old one.
+    With DIFF_SOURCE set to "git", the diff is computed in a local mirror of the
+    repository instead, falling back to the download if git fails.
+    """
+    if settings.DIFF_SOURCE == "git":
+        try:
+            return _fetch_pr_diff_from_mirror(repo_url, pr_number, token, head_sha)
+        except GitMirrorError as e:
+            logger.warning(f"Could not compute the diff of PR #{pr_number} locally, downloading it instead: {e}")
+
+    is_draft = False
+    # A head passed by the caller may be stale by the time the download is done
+    verify_head = head_sha is not None
+    if head_sha is None:
+        pr = get_pr_metadata(repo_url, pr_number, token)
+        head_sha = pr["head"]["sha"]
+        is_draft = pr.get("draft", False)
+    try:
+        repo_name = parse_repo_name(repo_url)
+    except ValueError as e:
+        raise _to_connection_error(e, None, pr_number) from e
+
+    # Check if the PR is a draft, as they don't have a diff_url that works.
+    if is_draft:
+        error_msg = f"Pull Request #{pr_number} in repository '{repo_name}' is a draft. Draft PRs cannot be analyzed."
+        logger.error(error_msg)
+        raise GitHubConnectionError(error_msg)
+
+    # The diff is streamed to a spooled temp file and parsed file by file, so
+    # huge diffs never sit in memory as a whole; oversized, generated and binary
+    # files are dropped before they reach the analyzer.
+    for _ in range(DIFF_DOWNLOAD_ATTEMPTS):
+        try:
+            spool, truncated = get_github_client(token).download(
+                f"/repos/{repo_name}/pulls/{pr_number}", accept=DIFF_MEDIA_TYPE, max_bytes=settings.DIFF_MAX_BYTES
+            )
+        except Exception as e:
+            raise _to_connection_error(e, repo_name, pr_number) from e
+        if not verify_head:
+            return _read_diff(spool, truncated, pr_number, head_sha)
+        current_head = get_pr_metadata(repo_url, pr_number, token)["head"]["sha"]
+        if current_head == head_sha:
+            return _read_diff(spool, truncated, pr_number, head_sha)
+        spool.close()
+        logger.info(f"PR #{pr_number} moved from {head_sha[:7]} to {current_head[:7]}, downloading its diff again.")
+        head_sha = current_head
+
+    error_msg = f"The head of Pull Request #{pr_number} in repository '{repo_name}' kept changing while its diff was downloaded."
+    logger.error(error_msg)
+    raise GitHubConnectionError(error_msg)
+
+def _fetch_pr_diff_from_mirror(repo_url: str, pr_number: int, token: str | None, head_sha: str | None) -> PRDiff:
+    """
+    Computes the diff of a Pull Request in the local mirror of its repository.
+    The metadata request gives the base branch; it is conditional, so for an
+    unchanged PR it costs no rate limit.
+    """
+    pr = get_pr_metadata(repo_url, pr_number, token)
+    repo_name = parse_repo_name(repo_url)
+    if pr.get("draft"):
+        error_msg = f"Pull Request #{pr_number} in repository '{repo_name}' is a draft. Draft PRs cannot be analyzed."
+        logger.error(error_msg)
+        raise GitHubConnectionError(error_msg)
+
+    clone_url = settings.GIT_CLONE_URL_TEMPLATE.format(repo=repo_name)
+    path, base, head = fetch_pr_refs(
+        clone_url, pr_number, pr["base"]["ref"], head_sha or pr["head"]["sha"], token or None
+    )
+    spool, truncated = diff_to_file(path, base, head, settings.GIT_DIFF_CONTEXT_LINES, settings.DIFF_MAX_BYTES)
+    return _read_diff(spool, truncated, pr_number, head)
+
+def _read_diff(spool: BinaryIO, truncated: bool, pr_number: int, head_sha: str) -> PRDiff:
+    """Parses a diff file, keeping only the reviewable files."""
+    with spool:
+        file_diffs = iter_file_diffs(
+            iter_file_lines(spool), max_file_bytes=settings.DIFF_MAX_FILE_BYTES, input_truncated=truncated
+        )
+        files, skipped_files = select_reviewable_files(file_diffs, settings.DIFF_MAX_FILES, settings.DIFF_MAX_FILE_BYTES)
+
+    if truncated:
+        logger.warning(f"Diff for PR #{pr_number} exceeded {settings.DIFF_MAX_BYTES} bytes and was truncated.")
+    if skipped_files:
+        logger.info(f"Skipping {len(skipped_files)} file(s) in PR #{pr_number}: {', '.join(skipped_files[:20])}")
+
+    logger.info(f"Successfully fetched diff for PR #{pr_number}")
+    return PRDiff(head_sha=head_sha, files=files, skipped_files=skipped_files)
+
+def _to_connection_error(e: Exception, repo_name: str | None, pr_number: int) -> GitHubConnectionError:
+    """Translates client errors into the GitHubConnectionError raised to callers."""
+    if isinstance(e, GitHubConnectionError):
+        return e
+    if isinstance(e, GitHubRateLimited):
+        logger.warning(e.message)
+        return GitHubRateLimitError(e.message, e.retry_after)
+    if isinstance(e, GitHubAPIError) and e.status_code == 404:
         if repo_name:
             error_msg = f"Repository '{repo_name}' or PR '#{pr_number}' not found. Please check the URL, PR number, and your token permissions for private repos."
         else:
             error_msg = f"Could not find the requested repository or PR '#{pr_number}'. Please check the URL."
-        logger.error(error_msg)
-        raise GitHubConnectionError(error_msg)
-        
-    except GithubException as e:
-        error_msg = f"An error occurred with the GitHub API: {e.data.get('message', 'Unknown error')}"
-        logger.error(error_msg)
-        raise GitHubConnectionError(error_msg) from e
-        
-    except Exception as e:
-        # Catch requests.exceptions.HTTPError here as well
+    elif isinstance(e, GitHubAPIError):
+        error_msg = f"An error occurred with the GitHub API: {e.message}"
+    else:
+        # Covers requests' connection errors and malformed URLs as well
         error_msg = f"An unexpected error occurred: {e}"
-        logger.error(error_msg)
-        raise GitHubConnectionError(error_msg) from e
\ No newline at end of file
+    logger.error(error_msg)
+    return GitHubConnectionError(error_msg)
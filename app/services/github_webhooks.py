@@ -0,0 +1,87 @@
+"""
+GitHub webhook ingestion: signature verification and debouncing of pushes.
+
+Each webhook-triggered review is scheduled with a countdown, and Redis records
+the latest head SHA (and its task) of every PR. A push within the countdown
+supersedes the scheduled review: the old task is revoked, and a task that
+starts anyway (e.g. on a worker that missed the revoke) sees that its head is
+no longer the latest and skips the review. A burst of fixup pushes therefore
+costs one review, of the last head.
+"""
+import hashlib
+import hmac
+import logging
+from typing import Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "pr-latest"
+
+# Pull request actions that put a new head up for review
+REVIEW_ACTIONS = {"opened", "reopened", "synchronize", "ready_for_review"}
+
+# Recorded as the latest head of a closed PR; it matches no commit.
+CLOSED_HEAD = ""
+
+# Records a new head for a PR unless it is already the latest (a redelivered
+# event). Returns the head and task ID recorded before, if any.
+SET_LATEST_SCRIPT = """
+local previous = redis.call('hmget', KEYS[1], 'head_sha', 'task_id')
+if previous[1] ~= ARGV[1] then
+    redis.call('hset', KEYS[1], 'head_sha', ARGV[1], 'task_id', ARGV[2])
+end
+redis.call('expire', KEYS[1], ARGV[3])
+return previous
+"""
+
+
+def verify_signature(secret: str, body: bytes, signature_header: Optional[str]) -> bool:
+    """Checks the X-Hub-Signature-256 header of a delivery against the webhook secret."""
+    if not secret or not signature_header or not signature_header.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len("sha256="):])
+
+
+def _latest_key(repo_url: str, pr_number: int) -> str:
+    repo = repo_url.rstrip("/").lower()
+    digest = hashlib.sha256(f"{repo}\0{pr_number}".encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+async def set_latest_head(
+    repo_url: str, pr_number: int, head_sha: str, task_id: str
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Records `head_sha`, to be reviewed by `task_id`, as the latest head of a PR.
+    Returns the previously recorded (head SHA, task ID); if that head equals
+    `head_sha`, nothing was changed.
+    """
+    head, task = await get_async_redis().eval(
+        SET_LATEST_SCRIPT, 1, _latest_key(repo_url, pr_number),
+        head_sha, task_id, settings.PR_LATEST_HEAD_TTL_SECONDS,
+    )
+    return (head.decode() if head else None), (task.decode() if task else None)
+
+
+async def mark_pr_closed(repo_url: str, pr_number: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Records that a PR was closed, so any review still scheduled for it is
+    skipped. Returns the previously recorded (head SHA, task ID).
+    """
+    return await set_latest_head(repo_url, pr_number, CLOSED_HEAD, "")
+
+
+def is_superseded(repo_url: str, pr_number: int, head_sha: str) -> bool:
+    """Tells whether a newer head than `head_sha` has been pushed to the PR since it was scheduled."""
+    try:
+        latest = get_redis().hget(_latest_key(repo_url, pr_number), "head_sha")
+    except redis.RedisError as e:
+        logger.warning(f"Could not check the latest head of {repo_url} PR #{pr_number}: {e}")
+        return False
+    return latest is not None and latest.decode() != head_sha
@@ -0,0 +1,155 @@
+"""
+Hunk-level cache of review findings, shared across PRs.
+
+The same hunk often comes back: after a rebase, in a backport or a cherry-pick
+to another branch, or in a PR that changes one file of forty. Findings are
+therefore also stored per hunk, under a fingerprint of its normalized content
+(line markers and whitespace-collapsed text, so line offsets and re-indentation
+don't matter) plus the file extension, model and prompt version. Before any LLM
+call, the hunks found in the cache are taken out of the diff, and their findings
+are re-based onto the hunk's new position: each finding is stored with its
+offset from the hunk's first new line rather than an absolute line number.
+"""
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUPS
+from app.core.redis_client import get_redis
+from app.models.analysis import FileAnalysis, Issue
+from app.services.diff_parser import FileDiff, Hunk
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "hunk-cache"
+
+
+@dataclass
+class HunkLookup:
+    """The outcome of looking up the hunks of a diff in the cache."""
+    # File diffs holding only the hunks that still need a review
+    pending: List[FileDiff] = field(default_factory=list)
+    # Re-based findings of the cached hunks
+    cached_files: List[FileAnalysis] = field(default_factory=list)
+    # Cache keys of the pending hunks, by path, to store their findings under
+    pending_keys: Dict[str, List[Tuple[Hunk, str]]] = field(default_factory=dict)
+    hits: int = 0
+
+
+def normalize_hunk(hunk: Hunk) -> str:
+    """Hunk content without line numbers, with whitespace collapsed and blank lines dropped."""
+    normalized = []
+    for line in hunk.lines:
+        text = " ".join(line[1:].split())
+        if text:
+            normalized.append(f"{line[:1]}{text}")
+    return "\n".join(normalized)
+
+
+def make_hunk_key(hunk: Hunk, path: str, model: str, prompt_version: str) -> str:
+    """Builds the cache key of a hunk reviewed with a given model and prompt."""
+    _, extension = os.path.splitext(path)
+    digest = hashlib.sha256()
+    digest.update(f"{model}\0{prompt_version}\0{extension.lower()}\0".encode("utf-8"))
+    digest.update(normalize_hunk(hunk).encode("utf-8"))
+    return f"{KEY_PREFIX}:{digest.hexdigest()}"
+
+
+def _contains(hunk: Hunk, line: int) -> bool:
+    return hunk.new_start <= line < hunk.new_start + max(hunk.new_count, 1)
+
+
+def lookup_hunks(
+    file_diffs: List[FileDiff],
+    model_for: Callable[[FileDiff], Optional[str]],
+    prompt_version: str,
+) -> HunkLookup:
+    """
+    Splits file diffs into the hunks still to review and the re-based findings
+    of cached ones, with a single MGET. `model_for` returns the model a file is
+    reviewed with, or None for files that never reach the LLM (not cached).
+    Cache failures are logged and treated as misses.
+    """
+    lookup = HunkLookup()
+    keyed: List[Tuple[FileDiff, List[str]]] = []
+    for file_diff in file_diffs:
+        model = model_for(file_diff)
+        if model is None:
+            lookup.pending.append(file_diff)
+            continue
+        keyed.append((file_diff, [make_hunk_key(hunk, file_diff.path, model, prompt_version) for hunk in file_diff.hunks]))
+
+    all_keys = [key for _, keys in keyed for key in keys]
+    raw_entries: List[Optional[bytes]] = [None] * len(all_keys)
+    if all_keys:
+        try:
+            raw_entries = get_redis().mget(all_keys)
+        except redis.RedisError as e:
+            logger.warning(f"Hunk cache lookup failed, reviewing every hunk: {e}")
+
+    entries = iter(raw_entries)
+    for file_diff, keys in keyed:
+        pending_hunks: List[Hunk] = []
+        issues: List[Issue] = []
+        for hunk, key in zip(file_diff.hunks, keys):
+            raw = next(entries)
+            if raw is None:
+                pending_hunks.append(hunk)
+                lookup.pending_keys.setdefault(file_diff.path, []).append((hunk, key))
+                continue
+            lookup.hits += 1
+            issues.extend(
+                Issue(
+                    type=finding["type"], line=hunk.new_start + finding["offset"],
+                    description=finding["description"], suggestion=finding["suggestion"],
+                )
+                for finding in json.loads(raw)
+            )
+        if issues:
+            lookup.cached_files.append(FileAnalysis(name=file_diff.path, issues=issues))
+        if pending_hunks:
+            lookup.pending.append(
+                FileDiff(path=file_diff.path, header_lines=list(file_diff.header_lines), hunks=pending_hunks)
+            )
+
+    CACHE_LOOKUPS.labels(cache="hunk", result="hit").inc(lookup.hits)
+    CACHE_LOOKUPS.labels(cache="hunk", result="miss").inc(len(all_keys) - lookup.hits)
+    return lookup
+
+
+def store_hunk_findings(lookup: HunkLookup, files: List[FileAnalysis]) -> None:
+    """
+    Stores the findings of the reviewed (pending) hunks, each attributed to the
+    hunk containing its line; hunks without findings are stored as clean.
+    Findings outside any reviewed hunk are not cached. Nothing is stored if the
+    result names a file that was not reviewed, since attribution would be unreliable.
+    """
+    if not lookup.pending_keys:
+        return
+    unknown = {file.name for file in files} - set(lookup.pending_keys)
+    if unknown:
+        logger.warning(f"Review named files not present in the diff ({sorted(unknown)}); not caching hunk findings.")
+        return
+
+    issues_by_path = {file.name: file.issues for file in files}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for path, hunks in lookup.pending_keys.items():
+            for hunk, key in hunks:
+                findings = [
+                    {
+                        "type": issue.type, "offset": issue.line - hunk.new_start,
+                        "description": issue.description, "suggestion": issue.suggestion,
+                    }
+                    for issue in issues_by_path.get(path, []) if _contains(hunk, issue.line)
+                ]
+                pipe.set(key, json.dumps(findings), ex=settings.HUNK_CACHE_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Failed to store hunk findings in cache: {e}")
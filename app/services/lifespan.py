@@ -0,0 +1,17 @@
+"""
+Background jobs of the API, started and stopped with the application.
+"""
+from contextlib import asynccontextmanager
+
+from app.services.fair_scheduler import dispatcher_lifespan
+from app.services.result_archiver import archiver_lifespan
+
+
+@asynccontextmanager
+async def api_lifespan(app):
+    """
+    FastAPI lifespan running the result archiver and, with FAIR_SCHEDULING,
+    the dispatcher of pending analyses.
+    """
+    async with archiver_lifespan(app), dispatcher_lifespan(app):
+        yield
@@ -0,0 +1,172 @@
+"""
+Deterministic checks run on the parsed diff before the LLM review.
+
+Trivial findings (whitespace, missing final newline, long lines, Python syntax
+errors) are found here for free instead of by the model, and the review prompt
+tells the model to skip these categories, which keeps its prompts and outputs
+smaller. Checks are plain functions registered with `@register_check`; each
+takes a FileDiff and yields issues as dicts with the fields of an Issue.
+
+Large diffs are checked in a process pool. Its processes are spawned rather
+than forked, since workers run client threads (and, in async mode, an event
+loop) that must not be forked mid-flight; checks registered outside this module
+therefore only run in the pool if importing this module registers them.
+Processes that are not allowed to have children (e.g. daemonic Celery prefork
+workers) check them in-process.
+"""
+import ast
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.diff_parser import FileDiff
+
+logger = logging.getLogger(__name__)
+
+CheckFunc = Callable[[FileDiff], Iterable[dict]]
+
+
+@dataclass(frozen=True)
+class Check:
+    """A registered pre-check and the finding category it covers."""
+    name: str
+    category: str  # Told to the LLM, which then skips this kind of finding
+    func: CheckFunc
+
+
+_checks: List[Check] = []
+
+
+def register_check(name: str, category: str) -> Callable[[CheckFunc], CheckFunc]:
+    """Registers a function as a pre-check covering `category`."""
+    def decorator(func: CheckFunc) -> CheckFunc:
+        _checks.append(Check(name=name, category=category, func=func))
+        return func
+    return decorator
+
+
+def registered_checks() -> List[Check]:
+    return list(_checks)
+
+
+def _issue(issue_type: str, line: int, description: str, suggestion: str) -> dict:
+    return {"type": issue_type, "line": line, "description": description, "suggestion": suggestion}
+
+
+def added_lines(file_diff: FileDiff) -> Iterator[Tuple[int, str]]:
+    """Yields (line number in the new file, content) for every added line."""
+    for hunk in file_diff.hunks:
+        new_line = hunk.new_start
+        for line in hunk.lines:
+            marker = line[:1]
+            if marker == "+":
+                yield new_line, line[1:]
+            if marker in (" ", "", "+"):
+                new_line += 1
+
+
+def _is_new_file(file_diff: FileDiff) -> bool:
+    return any(line.startswith("new file mode") or line == "--- /dev/null" for line in file_diff.header_lines)
+
+
+@register_check("trailing-whitespace", "trailing whitespace")
+def check_trailing_whitespace(file_diff: FileDiff) -> Iterator[dict]:
+    for line_number, content in added_lines(file_diff):
+        if content != content.rstrip(" \t"):
+            yield _issue("style", line_number, "Trailing whitespace.", "Remove the whitespace at the end of the line.")
+
+
+@register_check("final-newline", "a missing newline at the end of the file")
+def check_final_newline(file_diff: FileDiff) -> Iterator[dict]:
+    # Git marks a last line without a newline with "\ No newline at end of file";
+    # only the new side (the marker following an added or context line) matters.
+    for hunk in file_diff.hunks:
+        new_line = hunk.new_start
+        previous = None
+        for line in hunk.lines:
+            if line.startswith("\\") and previous in ("+", " ", ""):
+                yield _issue(
+                    "style", new_line - 1, "The file does not end with a newline.",
+                    "Add a newline after the last line.",
+                )
+            marker = line[:1]
+            if marker in (" ", "", "+"):
+                new_line += 1
+            if marker != "\\":
+                previous = marker
+
+
+@register_check("line-length", "lines that are too long")
+def check_line_length(file_diff: FileDiff) -> Iterator[dict]:
+    max_length = settings.PRECHECK_MAX_LINE_LENGTH
+    for line_number, content in added_lines(file_diff):
+        if len(content) > max_length:
+            yield _issue(
+                "style", line_number, f"Line is {len(content)} characters long (limit {max_length}).",
+                "Break the line into multiple lines.",
+            )
+
+
+@register_check("python-syntax", "Python syntax errors")
+def check_python_syntax(file_diff: FileDiff) -> Iterator[dict]:
+    # Only new files are complete in the diff; hunks of other files don't parse on their own.
+    if not file_diff.path.endswith(".py") or not _is_new_file(file_diff):
+        return
+    source = "\n".join(content for _, content in added_lines(file_diff))
+    try:
+        ast.parse(source, filename=file_diff.path)
+    except SyntaxError as e:
+        yield _issue("bug", e.lineno or 1, f"Syntax error: {e.msg}.", "Fix the syntax so the module can be imported.")
+
+
+def check_file(file_diff: FileDiff) -> List[dict]:
+    """Runs every registered check on a file diff."""
+    issues: List[dict] = []
+    for check in _checks:
+        try:
+            issues.extend(check.func(file_diff))
+        except Exception as e:
+            logger.warning(f"Pre-check {check.name} failed on {file_diff.path}: {e}")
+    return sorted(issues, key=lambda issue: issue["line"])
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PRECHECK_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    """Stops the process pool, if one was started; the next large diff starts a new one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_prechecks(file_diffs: List[FileDiff]) -> Dict[str, List[dict]]:
+    """Runs the pre-checks on every file and returns the issues found, by path."""
+    if len(file_diffs) >= settings.PRECHECK_POOL_MIN_FILES:
+        try:
+            chunksize = max(1, len(file_diffs) // (settings.PRECHECK_PROCESSES * 4))
+            results = list(_get_pool().map(check_file, file_diffs, chunksize=chunksize))
+        except Exception as e:
+            # e.g. "daemonic processes are not allowed to have children"
+            logger.warning(f"Pre-check process pool unavailable, checking in-process: {e}")
+            results = [check_file(file_diff) for file_diff in file_diffs]
+    else:
+        results = [check_file(file_diff) for file_diff in file_diffs]
+    return {file_diff.path: issues for file_diff, issues in zip(file_diffs, results) if issues}
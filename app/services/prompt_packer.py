@@ -0,0 +1,116 @@
+"""
+Token-budget-aware preparation of review prompts.
+
+Before anything is sent to the LLM, each file diff is:
+- classified into a review tier: files without changed lines (pure renames and
+  mode changes) are handled by rules and never reach the LLM; docs and config
+  files, and changes that only delete lines, go to a cheaper model; other code
+  changes go to the main model;
+- trimmed to a configurable number of context lines around each change;
+- packed together with other small files of the same tier into prompts of up
+  to a token budget, so a PR of many tiny files costs a few calls instead of one per file.
+"""
+import math
+import os
+from typing import List
+
+from app.services.diff_parser import FileDiff, Hunk
+
+TIER_RULES = "rules"  # No LLM call; produces no findings
+TIER_LIGHT = "light"  # Cheaper, faster model
+TIER_FULL = "full"  # Main model
+
+# Extensions of files whose changes are reviewed by the cheaper model
+LIGHT_EXTENSIONS = {
+    ".md", ".rst", ".txt", ".adoc",
+    ".yml", ".yaml", ".json", ".toml", ".ini", ".cfg", ".conf", ".env", ".properties",
+    ".csv", ".svg",
+}
+LIGHT_FILENAMES = {"LICENSE", "CODEOWNERS", "Dockerfile", ".gitignore", ".dockerignore", ".editorconfig"}
+
+# Average characters per token for source code and English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting; no tokenizer round-trip needed."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def classify_file(file_diff: FileDiff) -> str:
+    """Returns the review tier of a file diff."""
+    markers = {line[:1] for hunk in file_diff.hunks for line in hunk.lines}
+    if not markers & {"+", "-"}:
+        # Renames and mode changes: no line to review.
+        return TIER_RULES
+
+    filename = os.path.basename(file_diff.path)
+    _, extension = os.path.splitext(filename)
+    if extension.lower() in LIGHT_EXTENSIONS or filename in LIGHT_FILENAMES:
+        return TIER_LIGHT
+    if "+" not in markers:
+        # Removing a null check, an auth guard or a lock can still break things,
+        # but there is no new code to judge, so the cheaper model is enough.
+        return TIER_LIGHT
+    return TIER_FULL
+
+
+def trim_context(file_diff: FileDiff, context_lines: int) -> FileDiff:
+    """
+    Returns a copy of the file diff keeping at most `context_lines` unchanged
+    lines around each change. Hunks are split where context was dropped, with
+    their headers recomputed so line numbers stay correct.
+    """
+    trimmed_hunks: List[Hunk] = []
+    for hunk in file_diff.hunks:
+        changed = [i for i, line in enumerate(hunk.lines) if line[:1] in ("+", "-")]
+        keep = set()
+        for i in changed:
+            keep.update(range(max(0, i - context_lines), min(len(hunk.lines), i + context_lines + 1)))
+        # "\ No newline at end of file" markers belong to the line before them
+        keep.update(i for i, line in enumerate(hunk.lines) if line.startswith("\\") and i - 1 in keep)
+
+        old_line, new_line = hunk.old_start, hunk.new_start
+        current = None
+        for i, line in enumerate(hunk.lines):
+            marker = line[:1]
+            if i in keep:
+                if current is None:
+                    current = Hunk(header="", old_start=old_line, old_count=0, new_start=new_line, new_count=0)
+                    trimmed_hunks.append(current)
+                current.lines.append(line)
+                if marker in (" ", "", "-"):
+                    current.old_count += 1
+                if marker in (" ", "", "+"):
+                    current.new_count += 1
+            else:
+                current = None
+            if marker in (" ", "", "-"):
+                old_line += 1
+            if marker in (" ", "", "+"):
+                new_line += 1
+
+    for hunk in trimmed_hunks:
+        hunk.header = f"@@ -{hunk.old_start},{hunk.old_count} +{hunk.new_start},{hunk.new_count} @@"
+
+    return FileDiff(path=file_diff.path, header_lines=list(file_diff.header_lines), hunks=trimmed_hunks)
+
+
+def pack_chunks(chunks: List[str], token_budget: int) -> List[str]:
+    """
+    Packs consecutive chunks into prompts of at most `token_budget` estimated
+    tokens. A chunk larger than the budget on its own becomes its own prompt.
+    """
+    prompts: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if current and current_tokens + tokens > token_budget:
+            prompts.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(chunk)
+        current_tokens += tokens
+    if current:
+        prompts.append("\n".join(current))
+    return prompts
@@ -0,0 +1,252 @@
+"""
+Distributed rate limiting of LLM calls across all workers.
+
+Every call first takes one request from a requests-per-minute bucket and its
+estimated tokens from a tokens-per-minute bucket. Both buckets live in Redis
+and are updated by a single Lua script, so all worker processes share the
+provider quota. Once the call completes, the estimate is settled against the
+tokens actually used.
+
+The bucket sizes are scaled by an adaptive multiplier (AIMD): a 429/503 from
+the provider halves it, at most once per cooldown window however many workers
+saw the error, and every successful call adds a small step back. Throughput
+settles just under the real quota instead of oscillating around it.
+
+Every function has an `a`-prefixed variant for the event loop of a worker in
+async mode, which must not block on Redis round-trips.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "llm-rate"
+
+# Buckets refill continuously; idle buckets expire and start full again.
+BUCKET_TTL_MS = 120_000
+# An idle limiter forgets past throttling and starts at the full rate.
+MULTIPLIER_TTL_SECONDS = 600
+
+# KEYS: request bucket, token bucket, rate multiplier
+# ARGV: now (ms), requests per minute, tokens per minute, tokens requested
+# Returns 0 if the request was admitted, else the milliseconds to wait.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local multiplier = tonumber(redis.call('get', KEYS[3]) or '1')
+local specs = {{KEYS[1], tonumber(ARGV[2]), 1}, {KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[4])}}
+local levels = {}
+local wait = 0
+for i, spec in ipairs(specs) do
+    local capacity = spec[2] * multiplier
+    local rate = capacity / 60000
+    local bucket = redis.call('hmget', spec[1], 'level', 'ts')
+    local level = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    -- A request larger than the whole bucket is admitted once the bucket is full.
+    local needed = math.min(spec[3], capacity)
+    if level < needed then
+        wait = math.max(wait, math.ceil((needed - level) / rate))
+    end
+    levels[i] = level
+end
+if wait > 0 then
+    return wait
+end
+for i, spec in ipairs(specs) do
+    redis.call('hset', spec[1], 'level', tostring(levels[i] - spec[3]), 'ts', tostring(now))
+    redis.call('pexpire', spec[1], ARGV[5])
+end
+return 0
+"""
+
+# KEYS: rate multiplier, cooldown marker
+# ARGV: minimum multiplier, cooldown (ms), multiplier TTL (s)
+THROTTLED_SCRIPT = """
+if not redis.call('set', KEYS[2], '1', 'NX', 'PX', ARGV[2]) then
+    return redis.call('get', KEYS[1]) or '1'
+end
+local multiplier = tonumber(redis.call('get', KEYS[1]) or '1')
+multiplier = math.max(tonumber(ARGV[1]), multiplier / 2)
+redis.call('set', KEYS[1], tostring(multiplier), 'EX', ARGV[3])
+return tostring(multiplier)
+"""
+
+# KEYS: rate multiplier
+# ARGV: increase step
+SUCCESS_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if not current then
+    return '1'
+end
+local multiplier = math.min(1, tonumber(current) + tonumber(ARGV[1]))
+redis.call('set', KEYS[1], tostring(multiplier), 'KEEPTTL')
+return tostring(multiplier)
+"""
+
+
+# KEYS: token bucket
+# ARGV: tokens to give back (negative to take more)
+# Only adjusts a live bucket; an expired one has refilled completely anyway.
+SETTLE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('hincrbyfloat', KEYS[1], 'level', ARGV[1])
+end
+return 0
+"""
+
+
+class LLMRateLimitError(Exception):
+    """Raised when an LLM call is throttled, or cannot be admitted within the maximum wait."""
+    pass
+
+
+def _keys(model: str):
+    prefix = f"{KEY_PREFIX}:{model}"
+    return f"{prefix}:requests", f"{prefix}:tokens", f"{prefix}:multiplier", f"{prefix}:cooldown"
+
+
+def _acquire_args(model: str, tokens: int) -> tuple:
+    requests_key, tokens_key, multiplier_key, _ = _keys(model)
+    return (
+        ACQUIRE_SCRIPT, 3, requests_key, tokens_key, multiplier_key,
+        int(time.time() * 1000), settings.LLM_REQUESTS_PER_MINUTE,
+        settings.LLM_TOKENS_PER_MINUTE, tokens, BUCKET_TTL_MS,
+    )
+
+
+def _next_wait(model: str, wait_ms: int, deadline: float, max_wait: float) -> float:
+    """Seconds to wait before trying again; raises LLMRateLimitError past the deadline."""
+    # Jitter spreads out the workers that were all waiting for the same refill.
+    wait = wait_ms / 1000 * (1 + random.uniform(0, 0.1))
+    if time.monotonic() + wait > deadline:
+        raise LLMRateLimitError(f"LLM rate limit for {model} exceeded; no capacity within {max_wait:.0f}s.")
+    logger.debug(f"Waiting {wait:.2f}s for LLM capacity for {model}.")
+    return wait
+
+
+def acquire(model: str, tokens: int, max_wait: Optional[float] = None) -> None:
+    """
+    Blocks until a call of about `tokens` tokens to `model` fits in the shared
+    rate limits. Raises LLMRateLimitError if that would take longer than
+    `max_wait` seconds, so the task can wait on the queue instead of a worker.
+    """
+    if max_wait is None:
+        max_wait = settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            wait_ms = get_redis().eval(*_acquire_args(model, tokens))
+        except redis.RedisError as e:
+            # Never block reviews on the limiter itself; the provider still enforces its quota.
+            logger.warning(f"LLM rate limiter unavailable, proceeding without it: {e}")
+            return
+        if not wait_ms:
+            return
+        time.sleep(_next_wait(model, wait_ms, deadline, max_wait))
+
+
+async def aacquire(model: str, tokens: int, max_wait: Optional[float] = None) -> None:
+    """Like acquire(), but waits on the event loop instead of blocking the thread."""
+    if max_wait is None:
+        max_wait = settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS
+    deadline = time.monotonic() + max_wait
+    while True:
+        try:
+            wait_ms = await get_async_redis().eval(*_acquire_args(model, tokens))
+        except redis.RedisError as e:
+            logger.warning(f"LLM rate limiter unavailable, proceeding without it: {e}")
+            return
+        if not wait_ms:
+            return
+        await asyncio.sleep(_next_wait(model, wait_ms, deadline, max_wait))
+
+
+def _settle_args(model: str, reserved_tokens: int, used_tokens: int) -> tuple:
+    _, tokens_key, _, _ = _keys(model)
+    return SETTLE_SCRIPT, 1, tokens_key, reserved_tokens - used_tokens
+
+
+def settle(model: str, reserved_tokens: int, used_tokens: int) -> None:
+    """Corrects the token bucket once the actual token usage of a call is known."""
+    if used_tokens == reserved_tokens:
+        return
+    try:
+        get_redis().eval(*_settle_args(model, reserved_tokens, used_tokens))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to settle LLM token usage for {model}: {e}")
+
+
+async def asettle(model: str, reserved_tokens: int, used_tokens: int) -> None:
+    """Like settle(), on the event loop."""
+    if used_tokens == reserved_tokens:
+        return
+    try:
+        await get_async_redis().eval(*_settle_args(model, reserved_tokens, used_tokens))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to settle LLM token usage for {model}: {e}")
+
+
+def _throttled_args(model: str) -> tuple:
+    _, _, multiplier_key, cooldown_key = _keys(model)
+    return (
+        THROTTLED_SCRIPT, 2, multiplier_key, cooldown_key,
+        settings.LLM_MIN_RATE_MULTIPLIER, int(settings.LLM_THROTTLE_COOLDOWN_SECONDS * 1000),
+        MULTIPLIER_TTL_SECONDS,
+    )
+
+
+def _log_throttled(model: str, multiplier: float) -> float:
+    logger.warning(f"LLM provider throttled {model}; rate multiplier is now {multiplier:.2f}.")
+    return multiplier
+
+
+def record_throttled(model: str) -> float:
+    """Backs off the shared rate of `model` after a 429/503. Returns the new multiplier."""
+    try:
+        multiplier = float(get_redis().eval(*_throttled_args(model)))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record LLM throttling for {model}: {e}")
+        return 1.0
+    return _log_throttled(model, multiplier)
+
+
+async def arecord_throttled(model: str) -> float:
+    """Like record_throttled(), on the event loop."""
+    try:
+        multiplier = float(await get_async_redis().eval(*_throttled_args(model)))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record LLM throttling for {model}: {e}")
+        return 1.0
+    return _log_throttled(model, multiplier)
+
+
+def _success_args(model: str) -> tuple:
+    _, _, multiplier_key, _ = _keys(model)
+    return SUCCESS_SCRIPT, 1, multiplier_key, settings.LLM_RATE_INCREASE_STEP
+
+
+def record_success(model: str) -> float:
+    """Recovers part of the shared rate of `model` after a successful call. Returns the new multiplier."""
+    try:
+        return float(get_redis().eval(*_success_args(model)))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record LLM success for {model}: {e}")
+        return 1.0
+
+
+async def arecord_success(model: str) -> float:
+    """Like record_success(), on the event loop."""
+    try:
+        return float(await get_async_redis().eval(*_success_args(model)))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to record LLM success for {model}: {e}")
+        return 1.0
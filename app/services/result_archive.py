@@ -0,0 +1,105 @@
+"""
+SQLite archive of old task results on the API's disk.
+
+Task metadata is moved here from the Celery result backend once it is older
+than RESULTS_ARCHIVE_AFTER_SECONDS (see app.services.result_archiver), so Redis,
+which is shared with the broker and evicts under memory pressure, only holds
+recent results. Entries keep the status, result, completion time and traceback
+in the format Celery stores (compressed JSON for large results), leaving out the
+task's arguments, and are read back transparently by app.services.task_meta, until
+they are RESULTS_ARCHIVE_RETENTION_SECONDS old and the archiver deletes them.
+
+With several API instances, RESULTS_ARCHIVE_PATH must be on a shared volume.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_meta (
+    task_id TEXT PRIMARY KEY,
+    meta BLOB NOT NULL,
+    archived_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_meta_archived_at ON task_meta (archived_at);
+"""
+
+# SQLite limits the number of bound parameters per statement
+MAX_QUERY_IDS = 500
+
+
+class ResultArchive:
+    """Task metadata by task ID, in a SQLite database."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    directory = os.path.dirname(self._path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    with sqlite3.connect(self._path) as connection:
+                        # Readers don't block the archiver (and vice versa)
+                        connection.execute("PRAGMA journal_mode=WAL")
+                        connection.executescript(SCHEMA)
+                    self._initialized = True
+        return sqlite3.connect(self._path, timeout=30)
+
+    def put_many(self, entries: Iterable[Tuple[str, bytes]]) -> None:
+        """Archives (task ID, metadata) pairs, replacing existing entries."""
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO task_meta (task_id, meta, archived_at) VALUES (?, ?, ?)",
+                    [(task_id, meta, now) for task_id, meta in entries],
+                )
+        finally:
+            connection.close()
+
+    def get_many(self, task_ids: List[str]) -> Dict[str, bytes]:
+        """Returns the archived metadata of the given tasks that are in the archive."""
+        found: Dict[str, bytes] = {}
+        if not self._initialized and not os.path.exists(self._path):
+            # Nothing archived yet; don't create the database just to read it
+            return found
+        connection = self._connect()
+        try:
+            for start in range(0, len(task_ids), MAX_QUERY_IDS):
+                batch = task_ids[start:start + MAX_QUERY_IDS]
+                placeholders = ", ".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT task_id, meta FROM task_meta WHERE task_id IN ({placeholders})", batch
+                )
+                found.update((task_id, bytes(meta)) for task_id, meta in rows)
+        finally:
+            connection.close()
+        return found
+
+    def delete_older_than(self, cutoff: float) -> int:
+        """Deletes the entries archived before `cutoff` (a Unix time) and returns how many."""
+        if not self._initialized and not os.path.exists(self._path):
+            return 0
+        connection = self._connect()
+        try:
+            with connection:
+                return connection.execute("DELETE FROM task_meta WHERE archived_at < ?", (cutoff,)).rowcount
+        finally:
+            connection.close()
+
+    def get(self, task_id: str) -> Optional[bytes]:
+        """Returns the archived metadata of a task, if any."""
+        return self.get_many([task_id]).get(task_id)
+
+
+results_archive = ResultArchive(settings.RESULTS_ARCHIVE_PATH)
@@ -0,0 +1,146 @@
+"""
+Moves old task results from the Celery result backend to the result archive.
+
+Runs as a background loop in the API. Each pass scans the backend's metadata
+keys, picks those older than RESULTS_ARCHIVE_AFTER_SECONDS (their age follows
+from the TTL Celery set from `result_expires`), copies finished tasks to the
+archive and deletes them from Redis, then deletes archived results older than
+RESULTS_ARCHIVE_RETENTION_SECONDS. A Redis lock lets only one API process run
+a pass at a time.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import List
+
+import orjson
+import redis
+
+from app.core.celery_app import celery_app
+from app.core.compression import compress, decompress
+from app.core.config import settings
+from app.core.redis_client import get_async_redis
+from app.services.result_archive import ResultArchive, results_archive
+from app.services.task_meta import CELERY_META_PREFIX, READY_STATES
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "result-archiver:lock"
+
+# Deletes the lock only if it still holds our token, so a pass that outlived
+# the lock's TTL never releases the lock of the process after it.
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# Fields of the task metadata that are archived. Celery's extended metadata also
+# holds the task's args, which include the submitter's GitHub token; it must not
+# outlive the Redis key on the API's disk.
+ARCHIVED_FIELDS = ("status", "result", "date_done", "traceback")
+
+
+def _scrub(meta: dict) -> bytes:
+    """Keeps only ARCHIVED_FIELDS of a task's metadata, re-serialized as Celery stores it."""
+    return compress(orjson.dumps({field: meta[field] for field in ARCHIVED_FIELDS if field in meta}))
+
+
+def _result_expires_seconds() -> int:
+    expires = celery_app.conf.result_expires
+    if isinstance(expires, timedelta):
+        return int(expires.total_seconds())
+    return int(expires or 0)
+
+
+async def _archive_batch(client, archive: ResultArchive, keys: List[bytes], expires: int) -> int:
+    async with client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.ttl(key)
+        ttls = await pipe.execute()
+    # Keys without a TTL have unknown age and are left alone
+    old_keys = [
+        key for key, ttl in zip(keys, ttls)
+        if ttl >= 0 and expires - ttl >= settings.RESULTS_ARCHIVE_AFTER_SECONDS
+    ]
+    if not old_keys:
+        return 0
+
+    entries = []
+    for key, raw in zip(old_keys, await client.mget(old_keys)):
+        if raw is None:
+            continue
+        meta = orjson.loads(decompress(raw))
+        if meta.get("status") not in READY_STATES:
+            continue
+        entries.append((key.decode()[len(CELERY_META_PREFIX):], _scrub(meta)))
+    if not entries:
+        return 0
+
+    await asyncio.to_thread(archive.put_many, entries)
+    await client.delete(*(f"{CELERY_META_PREFIX}{task_id}" for task_id, _ in entries))
+    return len(entries)
+
+
+async def archive_old_results(archive: ResultArchive = results_archive) -> int:
+    """Runs one archiving pass and returns the number of results archived."""
+    expires = _result_expires_seconds()
+    if not expires:
+        # Results never expire, so their age cannot be told from their TTL
+        return 0
+    client = get_async_redis()
+    token = str(uuid.uuid4())
+    if not await client.set(LOCK_KEY, token, nx=True, ex=max(60, int(settings.RESULTS_ARCHIVE_INTERVAL_SECONDS))):
+        return 0
+
+    archived = 0
+    try:
+        batch: List[bytes] = []
+        async for key in client.scan_iter(match=f"{CELERY_META_PREFIX}*", count=settings.RESULTS_ARCHIVE_BATCH_SIZE):
+            batch.append(key)
+            if len(batch) >= settings.RESULTS_ARCHIVE_BATCH_SIZE:
+                archived += await _archive_batch(client, archive, batch, expires)
+                batch = []
+        if batch:
+            archived += await _archive_batch(client, archive, batch, expires)
+
+        pruned = 0
+        if settings.RESULTS_ARCHIVE_RETENTION_SECONDS > 0:
+            cutoff = time.time() - settings.RESULTS_ARCHIVE_RETENTION_SECONDS
+            pruned = await asyncio.to_thread(archive.delete_older_than, cutoff)
+    finally:
+        await client.eval(UNLOCK_SCRIPT, 1, LOCK_KEY, token)
+    if archived:
+        logger.info(f"Archived {archived} task result(s).")
+    if pruned:
+        logger.info(f"Deleted {pruned} archived task result(s) past retention.")
+    return archived
+
+
+async def run_archiver() -> None:
+    """Archives old results every RESULTS_ARCHIVE_INTERVAL_SECONDS until cancelled."""
+    while True:
+        await asyncio.sleep(settings.RESULTS_ARCHIVE_INTERVAL_SECONDS)
+        try:
+            await archive_old_results()
+        except (redis.RedisError, sqlite3.Error, OSError) as e:
+            logger.warning(f"Archiving task results failed: {e}")
+
+
+@asynccontextmanager
+async def archiver_lifespan(app):
+    """FastAPI lifespan running the archiver in the background while the API is up."""
+    task = None
+    if settings.RESULTS_ARCHIVE_INTERVAL_SECONDS > 0:
+        task = asyncio.create_task(run_archiver())
+    try:
+        yield
+    finally:
+        if task is not None:
+            task.cancel()
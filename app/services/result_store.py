@@ -0,0 +1,106 @@
+"""
+Two-tier store for completed task results served by the API.
+
+Results are kept pre-serialized (the JSON bytes of a TaskResultResponse) so they
+can be returned without re-validating them. A small in-process LRU with a TTL
+sits in front of Redis: the LRU keeps API memory bounded no matter how many task
+IDs are requested, and Redis shares results between uvicorn workers so each
+result is fetched and deserialized from the Celery backend only once. Large
+payloads are compressed in Redis.
+"""
+import logging
+from typing import Optional
+
+import redis
+
+from app.core.cache import LRUCache
+from app.core.compression import compress, decompress
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUPS
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "task-result"
+
+
+def _result_key(task_id: str) -> str:
+    return f"{KEY_PREFIX}:{task_id}"
+
+
+class ResultStore:
+    """Pre-serialized task results in an in-process LRU backed by Redis."""
+
+    def __init__(self, local_size: int, local_ttl: float, redis_ttl: int):
+        self._local = LRUCache(maxsize=local_size, ttl=local_ttl)
+        self._redis_ttl = redis_ttl
+
+    def get(self, task_id: str) -> Optional[bytes]:
+        """Returns the stored payload, checking the local tier before Redis."""
+        payload = self._local.get(task_id)
+        if payload is not None:
+            CACHE_LOOKUPS.labels(cache="results_local", result="hit").inc()
+            return payload
+        CACHE_LOOKUPS.labels(cache="results_local", result="miss").inc()
+        try:
+            payload = get_redis().get(_result_key(task_id))
+        except redis.RedisError as e:
+            logger.warning(f"Result store lookup failed for task {task_id}: {e}")
+            return None
+        return self._from_redis(task_id, payload)
+
+    def _from_redis(self, task_id: str, payload: Optional[bytes]) -> Optional[bytes]:
+        """Decompresses a payload read from Redis and keeps it in the local tier."""
+        CACHE_LOOKUPS.labels(cache="results_redis", result="miss" if payload is None else "hit").inc()
+        if payload is not None:
+            payload = decompress(payload)
+            self._local.set(task_id, payload)
+        return payload
+
+    def set(self, task_id: str, payload: bytes, local: bool = True) -> None:
+        """
+        Stores a payload in both tiers, or only in Redis if `local` is false
+        (e.g. in workers, which never read results back).
+        """
+        if local:
+            self._local.set(task_id, payload)
+        try:
+            get_redis().set(_result_key(task_id), compress(payload), ex=self._redis_ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store result for task {task_id} in Redis: {e}")
+
+    async def aget(self, task_id: str) -> Optional[bytes]:
+        """Like get(), but reads Redis without blocking the event loop."""
+        payload = self._local.get(task_id)
+        if payload is not None:
+            CACHE_LOOKUPS.labels(cache="results_local", result="hit").inc()
+            return payload
+        CACHE_LOOKUPS.labels(cache="results_local", result="miss").inc()
+        try:
+            payload = await get_async_redis().get(_result_key(task_id))
+        except redis.RedisError as e:
+            logger.warning(f"Result store lookup failed for task {task_id}: {e}")
+            return None
+        return self._from_redis(task_id, payload)
+
+    async def aset(self, task_id: str, payload: bytes) -> None:
+        """Like set(), but writes Redis without blocking the event loop."""
+        self._local.set(task_id, payload)
+        try:
+            await get_async_redis().set(_result_key(task_id), compress(payload), ex=self._redis_ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Failed to store result for task {task_id} in Redis: {e}")
+
+    def clear(self) -> None:
+        """Clears the local tier. Redis entries expire on their own."""
+        self._local.clear()
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+results_store = ResultStore(
+    local_size=settings.RESULTS_LOCAL_CACHE_SIZE,
+    local_ttl=settings.RESULTS_LOCAL_CACHE_TTL_SECONDS,
+    redis_ttl=settings.RESULTS_REDIS_TTL_SECONDS,
+)
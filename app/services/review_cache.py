@@ -0,0 +1,133 @@
+"""
+Content-addressed cache for completed reviews.
+
+Reviews are stored in Redis under a hash of the normalized diff plus the
+analyzer's configuration (models, prompt version, tiering, context and
+pre-check settings), so a re-pushed identical diff (or the same PR head
+submitted twice) is answered without calling the LLM. Entries expire after a
+TTL and the total number of entries is bounded by evicting the oldest ones.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional, Union
+
+import redis
+
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUPS
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "review-cache"
+INDEX_KEY = f"{KEY_PREFIX}:index"  # Sorted set of digests scored by insertion time
+STATS_KEY = f"{KEY_PREFIX}:stats"  # Hash holding the hit/miss counters
+
+
+def _entry_key(cache_key: str) -> str:
+    return f"{KEY_PREFIX}:entry:{cache_key}"
+
+
+def _normalize_line(line: str) -> str:
+    # Trailing whitespace on added and removed lines is reported by a pre-check,
+    # so it is part of what the review depends on.
+    if line[:1] in ("+", "-"):
+        return line
+    return line.rstrip()
+
+
+def normalize_diff(diff: str) -> str:
+    """
+    Normalizes a diff so that cosmetic differences (line endings, trailing
+    whitespace on context lines, surrounding blank lines) do not produce
+    different cache keys.
+    """
+    lines = diff.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(_normalize_line(line) for line in lines).strip("\n")
+
+
+def make_cache_key(
+    diff: Union[str, Iterable[str]], model: Optional[str] = None, prompt_version: Optional[str] = None
+) -> str:
+    """
+    Builds the content address for a diff reviewed with the analyzer's current
+    configuration; `model` and `prompt_version` override the analyzer's. The
+    diff may be given in pieces (e.g. one per file), which are hashed one at a
+    time so the whole diff never has to be held as one string.
+    """
+    pieces = [diff] if isinstance(diff, str) else diff
+    # Imported on use: the API reads cache stats without loading the LLM stack
+    from app.services.analyzer import MODEL_NAME, PROMPT_VERSION, review_fingerprint
+    model = model or MODEL_NAME
+    prompt_version = prompt_version or PROMPT_VERSION
+    digest = hashlib.sha256()
+    digest.update(f"{model}\0{prompt_version}\0{review_fingerprint()}\0".encode("utf-8"))
+    for piece in pieces:
+        digest.update(normalize_diff(piece).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def get_cached_review(cache_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the stored review for the given key, or None on a miss.
+    Cache failures are logged and treated as misses so they never fail a review.
+    """
+    try:
+        client = get_redis()
+        raw = client.get(_entry_key(cache_key))
+        client.hincrby(STATS_KEY, "misses" if raw is None else "hits", 1)
+    except redis.RedisError as e:
+        logger.warning(f"Review cache lookup failed, treating as a miss: {e}")
+        CACHE_LOOKUPS.labels(cache="review", result="miss").inc()
+        return None
+
+    CACHE_LOOKUPS.labels(cache="review", result="miss" if raw is None else "hit").inc()
+
+    if raw is None:
+        return None
+    logger.info(f"Review cache hit for key {cache_key[:12]}")
+    return json.loads(raw)
+
+
+def store_review(cache_key: str, result: Dict[str, Any]) -> None:
+    """Stores a review and evicts expired and excess entries."""
+    ttl = settings.REVIEW_CACHE_TTL_SECONDS
+    now = time.time()
+    try:
+        client = get_redis()
+        pipe = client.pipeline()
+        pipe.set(_entry_key(cache_key), json.dumps(result), ex=ttl)
+        pipe.zadd(INDEX_KEY, {cache_key: now})
+        # Entries past their TTL are already gone from Redis; drop them from the index too.
+        pipe.zremrangebyscore(INDEX_KEY, 0, now - ttl)
+        pipe.zcard(INDEX_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - settings.REVIEW_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            evicted = client.zrange(INDEX_KEY, 0, overflow - 1)
+            pipe = client.pipeline()
+            pipe.zrem(INDEX_KEY, *evicted)
+            pipe.delete(*(_entry_key(key.decode()) for key in evicted))
+            pipe.execute()
+            logger.info(f"Evicted {len(evicted)} entries from the review cache.")
+    except redis.RedisError as e:
+        logger.warning(f"Failed to store review in cache: {e}")
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Returns the hit/miss counters and current size of the review cache."""
+    client = get_redis()
+    stats = client.hgetall(STATS_KEY)
+    hits = int(stats.get(b"hits", 0))
+    misses = int(stats.get(b"misses", 0))
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "entries": client.zcard(INDEX_KEY),
+        "hit_rate": hits / lookups if lookups else 0.0,
+    }
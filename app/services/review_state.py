@@ -0,0 +1,103 @@
+"""
+Per-PR review state used for incremental re-reviews.
+
+After each review we remember, for a repo/PR, the head SHA that was reviewed and
+for every file its diff fingerprint (the blob SHAs from the diff's `index` line)
+together with the issues found in it. On the next push only files whose
+fingerprint changed are sent to the LLM; the stored findings are reused for the rest.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis
+from app.services.diff_parser import FileDiff
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "review-state"
+
+
+@dataclass
+class ReviewState:
+    """What was last reviewed for a PR: the head SHA and per-file fingerprints and issues."""
+    head_sha: str
+    files: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+def _state_key(repo_url: str, pr_number: int) -> str:
+    return f"{KEY_PREFIX}:{repo_url.rstrip('/').lower()}:{pr_number}"
+
+
+def load_review_state(repo_url: str, pr_number: int) -> Optional[ReviewState]:
+    """Returns the last stored review state for the PR, or None if there is none."""
+    try:
+        raw = get_redis().get(_state_key(repo_url, pr_number))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to load review state, doing a full review: {e}")
+        return None
+    if raw is None:
+        return None
+    data = json.loads(raw)
+    return ReviewState(head_sha=data["head_sha"], files=data["files"])
+
+
+def save_review_state(repo_url: str, pr_number: int, state: ReviewState) -> None:
+    """Stores the review state for the PR."""
+    payload = json.dumps({"head_sha": state.head_sha, "files": state.files})
+    try:
+        get_redis().set(_state_key(repo_url, pr_number), payload, ex=settings.REVIEW_STATE_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to save review state: {e}")
+
+
+def split_changed_files(files: List[FileDiff], state: Optional[ReviewState]):
+    """
+    Splits the files of the current diff into those that need a review and the
+    stored issues of those that are unchanged since the state was recorded.
+    Returns a tuple of (changed FileDiffs, {path: reused issues}).
+    """
+    if state is None:
+        return list(files), {}
+
+    changed: List[FileDiff] = []
+    reused: Dict[str, List[Dict[str, Any]]] = {}
+    for file_diff in files:
+        previous = state.files.get(file_diff.path)
+        if previous is not None and previous["fingerprint"] == file_diff.fingerprint:
+            reused[file_diff.path] = previous["issues"]
+        else:
+            changed.append(file_diff)
+    return changed, reused
+
+
+def build_review_state(
+    head_sha: str,
+    files: List[FileDiff],
+    issues_by_path: Dict[str, List[Dict[str, Any]]],
+) -> Optional[ReviewState]:
+    """
+    Builds the state to store after a review. Files that are absent from
+    `issues_by_path` had no issues. Returns None if the result names a file that
+    is not in the diff, because then findings cannot be attributed reliably.
+    """
+    paths = {file_diff.path for file_diff in files}
+    unknown = set(issues_by_path) - paths
+    if unknown:
+        logger.warning(f"Review named files not present in the diff ({sorted(unknown)}); not storing review state.")
+        return None
+
+    return ReviewState(
+        head_sha=head_sha,
+        files={
+            file_diff.path: {
+                "fingerprint": file_diff.fingerprint,
+                "issues": issues_by_path.get(file_diff.path, []),
+            }
+            for file_diff in files
+        },
+    )
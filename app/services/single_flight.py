@@ -0,0 +1,70 @@
+"""
+Single-flight deduplication of analysis requests.
+
+Concurrent submissions of the same PR at the same head SHA share one task: the
+first request claims a Redis key for (repo, PR, head SHA) holding its task ID,
+and later requests get that task ID back instead of enqueuing another review.
+The task releases the key when it finishes or fails; a TTL guards against
+workers that die without releasing it.
+"""
+import hashlib
+import logging
+from typing import Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "single-flight"
+
+# Deletes the key only if it still holds our task ID, so a task never releases
+# a flight that has since been claimed by another task.
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def make_flight_key(repo_url: str, pr_number: int, head_sha: str) -> str:
+    """Builds the single-flight key for a PR at a given head commit."""
+    repo = repo_url.rstrip("/").lower()
+    digest = hashlib.sha256(f"{repo}\0{pr_number}\0{head_sha}".encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+async def claim_flight(flight_key: str, task_id: str) -> Optional[str]:
+    """
+    Tries to claim the flight for `task_id`. Returns None if the claim succeeded,
+    or the ID of the task already in flight for the same key.
+    """
+    client = get_async_redis()
+    for _ in range(2):
+        if await client.set(flight_key, task_id, nx=True, ex=settings.SINGLE_FLIGHT_TTL_SECONDS):
+            return None
+        existing = await client.get(flight_key)
+        if existing is not None:
+            return existing.decode()
+        # The other flight was released between SET and GET; try to claim it again.
+    # Still contended: proceed without deduplication rather than failing the request.
+    return None
+
+
+def release_flight(flight_key: str, task_id: str) -> None:
+    """Releases the flight if it is still held by `task_id`."""
+    try:
+        get_redis().eval(RELEASE_SCRIPT, 1, flight_key, task_id)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release single-flight key for task {task_id}: {e}")
+
+
+async def arelease_flight(flight_key: str, task_id: str) -> None:
+    """Like release_flight(), for use on the API's event loop."""
+    try:
+        await get_async_redis().eval(RELEASE_SCRIPT, 1, flight_key, task_id)
+    except redis.RedisError as e:
+        logger.warning(f"Failed to release single-flight key for task {task_id}: {e}")
@@ -0,0 +1,77 @@
+"""
+Push-based task progress over Redis pub/sub.
+
+Workers publish every state transition, each partial (per-file) result and the
+final result of a task on the channel `task-events:<task_id>`. The API relays
+these events to clients as Server-Sent Events, so clients no longer need to poll
+the status endpoint.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import redis
+
+from app.core.config import settings
+from app.core.redis_client import get_redis, get_async_redis
+from app.services.task_meta import get_task_meta, describe_task_status
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "task-events"
+
+# Events after which nothing more is published for a task
+FINAL_EVENTS = {"result", "failure", "revoked"}
+
+
+def _channel(task_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:{task_id}"
+
+
+def publish_task_event(task_id: str, event: str, data: Dict[str, Any]) -> None:
+    """Publishes an event for a task. Failures are logged and never fail the task."""
+    try:
+        get_redis().publish(_channel(task_id), json.dumps({"event": event, "data": data}))
+    except redis.RedisError as e:
+        logger.warning(f"Failed to publish '{event}' event for task {task_id}: {e}")
+
+
+async def stream_task_events(task_id: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Yields the events of a task, starting with its current state, until the task
+    finishes. Yields None when no event arrived within the keep-alive interval.
+    """
+    pubsub = get_async_redis().pubsub()
+    # Subscribe before reading the current state so no transition is missed in between.
+    await pubsub.subscribe(_channel(task_id))
+    try:
+        meta = await get_task_meta(task_id)
+        if meta["status"] == "SUCCESS":
+            yield {"event": "result", "data": {"task_id": task_id, "status": "COMPLETED", "results": meta["result"]}}
+            return
+        current = describe_task_status(task_id, meta)
+        yield {"event": "status", "data": current}
+        if meta["status"] in ("FAILURE", "REVOKED"):
+            return
+
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=settings.TASK_EVENTS_KEEPALIVE_SECONDS
+            )
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message["data"])
+            yield event
+            if event["event"] in FINAL_EVENTS:
+                return
+    finally:
+        await pubsub.unsubscribe(_channel(task_id))
+        await pubsub.aclose()
+
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    """Formats an event as a Server-Sent Events message (a comment for keep-alives)."""
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -0,0 +1,102 @@
+"""
+Non-blocking access to Celery task state for the API.
+
+`AsyncResult.state`/`.get()` do blocking Redis I/O, which stalls the event loop
+of the uvicorn worker. Instead, the API reads the metadata Celery's Redis result
+backend stores under `celery-task-meta-<task_id>` directly with an asyncio Redis
+client, and looks up many tasks at once with a single MGET. Metadata that has
+been moved to the result archive is read from there.
+"""
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+import orjson
+
+from app.core.compression import decompress
+from app.core.redis_client import get_async_redis
+from app.services.result_archive import results_archive
+
+logger = logging.getLogger(__name__)
+
+# Key prefix used by Celery's key/value result backends (KeyValueStoreBackend.task_keyprefix)
+CELERY_META_PREFIX = "celery-task-meta-"
+
+READY_STATES = {"SUCCESS", "FAILURE", "REVOKED"}
+
+PENDING_META: Dict[str, Any] = {"status": "PENDING", "result": None}
+
+
+def _meta_key(task_id: str) -> str:
+    return f"{CELERY_META_PREFIX}{task_id}"
+
+
+def _decode_meta(raw: Optional[bytes]) -> Dict[str, Any]:
+    # Celery stores nothing until a task reports a state, which it treats as PENDING.
+    if raw is None:
+        return dict(PENDING_META)
+    return orjson.loads(decompress(raw))
+
+
+async def _get_archived(task_ids: List[str]) -> Dict[str, bytes]:
+    try:
+        return await asyncio.to_thread(results_archive.get_many, task_ids)
+    except sqlite3.Error as e:
+        logger.warning(f"Result archive lookup failed: {e}")
+        return {}
+
+
+async def get_task_meta(task_id: str) -> Dict[str, Any]:
+    """Returns the Celery metadata of a task (status, result, ...)."""
+    raw = await get_async_redis().get(_meta_key(task_id))
+    if raw is None:
+        raw = (await _get_archived([task_id])).get(task_id)
+    return _decode_meta(raw)
+
+
+async def get_task_metas(task_ids: List[str]) -> List[Dict[str, Any]]:
+    """Returns the Celery metadata of many tasks in a single round-trip."""
+    if not task_ids:
+        return []
+    raw_metas = await get_async_redis().mget([_meta_key(task_id) for task_id in task_ids])
+    missing = [task_id for task_id, raw in zip(task_ids, raw_metas) if raw is None]
+    if missing:
+        archived = await _get_archived(missing)
+        raw_metas = [
+            raw if raw is not None else archived.get(task_id)
+            for task_id, raw in zip(task_ids, raw_metas)
+        ]
+    return [_decode_meta(raw) for raw in raw_metas]
+
+
+def _exception_message(result: Any) -> Optional[str]:
+    """Extracts the message of an exception serialized by Celery's JSON serializer."""
+    if not isinstance(result, dict) or "exc_type" not in result:
+        return None
+    message = result.get("exc_message")
+    if isinstance(message, (list, tuple)):
+        message = " ".join(str(part) for part in message)
+    return str(message)
+
+
+def describe_task_status(task_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """Builds the TaskStatusResponse payload for a task from its Celery metadata."""
+    task_status = meta.get("status", "PENDING")
+    result = meta.get("result")
+    detail = None
+
+    if task_status == 'PROCESSING':
+        info = result if isinstance(result, dict) else {}
+        detail = info.get('status', 'The task is currently being processed.')
+    elif task_status == 'FAILURE':
+        message = _exception_message(result)
+        if message is not None:
+            detail = f"Task failed with an error: {message}"
+        else:
+            detail = "Task failed with an unknown error."
+    elif task_status == 'REVOKED':
+        info = result if isinstance(result, dict) else {}
+        detail = info.get('status', 'The task was cancelled.')
+
+    return {"task_id": task_id, "status": task_status, "detail": detail}
@@ -0,0 +1,43 @@
+"""
+Routing of analysis tasks to size-specific queues.
+
+Small PRs go to a fast queue and large ones to a slow queue, each consumed by
+its own workers, so a huge refactor PR never sits in front of dozens of small
+ones. The size comes from the PR metadata (changed lines and files), which the
+API already fetches, so classification costs no extra request.
+
+The API enqueues tasks by name, so it never imports the task module and the
+LLM and GitHub stacks behind it; only workers load those.
+"""
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+
+# Registered name of app.services.tasks.run_code_analysis_task
+ANALYSIS_TASK = "app.services.tasks.run_code_analysis_task"
+
+QUEUE_SMALL = "reviews.small"
+QUEUE_LARGE = "reviews.large"
+
+# Lower numbers are consumed first by Celery's Redis transport
+PRIORITY_SMALL = 0
+PRIORITY_LARGE = 5
+
+
+def is_large_pr(pr: Dict[str, Any]) -> bool:
+    """Classifies a PR as large from its metadata."""
+    changed_lines = pr.get("additions", 0) + pr.get("deletions", 0)
+    return (
+        changed_lines > settings.SMALL_PR_MAX_CHANGED_LINES
+        or pr.get("changed_files", 0) > settings.SMALL_PR_MAX_FILES
+    )
+
+
+def route_for_pr(pr: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Returns the `queue` and `priority` options for a PR's analysis task.
+    PRs whose metadata could not be fetched go to the small queue; they fail fast.
+    """
+    if pr is not None and is_large_pr(pr):
+        return {"queue": QUEUE_LARGE, "priority": PRIORITY_LARGE}
+    return {"queue": QUEUE_SMALL, "priority": PRIORITY_SMALL}
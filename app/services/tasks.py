@@ -1,47 +1,246 @@
 import logging
-import json
+import orjson
+from celery.exceptions import Ignore
+from celery.signals import task_postrun, worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from app.core import event_loop
 from app.core.celery_app import celery_app
-from app.models.analysis import AnalysisResultData
-from app.services.analyzer import analyze_code_with_langchain
-from app.services.github_helper import get_pr_diff, GitHubConnectionError
+from app.core.config import settings
+from app.core.metrics import DIFF_SIZE_BYTES, start_metrics_server, time_stage
+from app.core.tracing import TENANT_HEADER
+from app.models.analysis import AnalysisResultData, FileAnalysis, Issue, TokenUsage
+from app.services import fair_scheduler, prechecks
+from app.services.bulk_analysis import store_task_summary
+from app.services.analyzer import review_diff, get_chain
+from app.services.github_helper import fetch_pr_diff, GitHubConnectionError
+from app.services.github_webhooks import is_superseded
+from app.services.result_store import results_store
+from app.services.review_cache import make_cache_key, get_cached_review, store_review
+from app.services.rate_limiter import LLMRateLimitError
+from app.services.single_flight import release_flight
+from app.services.task_routing import ANALYSIS_TASK
+from app.services.task_events import publish_task_event
+from app.services.review_state import load_review_state, save_review_state, split_changed_files, build_review_state
 
 logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True)
-def run_code_analysis_task(self, repo_url: str, pr_number: int, github_token: str | None = None):
+@worker_init.connect
+def start_worker_metrics(**kwargs):
+    """Serves the worker's metrics for Prometheus, once per worker (not per pool process)."""
+    if settings.WORKER_METRICS_PORT:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+        logger.info(f"Serving worker metrics on port {settings.WORKER_METRICS_PORT}.")
+
+@worker_init.connect
+def start_event_loop(sender=None, **kwargs):
+    """
+    In async mode, runs tasks on threads of the worker process, which only wait
+    on the LLM calls they hand to its event loop. The review chain is built on
+    the loop, which gives the chain's LLM client a native async transport.
+    """
+    if settings.WORKER_MODE != "async":
+        return
+    # Sent before the pool implementation is resolved, so this overrides -P
+    sender.pool_cls = "threads"
+    event_loop.run(_build_chain_on_loop())
+    logger.info(f"Worker running in async mode with up to {sender.concurrency} concurrent analyses.")
+
+async def _build_chain_on_loop():
+    get_chain()
+
+@worker_process_init.connect
+def warm_up_analyzer(**kwargs):
+    """
+    Builds the review chain once in each worker process, right after the fork
+    (the LLM client's connections must not be shared across forks), so tasks
+    only pay for the inference call itself.
+    """
+    get_chain()
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def stop_precheck_pool(**kwargs):
+    """Stops the pre-check processes of a worker (or of one of its pool processes) on shutdown."""
+    prechecks.shutdown_pool()
+
+@task_postrun.connect
+def free_tenant_slot(task_id: str = None, task=None, **kwargs):
+    """
+    Frees the fair-scheduling slot of a task when it ends, so its tenant can
+    start another one. A retry frees it too: it waits on Celery's queue, not
+    on a worker.
+    """
+    tenant = getattr(task.request, TENANT_HEADER, None) if task is not None else None
+    if tenant is not None:
+        fair_scheduler.release(tenant, task_id)
+
+def _report_progress(task, message: str) -> None:
+    """Records a PROCESSING state and pushes it to clients streaming the task's events."""
+    task.update_state(state='PROCESSING', meta={'status': message})
+    publish_task_event(task.request.id, "status", {"task_id": task.request.id, "status": "PROCESSING", "detail": message})
+
+def _report_failure(task, error_message: str) -> None:
+    """Records a FAILURE state and pushes it to clients streaming the task's events."""
+    task.update_state(state='FAILURE', meta={'status': 'Task failed', 'error': error_message})
+    publish_task_event(task.request.id, "failure", {
+        "task_id": task.request.id, "status": "FAILURE", "detail": f"Task failed with an error: {error_message}"
+    })
+
+def _report_result(task, result: dict) -> None:
+    """
+    Pushes the final result to clients streaming the task's events, and stores
+    it in the API's result store, already serialized as a TaskResultResponse,
+    so /results serves it as-is without reading or validating it again.
+    """
+    response = {"task_id": task.request.id, "status": "COMPLETED", "results": result}
+    results_store.set(task.request.id, orjson.dumps(response), local=False)
+    store_task_summary(task.request.id, result.get("summary", {}))
+    publish_task_event(task.request.id, "result", response)
+
+def _skip_superseded(task, repo_url: str, pr_number: int, head_sha: str | None) -> None:
+    """
+    Ends a webhook-triggered task whose head has been superseded by a newer push
+    (or whose PR was closed) while it was waiting, leaving it REVOKED.
+    """
+    if head_sha is None or not is_superseded(repo_url, pr_number, head_sha):
+        return
+    message = 'Superseded by a newer push.'
+    logger.info(f"Skipping review of {repo_url} PR #{pr_number} at {head_sha[:7]}: {message}")
+    task.update_state(state='REVOKED', meta={'status': message})
+    publish_task_event(task.request.id, "revoked", {"task_id": task.request.id, "status": "REVOKED", "detail": message})
+    # Keep the REVOKED state instead of recording a result
+    raise Ignore()
+
+# While the LLM is rate-limited the task goes back to the queue with exponential,
+# jittered backoff instead of failing or holding a worker slot.
+@celery_app.task(
+    name=ANALYSIS_TASK,
+    bind=True,
+    autoretry_for=(LLMRateLimitError,),
+    retry_backoff=5,
+    retry_backoff_max=300,
+    retry_jitter=True,
+    max_retries=settings.LLM_MAX_RETRIES,
+)
+def run_code_analysis_task(
+    self,
+    repo_url: str,
+    pr_number: int,
+    github_token: str | None = None,
+    flight_key: str | None = None,
+    head_sha: str | None = None,
+):
+    retrying = False
+    # Requests without a token of their own use the server's token, if configured
+    github_token = github_token or settings.GITHUB_ACCESS_TOKEN or None
     try:
+        _skip_superseded(self, repo_url, pr_number, head_sha)
         logger.info(f"Starting analysis for {repo_url} PR #{pr_number}")
-        self.update_state(state='PROCESSING', meta={'status': 'Fetching PR diff...'})
+        _report_progress(self, 'Fetching PR diff...')
+
+        with time_stage("diff_fetch"):
+            pr = fetch_pr_diff(repo_url, pr_number, github_token, head_sha=head_sha)
+        # The diff is handled file by file; its joined text is only built for the analyzer
+        DIFF_SIZE_BYTES.observe(sum(len(text.encode("utf-8")) for text in pr.file_texts()))
+        # Re-check right before paying for the review; the fetch may have taken a while
+        _skip_superseded(self, repo_url, pr_number, head_sha)
 
-        pr_diff = get_pr_diff(repo_url, pr_number, github_token)
+        # Identical diffs (re-pushes, duplicate submissions) are served from the review cache.
+        cache_key = make_cache_key(pr.file_texts())
+        cached_result = get_cached_review(cache_key)
+        if cached_result is not None:
+            logger.info(f"Returning cached review for {repo_url} PR #{pr_number}")
+            # Served without any LLM call
+            cached_result["usage"] = TokenUsage().model_dump()
+            _report_result(self, cached_result)
+            return cached_result
+
+        # Only files whose content changed since the last reviewed head go to the LLM.
+        files = pr.files
+        previous_state = load_review_state(repo_url, pr_number) if files else None
+        changed_files, reused_issues = split_changed_files(files, previous_state)
+        if previous_state is not None:
+            logger.info(
+                f"Incremental review since {previous_state.head_sha[:7]}: "
+                f"{len(changed_files)} of {len(files)} files changed."
+            )
+            analysis_diff = "\n".join(file_diff.text for file_diff in changed_files)
+        else:
+            analysis_diff = pr.text()
         
-        self.update_state(state='PROCESSING', meta={'status': 'PR diff fetched. Starting AI analysis...'})
+        if pr.skipped_files:
+            logger.info(f"{len(pr.skipped_files)} file(s) were skipped as oversized, generated or binary.")
+        _report_progress(self, 'PR diff fetched. Starting AI analysis...')
         logger.info("PR diff fetched successfully. Starting AI analysis...")
 
-        analysis_result_str = analyze_code_with_langchain(pr_diff)
-        
-        self.update_state(state='PROCESSING', meta={'status': 'AI analysis complete. Parsing results...'})
+        if analysis_diff:
+            # Push each file's findings to streaming clients as soon as its chunk is reviewed
+            def publish_partial(partial_result):
+                partial = partial_result.model_dump(mode="json", include={"files"})
+                publish_task_event(self.request.id, "partial", {"task_id": self.request.id, "files": partial["files"]})
+
+            # The model's output is validated once, when it is parsed, into the result models
+            new_result = review_diff(analysis_diff, on_chunk_reviewed=publish_partial)
+        else:
+            new_result = AnalysisResultData.from_files([])
+
+        _report_progress(self, 'AI analysis complete. Parsing results...')
         logger.info("AI analysis complete. Parsing results.")
-        
-        try:
-            analysis_result_json = json.loads(analysis_result_str)
-            # Optional: Validate the structure before returning
-            AnalysisResultData(**analysis_result_json)
-            return analysis_result_json
-        except json.JSONDecodeError:
-            error_message = "The AI returned a malformed JSON response."
-            logger.error(f"{error_message} Raw output: {analysis_result_str}", exc_info=True)
-            self.update_state(state='FAILURE', meta={'status': 'Task failed', 'error': error_message})
-            raise ValueError(error_message)
-    
+
+        # Merge in the findings reused from the previous review
+        issues_by_path = {
+            path: [Issue(**issue) for issue in issues] for path, issues in reused_issues.items()
+        }
+        issues_by_path.update((file.name, file.issues) for file in new_result.files)
+        ordered_paths = [file_diff.path for file_diff in files if file_diff.path in issues_by_path]
+        ordered_paths += [path for path in issues_by_path if path not in ordered_paths]
+        usage = new_result.usage or TokenUsage()
+        logger.info(
+            f"Token usage for {repo_url} PR #{pr_number}: {usage.input_tokens} input, "
+            f"{usage.output_tokens} output in {usage.llm_calls} LLM call(s)."
+        )
+        merged_result = AnalysisResultData.from_files([
+            FileAnalysis(name=path, issues=issues_by_path[path])
+            for path in ordered_paths if issues_by_path[path]
+        ], usage=usage)
+        analysis_result_json = merged_result.model_dump()
+
+        if files:
+            state = build_review_state(pr.head_sha, files, {
+                file.name: analysis_result_json["files"][index]["issues"]
+                for index, file in enumerate(merged_result.files)
+            })
+            if state is not None:
+                save_review_state(repo_url, pr_number, state)
+        with time_stage("store"):
+            store_review(cache_key, analysis_result_json)
+            _report_result(self, analysis_result_json)
+        return analysis_result_json
+
+    except Ignore:
+        raise
+    except LLMRateLimitError as e:
+        if self.request.retries >= self.max_retries:
+            error_message = f"LLM rate limit still exceeded after {self.max_retries} retries."
+            logger.error(f"Task for {repo_url} PR #{pr_number} failed: {error_message}")
+            _report_failure(self, error_message)
+        else:
+            retrying = True
+            logger.warning(f"Analysis of {repo_url} PR #{pr_number} is rate-limited, retrying later: {e}")
+            _report_progress(self, 'Waiting for LLM capacity...')
+        raise
     # Catch the specific error from our helper
     except GitHubConnectionError as e:
         error_message = str(e)
         logger.error(f"Task failed due to connection issue: {error_message}", exc_info=True)
-        self.update_state(state='FAILURE', meta={'status': 'Task failed', 'error': error_message})
+        _report_failure(self, error_message)
         raise
     except Exception as e:
         error_message = f"An unexpected error occurred: {str(e)}"
         logger.error(f"An unexpected error occurred in task for {repo_url} PR #{pr_number}: {error_message}", exc_info=True)
-        self.update_state(state='FAILURE', meta={'status': 'Task failed', 'error': str(e)})
-        raise
\ No newline at end of file
+        _report_failure(self, str(e))
+        raise
+    finally:
+        # Let the next identical submission start a new task (or hit the review cache).
+        # A retried task keeps its ID, so it keeps the flight until it finishes.
+        if flight_key is not None and not retrying:
+            release_flight(flight_key, self.request.id)
\ No newline at end of file
@@ -7,6 +7,7 @@ from main import app as fastapi_app
 
 # Import the Celery app
 from app.core.celery_app import celery_app as _celery_app
+from app.services.github_helper import PRDiff
 
 @pytest.fixture(scope="module")
 def client():
@@ -48,9 +49,6 @@ def mock_async_result(mocker):
     mock_result.failed.return_value = False
     mock_result.get.return_value = None # Default for pending/processing
 
-    # Patch AsyncResult to return our mock
-    mocker.patch("app.routes.analysis.AsyncResult", return_value=mock_result)
-    
     # Patch the .delay() method of the task to return our mock AsyncResult
     mocker.patch("app.services.tasks.run_code_analysis_task.delay", return_value=mock_result)
 
@@ -90,6 +88,10 @@ def mock_github_diff(mocker):
     Fixture to mock the get_pr_diff function.
     """
     mocker.patch("app.services.github_helper.get_pr_diff", return_value="diff content here")
+    mocker.patch(
+        "app.services.tasks.fetch_pr_diff",
+        return_value=PRDiff(head_sha="abc1234", diff="diff content here")
+    )
     # Also patch the tool's internal call to it
     mocker.patch("app.services.agent_tools.get_pr_diff", return_value="diff content here")
     return "diff content here"
@@ -0,0 +1,173 @@
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import fakeredis
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from langchain_core.messages import AIMessage
+
+from app.models.analysis import AnalysisResultData, AnalysisSummary, FileAnalysis, Issue
+from app.services.analyzer import analyze_code_with_langchain, merge_results, get_chain, plan_prompts
+from app.services.analyzer import MODEL_NAME, LIGHT_MODEL_NAME, ReviewOutput
+from app.services.diff_parser import parse_diff
+from app.services.rate_limiter import LLMRateLimitError
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.rate_limiter.get_redis", return_value=client)
+    mocker.patch("app.services.hunk_cache.get_redis", return_value=client)
+    return client
+
+def _result(name, *issue_types):
+    issues = [
+        Issue(type=t, line=i + 1, description=f"{t} issue", suggestion="fix it")
+        for i, t in enumerate(issue_types)
+    ]
+    return AnalysisResultData(
+        files=[FileAnalysis(name=name, issues=issues)],
+        summary=AnalysisSummary(total_files=1, total_issues=len(issues), critical_issues=0),
+    )
+
+def test_merge_results_combines_chunks_and_recomputes_summary():
+    newline_issue = Issue(type="style", line=9, description="Missing newline at the end of the file", suggestion="add one")
+    filtered_only = _result("empty.py")
+    filtered_only.files[0].issues = [newline_issue]
+
+    merged = merge_results([_result("a.py", "bug"), _result("a.py", "style"), _result("b.py", "bug"), filtered_only])
+
+    assert [f.name for f in merged.files] == ["a.py", "b.py"]
+    assert len(merged.files[0].issues) == 2
+    assert merged.summary.total_files == 2
+    assert merged.summary.total_issues == 3
+    assert merged.summary.critical_issues == 2
+
+def _output(result, input_tokens=100, output_tokens=20):
+    raw = AIMessage(content="", usage_metadata={
+        "input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens,
+    })
+    parsed = ReviewOutput.parse_obj({"files": [file.model_dump() for file in result.files]})
+    return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+TWO_FILE_DIFF = (
+    "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n+x = 1\n"
+    "diff --git a/b.py b/b.py\n--- a/b.py\n+++ b/b.py\n@@ -1 +1 @@\n+y = 2\n"
+)
+
+def test_analyze_code_reviews_chunks_and_reports_usage(mocker):
+    mocker.patch("app.services.analyzer.settings.ANALYZER_PROMPT_TOKEN_BUDGET", 1)
+    chain = MagicMock()
+    chain.invoke.side_effect = lambda inputs: _output(
+        _result("a.py" if "a.py" in inputs["pr_diff"] else "b.py", "bug")
+    )
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+
+    result = json.loads(analyze_code_with_langchain(TWO_FILE_DIFF))
+
+    assert chain.invoke.call_count == 2
+    assert sorted(f["name"] for f in result["files"]) == ["a.py", "b.py"]
+    assert result["summary"]["critical_issues"] == 2
+    assert result["usage"] == {"input_tokens": 200, "output_tokens": 40, "llm_calls": 2}
+
+def test_analyze_code_in_async_mode_awaits_the_chain_on_the_event_loop(mocker):
+    mocker.patch("app.services.analyzer.settings.WORKER_MODE", "async")
+    mocker.patch("app.services.analyzer.settings.ANALYZER_PROMPT_TOKEN_BUDGET", 1)
+    async_redis = fakeredis.FakeAsyncRedis()
+    mocker.patch("app.services.rate_limiter.get_async_redis", return_value=async_redis)
+    # A blocking Redis round-trip would stall every other review on the loop
+    mocker.patch("app.services.rate_limiter.get_redis", side_effect=AssertionError("sync Redis used on the event loop"))
+    chain = MagicMock()
+    chain.ainvoke = AsyncMock(side_effect=lambda inputs: _output(
+        _result("a.py" if "a.py" in inputs["pr_diff"] else "b.py", "bug")
+    ))
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+
+    result = json.loads(analyze_code_with_langchain(TWO_FILE_DIFF))
+
+    assert chain.ainvoke.await_count == 2
+    chain.invoke.assert_not_called()
+    assert sorted(f["name"] for f in result["files"]) == ["a.py", "b.py"]
+    assert result["usage"] == {"input_tokens": 200, "output_tokens": 40, "llm_calls": 2}
+
+def test_analyze_code_packs_small_files_into_one_prompt(mocker):
+    chain = MagicMock()
+    chain.invoke.return_value = _output(_result("a.py", "bug"))
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+
+    result = json.loads(analyze_code_with_langchain(TWO_FILE_DIFF))
+
+    assert chain.invoke.call_count == 1
+    prompt = chain.invoke.call_args[0][0]["pr_diff"]
+    assert "a/a.py" in prompt and "a/b.py" in prompt
+    assert result["usage"]["llm_calls"] == 1
+
+def test_analyze_code_reports_precheck_issues_first(mocker):
+    diff = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x = 0\n+x = 1   \n"
+    chain = MagicMock()
+    chain.invoke.return_value = _output(_result("a.py", "bug"))
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+    partials = []
+
+    result = json.loads(analyze_code_with_langchain(diff, on_chunk_reviewed=partials.append))
+
+    assert [issue.description for issue in partials[0].files[0].issues] == ["Trailing whitespace."]
+    assert [issue["type"] for issue in result["files"][0]["issues"]] == ["style", "bug"]
+
+def test_analyze_code_reviews_only_hunks_missing_from_the_hunk_cache(mocker):
+    hunk = "@@ -10,1 +10,2 @@\n def f():\n+    return eval(x)\n"
+    header = "diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n"
+    chain = MagicMock()
+    chain.invoke.return_value = _output(AnalysisResultData.from_files([FileAnalysis(name="a.py", issues=[
+        Issue(type="bug", line=11, description="eval of input", suggestion="avoid eval"),
+    ])]))
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+    analyze_code_with_langchain(header + hunk)
+
+    # After a rebase the hunk moved down 20 lines, and a new hunk was added
+    rebased = hunk.replace("-10,1 +10,2", "-30,1 +30,2") + "@@ -50,1 +50,2 @@\n y = 1\n+z = 2\n"
+    chain.invoke.return_value = _output(AnalysisResultData.from_files([]))
+    result = json.loads(analyze_code_with_langchain(header + rebased))
+
+    prompt = chain.invoke.call_args[0][0]["pr_diff"]
+    assert "+z = 2" in prompt and "eval" not in prompt
+    assert [(issue["line"], issue["description"]) for issue in result["files"][0]["issues"]] == [(31, "eval of input")]
+
+def test_analyze_code_raises_on_unparsable_output(mocker):
+    chain = MagicMock()
+    chain.invoke.return_value = {"raw": AIMessage(content="oops"), "parsed": None, "parsing_error": ValueError("bad")}
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+
+    with pytest.raises(ValueError, match="malformed JSON"):
+        analyze_code_with_langchain(TWO_FILE_DIFF)
+
+def test_analyze_code_turns_throttling_into_rate_limit_error(mocker, fake_redis):
+    chain = MagicMock()
+    chain.invoke.side_effect = google_exceptions.ResourceExhausted("quota exceeded")
+    mocker.patch("app.services.analyzer.get_chain", return_value=chain)
+
+    with pytest.raises(LLMRateLimitError):
+        analyze_code_with_langchain(TWO_FILE_DIFF)
+    assert float(fake_redis.get(f"llm-rate:{MODEL_NAME}:multiplier")) == 0.5
+
+def test_plan_prompts_routes_files_by_tier():
+    diff = (
+        "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n-x = 0\n+x = 1\n"
+        "diff --git a/README.md b/README.md\n--- a/README.md\n+++ b/README.md\n@@ -1 +1 @@\n-Old\n+New\n"
+        "diff --git a/old.py b/new.py\nsimilarity index 100%\nrename from old.py\nrename to new.py\n"
+    )
+
+    prompts = plan_prompts(parse_diff(diff))
+
+    assert [model for model, _ in prompts] == [MODEL_NAME, LIGHT_MODEL_NAME]
+    assert "app.py" in prompts[0][1] and "README.md" not in prompts[0][1]
+    assert "README.md" in prompts[1][1]
+    assert not any("new.py" in prompt for _, prompt in prompts)
+
+def test_get_chain_is_built_once_per_configuration(mocker):
+    build_chain = mocker.patch("app.services.analyzer._build_chain", side_effect=lambda model, temperature: object())
+    mocker.patch.dict("app.services.analyzer._chains", clear=True)
+
+    assert get_chain() is get_chain()
+    assert get_chain(temperature=0.5) is not get_chain()
+    assert build_chain.call_count == 2
@@ -1,15 +1,57 @@
+import json
 import pytest
+import fakeredis
 from fastapi import status
 from unittest.mock import patch
 from app.routes.analysis import results_cache # Import the cache to clear it
 
+SAMPLE_RESULT = {
+    "files": [
+        {
+            "name": "main.py",
+            "issues": [
+                {
+                    "type": "style",
+                    "line": 15,
+                    "description": "Line too long",
+                    "suggestion": "Break line into multiple lines"
+                }
+            ]
+        }
+    ],
+    "summary": {
+        "total_files": 1,
+        "total_issues": 1,
+        "critical_issues": 0
+    }
+}
+
 @pytest.fixture(autouse=True)
-def clear_cache():
-    """Clears the in-memory cache before each API test."""
+def fake_redis(mocker):
+    """
+    Backs the result store and Celery task metadata with a fresh in-memory Redis
+    and clears the in-process cache before each API test.
+    """
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.result_store.get_redis", return_value=sync_client)
+    mocker.patch("app.services.result_store.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    mocker.patch("app.services.task_meta.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
     results_cache.clear()
-    yield
+    yield sync_client
+
+def set_task_meta(redis_client, task_id, status, result=None):
+    """Stores task metadata the way Celery's Redis result backend does."""
+    redis_client.set(f"celery-task-meta-{task_id}", json.dumps({"status": status, "result": result, "task_id": task_id}))
 
-def test_analyze_pr_endpoint(client, mock_async_result):
+@pytest.fixture
+def mock_enqueue(mocker):
+    """Mocks the PR metadata lookup and the task enqueue of /analyze-pr."""
+    mocker.patch("app.routes.analysis.get_pr_metadata", return_value={"head": {"sha": "abc1234"}})
+    mocker.patch("app.services.single_flight.get_async_redis", return_value=fakeredis.FakeAsyncRedis())
+    return mocker.patch("app.routes.analysis.celery_app.send_task")
+
+def test_analyze_pr_endpoint(client, mock_enqueue):
     """Test the POST /analyze-pr endpoint."""
     repo_url = "https://github.com/test/repo"
     pr_number = 1
@@ -21,102 +63,116 @@ def test_analyze_pr_endpoint(client, mock_async_result):
     )
 
     assert response.status_code == status.HTTP_202_ACCEPTED
-    assert response.json()["task_id"] == mock_async_result.id
     assert response.json()["status"] == "PENDING"
-    mock_async_result.delay.assert_called_once_with(repo_url, pr_number, github_token)
+    mock_enqueue.assert_called_once()
+    assert mock_enqueue.call_args.kwargs["args"] == [repo_url, pr_number, github_token]
+    assert mock_enqueue.call_args.kwargs["task_id"] == response.json()["task_id"]
+    assert mock_enqueue.call_args.kwargs["queue"] == "reviews.small"
 
-def test_get_status_pending(client, mock_async_result):
-    """Test GET /status/{task_id} for a pending task."""
-    mock_async_result.state = "PENDING"
-    mock_async_result.ready.return_value = False
+def test_analyze_pr_routes_large_prs_to_the_large_queue(client, mocker, mock_enqueue):
+    """Test that PR size decides the queue a task is routed to."""
+    mocker.patch("app.routes.analysis.get_pr_metadata", return_value={
+        "head": {"sha": "abc1234"}, "additions": 4000, "deletions": 1000, "changed_files": 60
+    })
+
+    client.post("/api/v1/analyze-pr", json={"repo_url": "https://github.com/test/repo", "pr_number": 2})
+
+    assert mock_enqueue.call_args.kwargs["queue"] == "reviews.large"
+
+def test_analyze_pr_deduplicates_identical_requests(client, mock_enqueue):
+    """Test that concurrent requests for the same PR head share one task."""
+    payload = {"repo_url": "https://github.com/test/repo", "pr_number": 1}
+
+    first = client.post("/api/v1/analyze-pr", json=payload)
+    second = client.post("/api/v1/analyze-pr", json=payload)
 
-    response = client.get(f"/api/v1/status/{mock_async_result.id}")
+    assert first.json()["task_id"] == second.json()["task_id"]
+    mock_enqueue.assert_called_once()
+
+def test_get_status_pending(client, fake_redis):
+    """Test GET /status/{task_id} for a pending task."""
+    response = client.get("/api/v1/status/task-1")
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.json()["task_id"] == mock_async_result.id
+    assert response.json()["task_id"] == "task-1"
     assert response.json()["status"] == "PENDING"
     assert response.json()["detail"] is None
 
-def test_get_status_processing(client, mock_async_result):
+def test_get_status_processing(client, fake_redis):
     """Test GET /status/{task_id} for a processing task."""
-    mock_async_result.state = "PROCESSING"
-    mock_async_result.info = {'status': 'Fetching PR diff...'}
-    mock_async_result.ready.return_value = False
+    set_task_meta(fake_redis, "task-1", "PROCESSING", {'status': 'Fetching PR diff...'})
 
-    response = client.get(f"/api/v1/status/{mock_async_result.id}")
+    response = client.get("/api/v1/status/task-1")
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.json()["task_id"] == mock_async_result.id
+    assert response.json()["task_id"] == "task-1"
     assert response.json()["status"] == "PROCESSING"
     assert response.json()["detail"] == "Fetching PR diff..."
 
-def test_get_status_failure(client, mock_async_result):
+def test_get_status_failure(client, fake_redis):
     """Test GET /status/{task_id} for a failed task."""
-    mock_async_result.state = "FAILURE"
-    mock_async_result.failed.return_value = True
-    mock_async_result.result = ValueError("Test error message") # Simulate exception
+    set_task_meta(fake_redis, "task-1", "FAILURE", {
+        "exc_type": "ValueError", "exc_message": ["Test error message"], "exc_module": "builtins"
+    })
 
-    response = client.get(f"/api/v1/status/{mock_async_result.id}")
+    response = client.get("/api/v1/status/task-1")
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.json()["task_id"] == mock_async_result.id
+    assert response.json()["task_id"] == "task-1"
     assert response.json()["status"] == "FAILURE"
     assert "Task failed with an error: Test error message" in response.json()["detail"]
 
-def test_get_results_not_ready(client, mock_async_result):
-    """Test GET /results/{task_id} when task is not ready."""
-    mock_async_result.state = "PENDING"
-    mock_async_result.ready.return_value = False
+def test_get_status_batch(client, fake_redis):
+    """Test POST /status/batch returns the status of every requested task."""
+    set_task_meta(fake_redis, "task-1", "PROCESSING", {'status': 'Fetching PR diff...'})
+    set_task_meta(fake_redis, "task-2", "SUCCESS", SAMPLE_RESULT)
+
+    response = client.post("/api/v1/status/batch", json={"task_ids": ["task-1", "task-2", "task-3"]})
 
-    response = client.get(f"/api/v1/results/{mock_async_result.id}")
+    assert response.status_code == status.HTTP_200_OK
+    assert [item["status"] for item in response.json()] == ["PROCESSING", "SUCCESS", "PENDING"]
+
+def test_get_results_not_ready(client, fake_redis):
+    """Test GET /results/{task_id} when task is not ready."""
+    response = client.get("/api/v1/results/task-1")
 
     assert response.status_code == status.HTTP_202_ACCEPTED
     assert "Task is not complete" in response.json()["detail"]
 
-def test_get_results_failed(client, mock_async_result):
+def test_get_results_failed(client, fake_redis):
     """Test GET /results/{task_id} when task has failed."""
-    mock_async_result.state = "FAILURE"
-    mock_async_result.ready.return_value = True
-    mock_async_result.failed.return_value = True
+    set_task_meta(fake_redis, "task-1", "FAILURE", {"exc_type": "ValueError", "exc_message": ["boom"]})
 
-    response = client.get(f"/api/v1/results/{mock_async_result.id}")
+    response = client.get("/api/v1/results/task-1")
 
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert "Task failed. Use the status endpoint for more details." in response.json()["detail"]
 
-def test_get_results_completed(client, mock_async_result, mock_crew_analysis):
+def test_get_results_completed(client, fake_redis):
     """Test GET /results/{task_id} when task is completed successfully."""
-    mock_async_result.state = "SUCCESS"
-    mock_async_result.ready.return_value = True
-    mock_async_result.failed.return_value = False
-    mock_async_result.get.return_value = mock_crew_analysis # Return the expected dict
+    set_task_meta(fake_redis, "task-1", "SUCCESS", SAMPLE_RESULT)
 
-    response = client.get(f"/api/v1/results/{mock_async_result.id}")
+    response = client.get("/api/v1/results/task-1")
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.json()["task_id"] == mock_async_result.id
+    assert response.json()["task_id"] == "task-1"
     assert response.json()["status"] == "COMPLETED"
-    assert response.json()["results"] == mock_crew_analysis
-    assert mock_async_result.id in results_cache # Check if cached
+    assert response.json()["results"] == SAMPLE_RESULT
+    assert "task-1" in results_cache # Check if cached
 
-def test_get_results_from_cache(client, mock_async_result, mock_crew_analysis):
+def test_get_results_from_cache(client, fake_redis):
     """Test GET /results/{task_id} retrieves from cache on second call."""
     # First call to populate cache
-    mock_async_result.state = "SUCCESS"
-    mock_async_result.ready.return_value = True
-    mock_async_result.failed.return_value = False
-    mock_async_result.get.return_value = mock_crew_analysis
-
-    client.get(f"/api/v1/results/{mock_async_result.id}")
+    set_task_meta(fake_redis, "task-1", "SUCCESS", SAMPLE_RESULT)
+    client.get("/api/v1/results/task-1")
 
-    # Reset mock to ensure .get() is not called again
-    mock_async_result.get.reset_mock()
+    # Remove the task metadata to ensure the backend is not read again
+    fake_redis.delete("celery-task-meta-task-1")
 
     # Second call should hit cache
-    response = client.get(f"/api/v1/results/{mock_async_result.id}")
+    response = client.get("/api/v1/results/task-1")
 
     assert response.status_code == status.HTTP_200_OK
-    assert response.json()["task_id"] == mock_async_result.id
+    assert response.json()["task_id"] == "task-1"
     assert response.json()["status"] == "COMPLETED"
-    assert response.json()["results"] == mock_crew_analysis
-    mock_async_result.get.assert_not_called() # Verify it came from cache
+    assert response.json()["results"] == SAMPLE_RESULT
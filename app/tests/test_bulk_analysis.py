@@ -0,0 +1,145 @@
+import json
+
+import fakeredis
+import pytest
+from fastapi import status
+
+from app.services import bulk_analysis
+from app.services.bulk_analysis import select_prs, store_task_summary
+from app.services.github_helper import list_open_prs, GitHubConnectionError, GitHubRateLimitError
+
+REPO_URL = "https://github.com/test/repo"
+
+def make_pr(number, head_sha, draft=False, labels=()):
+    return {"number": number, "head": {"sha": head_sha}, "draft": draft, "labels": [{"name": label} for label in labels]}
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    for module in ("app.services.bulk_analysis", "app.services.task_meta", "app.services.single_flight"):
+        mocker.patch(f"{module}.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.bulk_analysis.get_redis", return_value=client)
+    return client
+
+@pytest.fixture
+def mock_group(mocker):
+    return mocker.patch("app.routes.analysis.group")
+
+def test_select_prs_skips_drafts_and_applies_filters():
+    prs = [
+        make_pr(1, "a"),
+        make_pr(2, "b", draft=True),
+        make_pr(3, "c", labels=["needs-review"]),
+        make_pr(4, "d", labels=["wip"]),
+    ]
+
+    assert [pr["number"] for pr in select_prs(prs)] == [1, 3, 4]
+    assert [pr["number"] for pr in select_prs(prs, labels=["needs-review"])] == [3]
+    assert [pr["number"] for pr in select_prs(prs, pr_numbers=[2, 4])] == [4]
+
+def test_list_open_prs_paginates(mocker):
+    client = mocker.Mock()
+    client.get_json.side_effect = [[make_pr(n, "x") for n in range(100)], [make_pr(100, "y")]]
+    mocker.patch("app.services.github_helper.get_github_client", return_value=client)
+
+    prs = list_open_prs(REPO_URL, "token", base="main")
+
+    assert len(prs) == 101
+    assert client.get_json.call_count == 2
+    assert client.get_json.call_args.kwargs["params"] == {"state": "open", "per_page": 100, "base": "main", "page": 2}
+
+def test_list_open_prs_invalid_url():
+    with pytest.raises(GitHubConnectionError):
+        list_open_prs("https://github.com/invalid")
+
+def test_analyze_bulk_dispatches_one_group(client, mocker, mock_group):
+    list_prs = mocker.patch(
+        "app.routes.analysis.list_open_prs",
+        return_value=[make_pr(1, "aaa"), make_pr(2, "bbb", draft=True), make_pr(3, "ccc")],
+    )
+
+    response = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL], "github_token": "token"})
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    body = response.json()
+    assert body["status"] == "PENDING"
+    assert body["total"] == 2
+    assert [task["pr_number"] for task in body["tasks"]] == [1, 3]
+    list_prs.assert_called_once_with(REPO_URL, "token", None, wait=False)
+
+    signatures = mock_group.call_args.args[0]
+    assert [list(sig.args) for sig in signatures] == [[REPO_URL, 1, "token"], [REPO_URL, 3, "token"]]
+    assert signatures[0].kwargs["head_sha"] == "aaa"
+    assert [sig.options["task_id"] for sig in signatures] == [task["task_id"] for task in body["tasks"]]
+    mock_group.return_value.apply_async.assert_called_once_with(task_id=body["bulk_id"])
+
+def test_analyze_bulk_reuses_task_in_flight(client, mocker, mock_group):
+    mocker.patch("app.routes.analysis.list_open_prs", return_value=[make_pr(1, "aaa")])
+
+    first = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]}).json()
+    second = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]}).json()
+
+    assert second["tasks"][0]["task_id"] == first["tasks"][0]["task_id"]
+    assert mock_group.return_value.apply_async.call_count == 1
+
+def test_analyze_bulk_github_error(client, mocker, mock_group):
+    mocker.patch("app.routes.analysis.list_open_prs", side_effect=GitHubConnectionError("Repository not found"))
+
+    response = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]})
+
+    assert response.status_code == status.HTTP_502_BAD_GATEWAY
+    mock_group.assert_not_called()
+
+def test_analyze_bulk_does_not_wait_for_the_rate_limit(client, mocker, mock_group):
+    list_prs = mocker.patch("app.routes.analysis.list_open_prs", side_effect=GitHubRateLimitError("Rate limited", 42.0))
+
+    response = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]})
+
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "43"
+    assert list_prs.call_args.kwargs["wait"] is False
+    mock_group.assert_not_called()
+
+def test_bulk_status_combines_summaries(client, mocker, mock_group, fake_redis):
+    mocker.patch("app.routes.analysis.list_open_prs", return_value=[make_pr(1, "aaa"), make_pr(2, "bbb"), make_pr(3, "ccc")])
+    body = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]}).json()
+    first, second, third = (task["task_id"] for task in body["tasks"])
+    result = {"files": [], "summary": {"total_files": 2, "total_issues": 3, "critical_issues": 1}}
+    fake_redis.set(f"celery-task-meta-{first}", json.dumps({"status": "SUCCESS", "result": result}))
+    fake_redis.set(f"celery-task-meta-{second}", json.dumps({"status": "SUCCESS", "result": result}))
+
+    response = client.get(f"/api/v1/bulk/{body['bulk_id']}")
+
+    assert response.status_code == status.HTTP_200_OK
+    progress = response.json()
+    assert progress["status"] == "PROCESSING"
+    assert progress["completed"] == 2
+    assert progress["failed"] == 0
+    assert progress["summary"] == {"total_files": 4, "total_issues": 6, "critical_issues": 2}
+
+    fake_redis.set(f"celery-task-meta-{third}", json.dumps({"status": "FAILURE", "result": {"exc_type": "ValueError"}}))
+    progress = client.get(f"/api/v1/bulk/{body['bulk_id']}").json()
+    assert progress["status"] == "COMPLETED"
+    assert progress["failed"] == 1
+
+def test_bulk_status_reads_stored_summaries_and_counts_revoked_apart(client, mocker, mock_group, fake_redis):
+    mocker.patch("app.routes.analysis.list_open_prs", return_value=[make_pr(1, "aaa"), make_pr(2, "bbb")])
+    body = client.post("/api/v1/analyze-bulk", json={"repo_urls": [REPO_URL]}).json()
+    reviewed, superseded = (task["task_id"] for task in body["tasks"])
+    store_task_summary(reviewed, {"total_files": 2, "total_issues": 3, "critical_issues": 1})
+    fake_redis.set(f"celery-task-meta-{superseded}", json.dumps({"status": "REVOKED", "result": None}))
+    get_task_metas = mocker.spy(bulk_analysis, "get_task_metas")
+
+    progress = client.get(f"/api/v1/bulk/{body['bulk_id']}").json()
+
+    # The finished review's full result is never read
+    assert get_task_metas.call_args.args[0] == [superseded]
+    assert progress["status"] == "COMPLETED"
+    assert (progress["completed"], progress["failed"], progress["revoked"]) == (1, 0, 1)
+    assert progress["summary"] == {"total_files": 2, "total_issues": 3, "critical_issues": 1}
+
+def test_bulk_status_not_found(client):
+    response = client.get("/api/v1/bulk/unknown")
+
+    assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -1,9 +1,24 @@
 import pytest
 import json
+import fakeredis
 from app.services.tasks import run_code_analysis_task
-from app.services.github_helper import GitHubConnectionError
+from app.services.github_helper import GitHubConnectionError, PRDiff
+from app.services.github_webhooks import _latest_key
+from app.services.result_store import results_store
 from app.models.analysis import AnalysisResultData
 
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    """Backs the review cache and review state with an in-memory Redis."""
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.review_cache.get_redis", return_value=client)
+    mocker.patch("app.services.review_state.get_redis", return_value=client)
+    mocker.patch("app.services.task_events.get_redis", return_value=client)
+    mocker.patch("app.services.github_webhooks.get_redis", return_value=client)
+    mocker.patch("app.services.result_store.get_redis", return_value=client)
+    mocker.patch("app.services.bulk_analysis.get_redis", return_value=client)
+    return client
+
 def test_run_code_analysis_task_success(celery_app, mocker, mock_github_diff):
     """
     Test successful execution of run_code_analysis_task.
@@ -14,7 +29,7 @@ def test_run_code_analysis_task_success(celery_app, mocker, mock_github_diff):
 
     # Mock the analyzer to return a valid JSON string
     mock_analysis_json = '{"files": [{"name": "main.py", "issues": [{"type": "style", "line": 1, "description": "desc", "suggestion": "sugg"}]}], "summary": {"total_files": 1, "total_issues": 1, "critical_issues": 0}}'
-    mocker.patch("app.services.tasks.analyze_code_with_langchain", return_value=mock_analysis_json)
+    mocker.patch("app.services.tasks.review_diff", return_value=AnalysisResultData.model_validate_json(mock_analysis_json))
 
     result = run_code_analysis_task.delay(repo_url, pr_number, github_token).get()
 
@@ -33,8 +48,8 @@ def test_run_code_analysis_task_malformed_json(celery_app, mocker, mock_github_d
     pr_number = 1
     github_token = "test_token"
 
-    # Mock the analyzer to return invalid JSON
-    mocker.patch("app.services.tasks.analyze_code_with_langchain", return_value="this is not json")
+    # Mock the analyzer failing to parse the model's output
+    mocker.patch("app.services.tasks.review_diff", side_effect=ValueError("The AI returned a malformed JSON response."))
 
     task = run_code_analysis_task.delay(repo_url, pr_number, github_token)
     
@@ -51,7 +66,7 @@ def test_run_code_analysis_task_analyzer_exception(celery_app, mocker, mock_gith
     github_token = "test_token"
 
     # Mock the analyzer to raise an exception
-    mocker.patch("app.services.tasks.analyze_code_with_langchain", side_effect=Exception("Analyzer internal error"))
+    mocker.patch("app.services.tasks.review_diff", side_effect=Exception("Analyzer internal error"))
 
     task = run_code_analysis_task.delay(repo_url, pr_number, github_token)
     
@@ -69,7 +84,7 @@ def test_run_code_analysis_task_github_connection_error(celery_app, mocker):
 
     # Mock get_pr_diff to raise our custom connection error
     mocker.patch(
-        "app.services.tasks.get_pr_diff",
+        "app.services.tasks.fetch_pr_diff",
         side_effect=GitHubConnectionError("GitHub API down")
     )
 
@@ -77,3 +92,76 @@ def test_run_code_analysis_task_github_connection_error(celery_app, mocker):
 
     with pytest.raises(GitHubConnectionError, match="GitHub API down"):
         task.get()
+
+def test_run_code_analysis_task_uses_review_cache(celery_app, mocker):
+    """
+    Test that a second run over an identical diff is served from the review cache.
+    """
+    mocker.patch("app.services.tasks.fetch_pr_diff", return_value=PRDiff(head_sha="abc1234", diff="diff content here"))
+    mock_analysis_json = '{"files": [], "summary": {"total_files": 0, "total_issues": 0, "critical_issues": 0}}'
+    mock_analyzer = mocker.patch("app.services.tasks.review_diff", return_value=AnalysisResultData.model_validate_json(mock_analysis_json))
+
+    first = run_code_analysis_task.delay("https://github.com/test/repo", 1).get()
+    second = run_code_analysis_task.delay("https://github.com/test/repo", 1).get()
+
+    assert first == second
+    mock_analyzer.assert_called_once()
+
+def _file_diff(path, blob_sha, line):
+    return (
+        f"diff --git a/{path} b/{path}\nindex 0000000..{blob_sha} 100644\n"
+        f"--- a/{path}\n+++ b/{path}\n@@ -0,0 +1 @@\n+{line}\n"
+    )
+
+def test_run_code_analysis_task_incremental_review(celery_app, mocker):
+    """
+    Test that after a new push only the changed files are sent to the analyzer
+    and findings for unchanged files are reused.
+    """
+    first_push = _file_diff("a.py", "aaaaaaa", "x = 1") + _file_diff("b.py", "bbbbbbb", "y = 2")
+    second_push = _file_diff("a.py", "aaaaaaa", "x = 1") + _file_diff("b.py", "ccccccc", "y = 3")
+    mocker.patch("app.services.tasks.fetch_pr_diff", side_effect=[
+        PRDiff.from_diff("1111111", first_push),
+        PRDiff.from_diff("2222222", second_push),
+    ])
+
+    def fake_analysis(diff, **kwargs):
+        files = [
+            {"name": name, "issues": [{"type": "bug", "line": 1, "description": f"issue in {name}", "suggestion": "fix"}]}
+            for name in ("a.py", "b.py") if f"b/{name}" in diff
+        ]
+        return AnalysisResultData.model_validate({"files": files, "summary": {"total_files": len(files), "total_issues": len(files), "critical_issues": len(files)}})
+    mock_analyzer = mocker.patch("app.services.tasks.review_diff", side_effect=fake_analysis)
+
+    run_code_analysis_task.delay("https://github.com/test/repo", 1).get()
+    result = run_code_analysis_task.delay("https://github.com/test/repo", 1).get()
+
+    second_diff = mock_analyzer.call_args_list[1].args[0]
+    assert "b/b.py" in second_diff and "b/a.py" not in second_diff
+    assert [f["name"] for f in result["files"]] == ["a.py", "b.py"]
+    assert result["summary"]["total_issues"] == 2
+
+def test_run_code_analysis_task_skips_superseded_head(celery_app, mocker, fake_redis):
+    """
+    Test that a webhook-triggered task whose head was superseded by a newer push skips the review.
+    """
+    fake_redis.hset(_latest_key("https://github.com/test/repo", 1), "head_sha", "2222222")
+    mock_fetch = mocker.patch("app.services.tasks.fetch_pr_diff")
+
+    task = run_code_analysis_task.apply(args=["https://github.com/test/repo", 1], kwargs={"head_sha": "1111111"})
+
+    assert task.state == "IGNORED"
+    mock_fetch.assert_not_called()
+
+def test_run_code_analysis_task_stores_serialized_result(celery_app, mocker):
+    """
+    Test that the worker stores the final response pre-serialized for the API.
+    """
+    mocker.patch("app.services.tasks.fetch_pr_diff", return_value=PRDiff(head_sha="abc1234", diff="diff content here"))
+    mocker.patch("app.services.tasks.review_diff", return_value=AnalysisResultData.from_files([]))
+
+    task = run_code_analysis_task.delay("https://github.com/test/repo", 1)
+
+    payload = json.loads(results_store.get(task.id))
+    assert payload["status"] == "COMPLETED"
+    assert payload["results"] == task.get()
@@ -0,0 +1,76 @@
+import io
+
+from app.services.diff_parser import parse_diff, chunk_diff, iter_file_diffs, iter_file_lines, select_reviewable_files
+
+SAMPLE_DIFF = """diff --git a/app/main.py b/app/main.py
+index 1111111..2222222 100644
+--- a/app/main.py
++++ b/app/main.py
+@@ -1,3 +1,4 @@
+ import os
++import sys
+ 
+ def main():
+@@ -10,2 +11,3 @@ def main():
+     pass
++    return 0
+diff --git a/README.md b/README.md
+new file mode 100644
+index 0000000..3333333
+--- /dev/null
++++ b/README.md
+@@ -0,0 +1 @@
++# Title
+"""
+
+def test_parse_diff_splits_files_and_hunks():
+    files = parse_diff(SAMPLE_DIFF)
+
+    assert [f.path for f in files] == ["app/main.py", "README.md"]
+    main_py = files[0]
+    assert len(main_py.hunks) == 2
+    assert main_py.hunks[1].new_start == 11
+    assert main_py.hunks[1].new_count == 3
+    assert main_py.hunks[1].lines == ["     pass", "+    return 0"]
+    assert files[1].hunks[0].old_count == 0
+    assert files[1].hunks[0].new_count == 1
+
+def test_chunk_diff_one_chunk_per_file():
+    chunks = chunk_diff(parse_diff(SAMPLE_DIFF), max_chunk_chars=10_000)
+
+    assert len(chunks) == 2
+    assert chunks[0].startswith("diff --git a/app/main.py")
+    assert "+# Title" in chunks[1]
+
+def test_chunk_diff_splits_large_files_by_hunk():
+    chunks = chunk_diff(parse_diff(SAMPLE_DIFF), max_chunk_chars=150)
+
+    main_chunks = [c for c in chunks if "app/main.py" in c]
+    assert len(main_chunks) == 2
+    # Each hunk chunk repeats the file header so it can be reviewed on its own
+    assert all(c.startswith("diff --git a/app/main.py") for c in main_chunks)
+    assert "+import sys" in main_chunks[0] and "+    return 0" in main_chunks[1]
+
+def test_iter_file_diffs_streams_from_file_and_drops_oversized_hunks():
+    spool = io.BytesIO(SAMPLE_DIFF.encode())
+
+    files = list(iter_file_diffs(iter_file_lines(spool), max_file_bytes=150))
+
+    assert [f.path for f in files] == ["app/main.py", "README.md"]
+    assert files[0].truncated and files[0].hunks == []
+    assert not files[1].truncated
+
+def test_select_reviewable_files_skips_generated_binary_and_excess_files():
+    diff = SAMPLE_DIFF + (
+        "diff --git a/yarn.lock b/yarn.lock\n--- a/yarn.lock\n+++ b/yarn.lock\n@@ -1 +1 @@\n+x\n"
+        "diff --git a/logo.png b/logo.png\nBinary files a/logo.png and b/logo.png differ\n"
+    )
+
+    selected, skipped = select_reviewable_files(iter_file_diffs(diff.splitlines()), max_files=1, max_file_bytes=10_000)
+
+    assert [f.path for f in selected] == ["app/main.py"]
+    assert skipped == [
+        "README.md (over the 1 file limit)",
+        "yarn.lock (generated or vendored file)",
+        "logo.png (binary file)",
+    ]
@@ -0,0 +1,191 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from fastapi import status
+from kombu.exceptions import OperationalError
+
+from app.core.metrics import TENANT_QUEUE_WAIT_SECONDS
+from app.core.tracing import start_task_span, end_task_span
+from app.services.fair_scheduler import (
+    LOCK_KEY, RUNNING_KEY, TenantQuotaExceeded, dispatch_pending, make_entry, release, run_dispatcher,
+    submit, tenant_for,
+)
+from app.services.task_routing import QUEUE_LARGE, QUEUE_SMALL
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    for module in ("app.services.fair_scheduler", "app.services.single_flight"):
+        mocker.patch(f"{module}.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.fair_scheduler.get_redis", return_value=client)
+    mocker.patch("app.services.fair_scheduler.settings.FAIR_MAX_DISPATCHED", 4)
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_MAX_CONCURRENCY", 10)
+    return client
+
+@pytest.fixture
+def send_task(mocker):
+    return mocker.patch("app.services.fair_scheduler.celery_app.send_task")
+
+def entries(prefix, count, queue=QUEUE_SMALL):
+    return [make_entry(f"{prefix}-{i}", ["https://github.com/o/r", i], {}, queue=queue, priority=0) for i in range(count)]
+
+def dispatched(send_task):
+    return [call.kwargs["task_id"] for call in send_task.call_args_list]
+
+def test_tenant_is_the_token_digest_or_the_repository_owner():
+    assert tenant_for("https://github.com/Acme/repo") == "owner:acme"
+    tenant = tenant_for("https://github.com/acme/repo", "secret-token")
+    assert tenant.startswith("token:") and "secret" not in tenant
+
+def test_small_tenant_is_not_starved_by_a_large_backlog(send_task):
+    asyncio.run(submit("big", entries("big", 50)))
+    asyncio.run(submit("small", entries("small", 1)))
+
+    asyncio.run(dispatch_pending())
+
+    # The four slots are shared round-robin instead of going to the first 4 of 50
+    assert "small-0" in dispatched(send_task)
+    assert len(dispatched(send_task)) == 4
+    assert send_task.call_args_list[0].kwargs["headers"]["tenant"] in {"big", "small"}
+
+def test_dispatch_stops_at_tenant_concurrency_until_a_slot_is_freed(mocker, send_task):
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_MAX_CONCURRENCY", 2)
+    asyncio.run(submit("acme", entries("acme", 5)))
+
+    asyncio.run(dispatch_pending())
+    assert dispatched(send_task) == ["acme-0", "acme-1"]
+
+    release("acme", "acme-0")
+    asyncio.run(dispatch_pending())
+    assert dispatched(send_task) == ["acme-0", "acme-1", "acme-2"]
+
+def test_capacity_is_shared_by_weight(mocker, send_task):
+    mocker.patch("app.services.fair_scheduler.settings.FAIR_MAX_DISPATCHED", 8)
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_WEIGHTS", {"a": 3})
+    asyncio.run(submit("a", entries("a", 10)))
+    asyncio.run(submit("b", entries("b", 10)))
+
+    asyncio.run(dispatch_pending())
+
+    tasks = dispatched(send_task)
+    assert sum(task.startswith("a-") for task in tasks) == 6
+    assert sum(task.startswith("b-") for task in tasks) == 2
+
+def test_large_prs_use_more_of_the_share(send_task):
+    asyncio.run(submit("large", entries("large", 4, queue=QUEUE_LARGE)))
+    asyncio.run(submit("small", entries("small", 4)))
+
+    asyncio.run(dispatch_pending())
+
+    tasks = dispatched(send_task)
+    assert sum(task.startswith("small-") for task in tasks) == 3
+    assert sum(task.startswith("large-") for task in tasks) == 1
+
+def test_submissions_over_the_quota_are_rejected_whole(mocker, send_task):
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_MAX_PENDING", 3)
+    asyncio.run(submit("acme", entries("first", 2)))
+
+    with pytest.raises(TenantQuotaExceeded):
+        asyncio.run(submit("acme", entries("second", 2)))
+
+    asyncio.run(dispatch_pending())
+    assert dispatched(send_task) == ["first-0", "first-1"]
+
+def test_slot_is_taken_before_the_task_is_sent(fake_redis, send_task):
+    # A task finishing at once frees its slot from inside send_task
+    send_task.side_effect = lambda *args, **kwargs: release("acme", kwargs["task_id"])
+    asyncio.run(submit("acme", entries("acme", 1)))
+
+    asyncio.run(dispatch_pending())
+
+    assert fake_redis.zcard(RUNNING_KEY) == 0
+
+def test_failed_send_returns_the_task_to_the_tenant(fake_redis, send_task):
+    send_task.side_effect = OperationalError("broker down")
+    asyncio.run(submit("acme", entries("acme", 1)))
+
+    with pytest.raises(OperationalError):
+        asyncio.run(dispatch_pending())
+
+    assert fake_redis.zcard(RUNNING_KEY) == 0
+    assert fake_redis.get(LOCK_KEY) is None
+    send_task.side_effect = None
+    asyncio.run(dispatch_pending())
+    assert dispatched(send_task)[-1] == "acme-0"
+
+def test_pass_does_not_release_a_lock_taken_over_by_another_process(fake_redis, send_task):
+    send_task.side_effect = lambda *args, **kwargs: fake_redis.set(LOCK_KEY, "other")
+    asyncio.run(submit("acme", entries("acme", 1)))
+
+    asyncio.run(dispatch_pending())
+
+    assert fake_redis.get(LOCK_KEY) == b"other"
+
+def test_analyze_pr_is_queued_when_the_broker_is_down(client, mocker, send_task):
+    mocker.patch("app.routes.analysis.settings.FAIR_SCHEDULING", True)
+    mocker.patch("app.routes.analysis.get_pr_metadata", return_value={"head": {"sha": "abc1234"}})
+    send_task.side_effect = OperationalError("broker down")
+
+    response = client.post("/api/v1/analyze-pr", json={"repo_url": "https://github.com/acme/repo", "pr_number": 1})
+
+    # Left pending for the dispatcher rather than failing a request that was queued
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+def test_dispatcher_keeps_running_after_a_broker_error(mocker):
+    mocker.patch("app.services.fair_scheduler.settings.FAIR_DISPATCH_INTERVAL_SECONDS", 0)
+    calls = []
+
+    async def failing_pass():
+        calls.append(1)
+        if len(calls) < 3:
+            raise OperationalError("broker down")
+        raise asyncio.CancelledError
+
+    mocker.patch("app.services.fair_scheduler.dispatch_pending", side_effect=failing_pass)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run_dispatcher())
+    assert len(calls) == 3
+
+def test_analyze_pr_waits_for_its_tenant_turn(client, mocker, send_task):
+    mocker.patch("app.routes.analysis.settings.FAIR_SCHEDULING", True)
+    mocker.patch("app.routes.analysis.get_pr_metadata", return_value={"head": {"sha": "abc1234"}})
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_MAX_PENDING", 0)
+
+    response = client.post("/api/v1/analyze-pr", json={"repo_url": "https://github.com/acme/repo", "pr_number": 1})
+
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    send_task.assert_not_called()
+
+    mocker.patch("app.services.fair_scheduler.settings.TENANT_MAX_PENDING", 10)
+    response = client.post("/api/v1/analyze-pr", json={"repo_url": "https://github.com/acme/repo", "pr_number": 1})
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert send_task.call_args.kwargs["task_id"] == response.json()["task_id"]
+    assert send_task.call_args.kwargs["headers"]["tenant"] == "owner:acme"
+
+def tenant_wait_count(tenant):
+    for metric in TENANT_QUEUE_WAIT_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_count") and sample.labels.get("tenant") == tenant:
+                return sample.value
+    return 0
+
+def test_queue_wait_is_recorded_by_weighted_tenant(mocker):
+    mocker.patch("app.core.metrics.settings.TENANT_WEIGHTS", {"owner:acme": 2})
+    before = {tenant: tenant_wait_count(tenant) for tenant in ("owner:acme", "owner:other-co", "other")}
+
+    for index, tenant in enumerate(("owner:acme", "owner:other-co", "token:0123abcd")):
+        task = SimpleNamespace(name="run_code_analysis_task", request=SimpleNamespace(
+            eta=None, published_at=95.0, tenant=tenant, submitted_at=90.0,
+        ))
+        start_task_span(task_id=f"t{index}", task=task)
+        end_task_span(task_id=f"t{index}", state="SUCCESS")
+
+    assert tenant_wait_count("owner:acme") == before["owner:acme"] + 1
+    # Tenants without a weight share one label
+    assert tenant_wait_count("owner:other-co") == before["owner:other-co"]
+    assert tenant_wait_count("other") == before["other"] + 2
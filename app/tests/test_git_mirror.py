@@ -0,0 +1,97 @@
+import io
+import subprocess
+
+import pytest
+
+from app.services import git_mirror
+from app.services.git_mirror import GitMirrorError, fetch_pr_refs
+from app.services.github_helper import fetch_pr_diff
+
+REPO_URL = "https://github.com/owner/repo"
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+def commit(work, path, content, message):
+    (work / path).write_text(content)
+    git(work, "add", path)
+    git(work, "commit", "-q", "-m", message)
+    return git(work, "rev-parse", "HEAD")
+
+@pytest.fixture
+def origin(tmp_path, mocker):
+    """
+    A bare "GitHub" repository with a main branch and PR #1, which adds
+    feature.py. main moves on after the PR branched off.
+    """
+    bare = tmp_path / "owner" / "repo.git"
+    work = tmp_path / "work"
+    git(tmp_path, "init", "-q", "--bare", "-b", "main", str(bare))
+    git(tmp_path, "init", "-q", "-b", "main", str(work))
+    commit(work, "app.py", "x = 1\n", "base")
+    git(work, "checkout", "-q", "-b", "feature")
+    head = commit(work, "feature.py", "def feature():\n    return 1\n", "feature")
+    git(work, "checkout", "-q", "main")
+    commit(work, "app.py", "x = 2\n", "main moves on")
+    git(work, "push", "-q", str(bare), "main", f"{head}:refs/pull/1/head")
+
+    mocker.patch("app.services.git_mirror.settings.GIT_MIRROR_DIR", str(tmp_path / "mirrors"))
+    mocker.patch("app.services.github_helper.settings.GIT_CLONE_URL_TEMPLATE", f"file://{tmp_path}/{{repo}}.git")
+    mocker.patch("app.services.github_helper.settings.DIFF_SOURCE", "git")
+    metadata = mocker.patch("app.services.github_helper.get_pr_metadata")
+    metadata.return_value = {"head": {"sha": head}, "base": {"ref": "main"}, "draft": False}
+    return {"bare": bare, "work": work, "head": head, "metadata": metadata}
+
+def test_diff_is_computed_in_the_mirror(origin):
+    pr = fetch_pr_diff(REPO_URL, 1)
+
+    assert pr.head_sha == origin["head"]
+    # Only the PR's changes, not those made on main since it branched off
+    assert [file.path for file in pr.files] == ["feature.py"]
+    assert "+def feature():" in pr.text()
+
+def test_fetch_is_skipped_when_head_is_already_mirrored(origin, mocker):
+    fetch_pr_diff(REPO_URL, 1, head_sha=origin["head"])
+    run_git = mocker.spy(git_mirror, "_run_git")
+
+    fetch_pr_diff(REPO_URL, 1, head_sha=origin["head"])
+
+    assert not any(call.args[0][2] == "fetch" for call in run_git.call_args_list if len(call.args[0]) > 2)
+
+def test_new_pushes_are_fetched_incrementally(origin):
+    fetch_pr_diff(REPO_URL, 1)
+    work = origin["work"]
+    git(work, "checkout", "-q", "feature")
+    new_head = commit(work, "feature.py", "def feature():\n    return 2\n", "update")
+    git(work, "push", "-q", str(origin["bare"]), f"{new_head}:refs/pull/1/head")
+    origin["metadata"].return_value = {"head": {"sha": new_head}, "base": {"ref": "main"}, "draft": False}
+
+    pr = fetch_pr_diff(REPO_URL, 1)
+
+    assert pr.head_sha == new_head
+    assert "+    return 2" in pr.text()
+
+def test_falls_back_to_download_when_git_fails(origin, mocker):
+    mocker.patch("app.services.github_helper.settings.GIT_CLONE_URL_TEMPLATE", "file:///nonexistent/{repo}.git")
+    client = mocker.patch("app.services.github_helper.get_github_client").return_value
+    diff = b"diff --git a/rest.py b/rest.py\n--- a/rest.py\n+++ b/rest.py\n@@ -0,0 +1 @@\n+y = 1\n"
+    client.download.return_value = (io.BytesIO(diff), False)
+
+    pr = fetch_pr_diff(REPO_URL, 1)
+
+    assert [file.path for file in pr.files] == ["rest.py"]
+
+def test_fetch_of_unknown_repository_raises(tmp_path, mocker):
+    mocker.patch("app.services.git_mirror.settings.GIT_MIRROR_DIR", str(tmp_path / "mirrors"))
+
+    with pytest.raises(GitMirrorError):
+        fetch_pr_refs(f"file://{tmp_path}/missing.git", 1, "main")
+
+def test_failed_diff_reports_git_error(origin):
+    path, base, _ = fetch_pr_refs(f"file://{origin['bare']}", 1, "main", origin["head"])
+
+    with pytest.raises(GitMirrorError, match="git diff failed: fatal: "):
+        git_mirror.diff_to_file(path, base, "0" * 40, 3, 1024)
@@ -0,0 +1,167 @@
+import email.utils
+import time
+import pytest
+from unittest.mock import MagicMock
+
+from app.services import github_client
+from app.services.github_client import GitHubClient, GitHubAPIError, GitHubRateLimited, get_github_client
+from app.services.github_helper import fetch_pr_diff, GitHubConnectionError
+
+def _response(status_code, body=None, headers=None, text=""):
+    response = MagicMock()
+    response.status_code = status_code
+    response.ok = status_code < 400
+    response.headers = headers or {}
+    response.json.return_value = body
+    response.text = text
+    response.iter_content.return_value = [text.encode()[i:i + 8] for i in range(0, len(text), 8)]
+    response.reason = "reason"
+    return response
+
+@pytest.fixture
+def client(mocker):
+    client = GitHubClient(token="test_token", base_url="https://api.test")
+    mocker.patch.object(client.session, "get")
+    mocker.patch("app.services.github_client.time.sleep")
+    return client
+
+def test_conditional_request_reuses_cached_body_on_304(client):
+    client.session.get.side_effect = [
+        _response(200, {"title": "PR"}, {"ETag": '"abc"'}),
+        _response(304),
+    ]
+
+    assert client.get_json("/repos/o/r/pulls/1") == {"title": "PR"}
+    assert client.get_json("/repos/o/r/pulls/1") == {"title": "PR"}
+
+    second_headers = client.session.get.call_args_list[1].kwargs["headers"]
+    assert second_headers["If-None-Match"] == '"abc"'
+
+def test_waits_for_reset_when_quota_is_low(client):
+    reset = time.time() + 30
+    client.session.get.side_effect = [
+        _response(200, {}, {"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(reset)}),
+        _response(200, {}),
+    ]
+
+    client.get_json("/a")
+    client.get_json("/b")
+
+    time.sleep.assert_called_once()
+    assert 0 < time.sleep.call_args.args[0] <= 30
+
+def test_retries_after_rate_limited_response(client):
+    client.session.get.side_effect = [
+        _response(429, {"message": "slow down"}, {"Retry-After": "2"}),
+        _response(200, {"ok": True}),
+    ]
+
+    assert client.get_json("/a") == {"ok": True}
+    time.sleep.assert_called_once_with(2.0)
+
+def test_retry_after_may_be_an_http_date(client):
+    retry_at = email.utils.formatdate(time.time() + 30, usegmt=True)
+    client.session.get.side_effect = [
+        _response(429, {"message": "slow down"}, {"Retry-After": retry_at}),
+        _response(200, {"ok": True}),
+    ]
+
+    assert client.get_json("/a") == {"ok": True}
+    assert 20 < time.sleep.call_args.args[0] <= 30
+
+def test_no_wait_mode_raises_instead_of_sleeping(client):
+    client.session.get.side_effect = [
+        _response(200, {}, {"X-RateLimit-Remaining": "1", "X-RateLimit-Reset": str(time.time() + 30)}),
+        _response(429, {"message": "slow down"}, {"Retry-After": "2"}),
+    ]
+    client.get_json("/a")
+
+    with pytest.raises(GitHubRateLimited) as excinfo:
+        client.get_json("/b", wait=False)
+    assert 0 < excinfo.value.retry_after <= 30
+
+    client._rate_limit_remaining = None
+    with pytest.raises(GitHubRateLimited):
+        client.get_json("/c", wait=False)
+    time.sleep.assert_not_called()
+
+def test_clients_are_kept_for_recent_tokens_only(mocker):
+    mocker.patch.object(github_client, "_clients", github_client.LRUCache(maxsize=2))
+
+    first = get_github_client("one")
+    get_github_client("two")
+    assert get_github_client("one") is first
+    get_github_client("three")
+
+    assert len(github_client._clients) == 2
+    assert get_github_client("one") is first
+
+def test_error_responses_raise(client):
+    client.session.get.return_value = _response(404, {"message": "Not Found"})
+
+    with pytest.raises(GitHubAPIError) as excinfo:
+        client.get_json("/missing")
+    assert excinfo.value.status_code == 404
+
+def test_download_stops_at_max_bytes(client):
+    client.session.get.return_value = _response(200, text="x" * 100)
+
+    spool, truncated = client.download("/diff", accept="text/plain", max_bytes=20)
+
+    assert truncated
+    assert spool.read() == b"x" * 20
+
+def test_fetch_pr_diff_uses_metadata_and_diff_requests(mocker, client):
+    diff = (
+        "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n+x = 1\n"
+        "diff --git a/package-lock.json b/package-lock.json\n--- a/package-lock.json\n+++ b/package-lock.json\n@@ -1 +1 @@\n+{}\n"
+    )
+    client.session.get.side_effect = [
+        _response(200, {"draft": False, "head": {"sha": "abc1234"}}),
+        _response(200, text=diff),
+    ]
+    mocker.patch("app.services.github_helper.get_github_client", return_value=client)
+
+    pr = fetch_pr_diff("https://github.com/o/r", 1, "test_token")
+
+    assert pr.head_sha == "abc1234"
+    assert [f.path for f in pr.files] == ["app.py"]
+    assert pr.text().startswith("diff --git a/app.py") and "package-lock" not in pr.text()
+    assert pr.skipped_files == ["package-lock.json (generated or vendored file)"]
+    assert client.session.get.call_count == 2
+
+def test_fetch_pr_diff_not_found(mocker, client):
+    client.session.get.return_value = _response(404, {"message": "Not Found"})
+    mocker.patch("app.services.github_helper.get_github_client", return_value=client)
+
+    with pytest.raises(GitHubConnectionError, match="Repository 'o/r' or PR '#1' not found"):
+        fetch_pr_diff("https://github.com/o/r", 1, "test_token")
+
+def test_fetch_pr_diff_downloads_again_when_the_passed_head_moved(mocker, client):
+    old_diff = "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n+x = 1\n"
+    new_diff = "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n+x = 2\n"
+    client.session.get.side_effect = [
+        _response(200, text=old_diff),
+        _response(200, {"draft": False, "head": {"sha": "def5678"}}),
+        _response(200, text=new_diff),
+        _response(200, {"draft": False, "head": {"sha": "def5678"}}),
+    ]
+    mocker.patch("app.services.github_helper.get_github_client", return_value=client)
+
+    pr = fetch_pr_diff("https://github.com/o/r", 1, "test_token", head_sha="abc1234")
+
+    assert pr.head_sha == "def5678"
+    assert "+x = 2" in pr.text()
+
+def test_fetch_pr_diff_gives_up_when_the_head_keeps_moving(mocker, client):
+    diff = "diff --git a/app.py b/app.py\n--- a/app.py\n+++ b/app.py\n@@ -1 +1 @@\n+x = 1\n"
+    client.session.get.side_effect = [
+        _response(200, text=diff),
+        _response(200, {"draft": False, "head": {"sha": "def5678"}}),
+        _response(200, text=diff),
+        _response(200, {"draft": False, "head": {"sha": "0123abc"}}),
+    ]
+    mocker.patch("app.services.github_helper.get_github_client", return_value=client)
+
+    with pytest.raises(GitHubConnectionError, match="kept changing"):
+        fetch_pr_diff("https://github.com/o/r", 1, "test_token", head_sha="abc1234")
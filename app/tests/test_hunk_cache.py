@@ -0,0 +1,68 @@
+import fakeredis
+import pytest
+
+from app.models.analysis import FileAnalysis, Issue
+from app.services.diff_parser import parse_diff
+from app.services.hunk_cache import lookup_hunks, make_hunk_key, store_hunk_findings
+
+MODEL = "model"
+PROMPT_VERSION = "v1"
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.hunk_cache.get_redis", return_value=client)
+    return client
+
+def file_diff(path, start, body, extra_hunk=""):
+    lines = body.splitlines()
+    return parse_diff(
+        f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n"
+        f"@@ -{start},1 +{start},{len(lines)} @@\n" + "\n".join(lines) + "\n" + extra_hunk
+    )[0]
+
+HUNK = " def total(items):\n+    result = sum(items)\n+    return result\n"
+
+def model_for(file_diff):
+    return MODEL
+
+def test_key_ignores_line_offsets_and_whitespace():
+    original = file_diff("a.py", 10, HUNK).hunks[0]
+    moved = file_diff("b.py", 90, HUNK.replace("    ", "\t")).hunks[0]
+
+    assert make_hunk_key(original, "a.py", MODEL, PROMPT_VERSION) == make_hunk_key(moved, "b.py", MODEL, PROMPT_VERSION)
+    assert make_hunk_key(original, "a.py", MODEL, PROMPT_VERSION) != make_hunk_key(original, "a.js", MODEL, PROMPT_VERSION)
+    assert make_hunk_key(original, "a.py", MODEL, PROMPT_VERSION) != make_hunk_key(original, "a.py", MODEL, "v2")
+
+def test_cached_findings_are_rebased_onto_the_new_position():
+    first = lookup_hunks([file_diff("a.py", 10, HUNK)], model_for, PROMPT_VERSION)
+    assert first.hits == 0
+    store_hunk_findings(first, [FileAnalysis(name="a.py", issues=[
+        Issue(type="bug", line=11, description="Shadowed builtin.", suggestion="Rename it."),
+        Issue(type="style", line=40, description="Outside the hunk.", suggestion="-"),
+    ])])
+
+    # Rebased: the same change now starts 50 lines further down
+    second = lookup_hunks([file_diff("a.py", 60, HUNK)], model_for, PROMPT_VERSION)
+
+    assert second.hits == 1
+    assert second.pending == []
+    assert [(issue.line, issue.description) for issue in second.cached_files[0].issues] == [(61, "Shadowed builtin.")]
+
+def test_only_uncached_hunks_stay_pending():
+    changed = "@@ -30,1 +30,2 @@\n x = 1\n+y = 2\n"
+    store_hunk_findings(lookup_hunks([file_diff("a.py", 10, HUNK)], model_for, PROMPT_VERSION), [])
+
+    lookup = lookup_hunks([file_diff("a.py", 10, HUNK, extra_hunk=changed)], model_for, PROMPT_VERSION)
+
+    assert lookup.hits == 1
+    assert lookup.cached_files == []  # The cached hunk was clean
+    assert [hunk.new_start for hunk in lookup.pending[0].hunks] == [30]
+    assert list(lookup.pending_keys) == ["a.py"]
+
+def test_findings_for_unknown_files_are_not_cached(fake_redis):
+    lookup = lookup_hunks([file_diff("a.py", 10, HUNK)], model_for, PROMPT_VERSION)
+
+    store_hunk_findings(lookup, [FileAnalysis(name="other.py", issues=[])])
+
+    assert fake_redis.keys("hunk-cache:*") == []
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from fastapi import status
+from opentelemetry import trace
+
+from app.core.metrics import STAGE_SECONDS, time_stage
+from app.core.tracing import inject_trace_context, start_task_span, end_task_span, queue_wait_seconds
+
+def stage_count(stage):
+    for metric in STAGE_SECONDS.collect():
+        for metric_sample in metric.samples:
+            if metric_sample.name == "acra_stage_duration_seconds_count" and metric_sample.labels["stage"] == stage:
+                return metric_sample.value
+    return 0
+
+def test_time_stage_observes_duration():
+    before = stage_count("unit-test")
+    with time_stage("unit-test"):
+        pass
+
+    assert stage_count("unit-test") == before + 1
+
+def test_metrics_endpoint(client):
+    with time_stage("diff_fetch"):
+        pass
+
+    response = client.get("/metrics")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'acra_stage_duration_seconds_count{stage="diff_fetch"}' in response.text
+
+def test_queue_wait_counts_from_eta():
+    assert queue_wait_seconds(SimpleNamespace(), 100.0) is None
+    assert queue_wait_seconds(SimpleNamespace(published_at=90.0, eta=None), 100.0) == 10.0
+    # Scheduled with a countdown: the wait starts at the ETA
+    assert queue_wait_seconds(SimpleNamespace(published_at=0.0, eta="1970-01-01T00:01:35+00:00"), 100.0) == 5.0
+
+def test_trace_context_propagates_to_task():
+    parent = trace.SpanContext(
+        trace_id=0x1234, span_id=0x5678, is_remote=False, trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED)
+    )
+    headers = {}
+    with trace.use_span(trace.NonRecordingSpan(parent)):
+        inject_trace_context(headers=headers)
+    assert "traceparent" in headers
+    assert "published_at" in headers
+
+    # Celery exposes message headers as attributes of the task request
+    task = SimpleNamespace(name="run_code_analysis_task", request=SimpleNamespace(eta=None, **headers))
+    before = stage_count("queue_wait")
+    start_task_span(task_id="task-1", task=task)
+    try:
+        assert trace.get_current_span().get_span_context().trace_id == 0x1234
+    finally:
+        end_task_span(task_id="task-1", state="SUCCESS")
+
+    assert stage_count("queue_wait") == before + 1
+    assert trace.get_current_span().get_span_context().trace_id != 0x1234
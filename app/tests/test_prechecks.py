@@ -0,0 +1,62 @@
+from app.services.diff_parser import parse_diff
+from app.services import prechecks
+from app.services.prechecks import check_file, run_prechecks, registered_checks, shutdown_pool
+
+def _file(path, body, new_file=False):
+    header = f"diff --git a/{path} b/{path}\n"
+    if new_file:
+        header += "new file mode 100644\n--- /dev/null\n"
+    else:
+        header += f"--- a/{path}\n"
+    return parse_diff(f"{header}+++ b/{path}\n{body}")[0]
+
+def test_whitespace_newline_and_line_length_checks(mocker):
+    mocker.patch("app.services.prechecks.settings.PRECHECK_MAX_LINE_LENGTH", 20)
+    body = (
+        "@@ -10,3 +10,3 @@\n"
+        " def f():\n"
+        "-    return 1\n"
+        "+    return 1  \n"
+        "+    return 'a very long line indeed'\n"
+        "\\ No newline at end of file\n"
+    )
+
+    issues = check_file(_file("a.py", body))
+
+    assert [(issue["line"], issue["description"]) for issue in issues] == [
+        (11, "Trailing whitespace."),
+        (12, "The file does not end with a newline."),
+        (12, "Line is 36 characters long (limit 20)."),
+    ]
+
+def test_missing_newline_on_the_old_side_only_is_not_reported():
+    body = "@@ -1 +1 @@\n-x = 0\n\\ No newline at end of file\n+x = 1\n"
+
+    assert check_file(_file("a.py", body)) == []
+
+def test_python_syntax_errors_in_new_files():
+    body = "@@ -0,0 +1,2 @@\n+def f(:\n+    pass\n"
+
+    issues = check_file(_file("new.py", body, new_file=True))
+    assert [(issue["type"], issue["line"]) for issue in issues] == [("bug", 1)]
+    # Hunks of modified files are fragments and are not parsed
+    assert check_file(_file("old.py", body)) == []
+
+def test_run_prechecks_in_process_pool(mocker):
+    mocker.patch("app.services.prechecks.settings.PRECHECK_POOL_MIN_FILES", 1)
+    files = [_file(f"f{i}.py", "@@ -1 +1 @@\n-x\n+x \n") for i in range(3)] + [_file("ok.py", "@@ -1 +1 @@\n-x\n+y\n")]
+
+    issues = run_prechecks(files)
+
+    assert sorted(issues) == ["f0.py", "f1.py", "f2.py"]
+    assert issues["f0.py"][0]["description"] == "Trailing whitespace."
+
+    # Spawned, not forked from a process that may be running client threads
+    assert prechecks._pool._mp_context.get_start_method() == "spawn"
+    shutdown_pool()
+    assert prechecks._pool is None
+
+def test_checks_are_registered_with_categories():
+    assert {check.name for check in registered_checks()} >= {
+        "trailing-whitespace", "final-newline", "line-length", "python-syntax"
+    }
@@ -0,0 +1,32 @@
+from app.services.diff_parser import parse_diff
+from app.services.prompt_packer import (
+    TIER_FULL, TIER_LIGHT, TIER_RULES, classify_file, estimate_tokens, pack_chunks, trim_context,
+)
+
+def _file(path, body):
+    return parse_diff(f"diff --git a/{path} b/{path}\n--- a/{path}\n+++ b/{path}\n{body}")[0]
+
+def test_classify_file_by_content_and_type():
+    assert classify_file(_file("app.py", "@@ -1 +1 @@\n-x = 0\n+x = 1\n")) == TIER_FULL
+    assert classify_file(_file("docs/guide.md", "@@ -1 +1 @@\n-Old\n+New\n")) == TIER_LIGHT
+    assert classify_file(_file("config.yaml", "@@ -1 +1 @@\n-a: 1\n+a: 2\n")) == TIER_LIGHT
+    # Deletions can remove a guard, so they are still reviewed
+    assert classify_file(_file("gone.py", "@@ -1,2 +0,0 @@\n-x = 0\n-y = 1\n")) == TIER_LIGHT
+    assert classify_file(parse_diff("diff --git a/old.py b/new.py\nsimilarity index 100%\nrename from old.py\nrename to new.py\n")[0]) == TIER_RULES
+
+def test_trim_context_splits_hunks_and_keeps_line_numbers():
+    context = [f" line {n}" for n in range(2, 12)]
+    body = "@@ -1,12 +1,12 @@\n-line 1\n+LINE 1\n" + "\n".join(context) + "\n-line 12\n+LINE 12\n"
+    trimmed = trim_context(_file("a.py", body), context_lines=2)
+
+    assert [hunk.header for hunk in trimmed.hunks] == ["@@ -1,3 +1,3 @@", "@@ -10,3 +10,3 @@"]
+    assert trimmed.hunks[0].lines == ["-line 1", "+LINE 1", " line 2", " line 3"]
+    assert trimmed.hunks[1].lines == [" line 10", " line 11", "-line 12", "+LINE 12"]
+
+def test_pack_chunks_respects_budget():
+    chunks = ["a" * 40, "b" * 40, "c" * 40, "d" * 400]
+
+    prompts = pack_chunks(chunks, token_budget=20)
+
+    assert prompts == ["a" * 40 + "\n" + "b" * 40, "c" * 40, "d" * 400]
+    assert estimate_tokens("a" * 41) == 11
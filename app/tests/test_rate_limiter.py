@@ -0,0 +1,74 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import LLMRateLimitError, acquire, aacquire, settle, record_throttled, record_success
+
+MODEL = "test-model"
+
+@pytest.fixture
+def fake_redis(mocker):
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.rate_limiter.get_redis", return_value=client)
+    mocker.patch("app.services.rate_limiter.settings.LLM_REQUESTS_PER_MINUTE", 2)
+    mocker.patch("app.services.rate_limiter.settings.LLM_TOKENS_PER_MINUTE", 1_000)
+    return client
+
+@pytest.fixture
+def clock(mocker):
+    now = {"t": 1_000.0}
+    mocker.patch("app.services.rate_limiter.time.time", side_effect=lambda: now["t"])
+    mocker.patch("app.services.rate_limiter.time.monotonic", side_effect=lambda: now["t"])
+    mocker.patch("app.services.rate_limiter.time.sleep", side_effect=lambda s: now.update(t=now["t"] + s))
+    return now
+
+def test_requests_beyond_the_rate_wait_for_refill(fake_redis, clock):
+    acquire(MODEL, 10)
+    acquire(MODEL, 10)
+    assert clock["t"] == 1_000.0
+
+    acquire(MODEL, 10, max_wait=60)
+    # One request refills every 30s at 2 requests per minute
+    assert clock["t"] >= 1_030.0
+
+def test_async_acquire_shares_the_buckets_and_waits_without_blocking(fake_redis, clock, mocker):
+    server = fakeredis.FakeServer()
+    mocker.patch("app.services.rate_limiter.get_redis", return_value=fakeredis.FakeRedis(server=server))
+    mocker.patch("app.services.rate_limiter.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    sleep = mocker.patch("app.services.rate_limiter.asyncio.sleep", side_effect=lambda s: clock.update(t=clock["t"] + s))
+    acquire(MODEL, 10)
+    acquire(MODEL, 10)
+
+    asyncio.run(aacquire(MODEL, 10, max_wait=60))
+
+    assert clock["t"] >= 1_030.0
+    sleep.assert_called()
+
+def test_raises_instead_of_waiting_past_max_wait(fake_redis, clock):
+    acquire(MODEL, 900)
+
+    with pytest.raises(LLMRateLimitError):
+        acquire(MODEL, 900, max_wait=5)
+
+def test_settle_returns_unused_tokens(fake_redis, clock):
+    acquire(MODEL, 900)
+    settle(MODEL, 900, 100)
+
+    acquire(MODEL, 800, max_wait=0)
+
+def test_throttling_backs_off_once_per_cooldown_and_recovers(fake_redis, mocker):
+    mocker.patch("app.services.rate_limiter.settings.LLM_RATE_INCREASE_STEP", 0.25)
+
+    assert record_throttled(MODEL) == 0.5
+    # Other workers hitting the same 429 within the cooldown don't back off further
+    assert record_throttled(MODEL) == 0.5
+    assert record_success(MODEL) == 0.75
+    assert record_success(MODEL) == 1.0
+    assert record_success(MODEL) == 1.0
+
+def test_limiter_fails_open_without_redis(mocker):
+    mocker.patch("app.services.rate_limiter.get_redis", side_effect=rate_limiter.redis.ConnectionError("down"))
+
+    acquire(MODEL, 10)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+from kombu.serialization import dumps, loads
+
+import app.core.celery_app  # Registers the orjson serializer
+from app.core.compression import compress, decompress
+from app.services.result_archive import ResultArchive
+from app.services.result_archiver import LOCK_KEY, archive_old_results
+from app.services.task_meta import get_task_meta, get_task_metas
+
+EXPIRES = 24 * 60 * 60
+
+@pytest.fixture
+def archive(tmp_path, mocker):
+    archive = ResultArchive(str(tmp_path / "archive" / "results.sqlite3"))
+    mocker.patch("app.services.task_meta.results_archive", archive)
+    return archive
+
+@pytest.fixture
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    mocker.patch("app.services.result_archiver.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    mocker.patch("app.services.task_meta.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    return fakeredis.FakeRedis(server=server)
+
+def set_task_meta(redis_client, task_id, status, age_seconds):
+    meta = {
+        "status": status, "result": {"files": []}, "task_id": task_id, "date_done": "2026-01-01T00:00:00",
+        "args": ["https://github.com/o/r", 1, "ghp_secret"], "kwargs": {"flight_key": None},
+    }
+    redis_client.set(f"celery-task-meta-{task_id}", compress(json.dumps(meta).encode()), ex=EXPIRES - age_seconds)
+
+def test_compression_round_trip():
+    small = b'{"status": "SUCCESS"}'
+    large = json.dumps({"issues": ["Line too long"] * 1000}).encode()
+
+    assert compress(small) == small
+    assert len(compress(large)) * 10 < len(large)
+    assert decompress(compress(large)) == large
+    assert decompress(small) == small
+
+def test_result_backend_serializer_compresses_large_results():
+    result = {"status": "SUCCESS", "result": {"issues": ["Line too long"] * 1000}}
+
+    content_type, encoding, payload = dumps(result, serializer="orjson")
+
+    assert len(payload) * 10 < len(json.dumps(result))
+    assert loads(payload, content_type, encoding) == result
+    assert json.loads(decompress(payload)) == result
+
+def test_old_finished_results_are_moved_to_the_archive(fake_redis, archive):
+    set_task_meta(fake_redis, "old", "SUCCESS", age_seconds=2 * 60 * 60)
+    set_task_meta(fake_redis, "recent", "SUCCESS", age_seconds=60)
+    set_task_meta(fake_redis, "running", "PROCESSING", age_seconds=2 * 60 * 60)
+
+    assert asyncio.run(archive_old_results(archive)) == 1
+
+    assert not fake_redis.exists("celery-task-meta-old")
+    assert fake_redis.exists("celery-task-meta-recent")
+    assert fake_redis.exists("celery-task-meta-running")
+    assert archive.get("old") is not None
+
+def test_archived_results_are_read_back_transparently(fake_redis, archive):
+    set_task_meta(fake_redis, "old", "SUCCESS", age_seconds=2 * 60 * 60)
+    set_task_meta(fake_redis, "recent", "SUCCESS", age_seconds=60)
+    asyncio.run(archive_old_results(archive))
+
+    assert asyncio.run(get_task_meta("old"))["status"] == "SUCCESS"
+    metas = asyncio.run(get_task_metas(["old", "recent", "unknown"]))
+    assert [meta["status"] for meta in metas] == ["SUCCESS", "SUCCESS", "PENDING"]
+
+def test_archived_results_are_deleted_after_retention(fake_redis, archive, mocker):
+    mocker.patch("app.services.result_archiver.settings.RESULTS_ARCHIVE_RETENTION_SECONDS", 60)
+    with patch("app.services.result_archive.time.time", return_value=time.time() - 120):
+        archive.put_many([("expired", b"{}")])
+    archive.put_many([("kept", b"{}")])
+
+    asyncio.run(archive_old_results(archive))
+
+    assert archive.get("expired") is None
+    assert archive.get("kept") is not None
+
+def test_pass_does_not_release_a_lock_taken_over_by_another_process(fake_redis, archive, mocker):
+    # The pass outlived its lock, which another process then took
+    mocker.patch.object(archive, "delete_older_than", side_effect=lambda cutoff: fake_redis.set(LOCK_KEY, "other") and 0)
+
+    asyncio.run(archive_old_results(archive))
+
+    assert fake_redis.get(LOCK_KEY) == b"other"
+
+def test_archived_results_leave_out_the_task_arguments(fake_redis, archive):
+    set_task_meta(fake_redis, "old", "SUCCESS", age_seconds=2 * 60 * 60)
+
+    asyncio.run(archive_old_results(archive))
+
+    meta = json.loads(decompress(archive.get("old")))
+    assert meta == {"status": "SUCCESS", "result": {"files": []}, "date_done": "2026-01-01T00:00:00"}
+    assert b"ghp_secret" not in archive.get("old")
@@ -0,0 +1,38 @@
+import fakeredis
+import pytest
+
+from app.services.result_store import ResultStore
+
+@pytest.fixture
+def fake_redis(mocker):
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.result_store.get_redis", return_value=client)
+    return client
+
+def test_results_are_shared_between_processes_through_redis(fake_redis):
+    api_worker_1 = ResultStore(local_size=10, local_ttl=60, redis_ttl=60)
+    api_worker_2 = ResultStore(local_size=10, local_ttl=60, redis_ttl=60)
+
+    api_worker_1.set("task-1", b'{"task_id": "task-1"}')
+
+    assert api_worker_2.get("task-1") == b'{"task_id": "task-1"}'
+    assert "task-2" not in api_worker_2
+
+def test_local_tier_is_bounded(fake_redis):
+    store = ResultStore(local_size=2, local_ttl=60, redis_ttl=60)
+    for i in range(5):
+        store.set(f"task-{i}", b"{}")
+
+    assert len(store._local) == 2
+    # Evicted entries are still served from Redis
+    assert store.get("task-0") == b"{}"
+
+def test_large_payloads_are_compressed_in_redis(fake_redis):
+    store = ResultStore(local_size=10, local_ttl=60, redis_ttl=60)
+    payload = b'{"issues": [' + b",".join([b'{"type": "style", "description": "Line too long"}'] * 500) + b"]}"
+
+    store.set("task-1", payload, local=False)
+
+    stored = fake_redis.get("task-result:task-1")
+    assert len(stored) * 10 < len(payload)
+    assert store.get("task-1") == payload
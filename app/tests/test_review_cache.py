@@ -0,0 +1,62 @@
+import pytest
+import fakeredis
+
+from app.services import review_cache
+from app.services.review_cache import make_cache_key, get_cached_review, store_review, get_cache_stats
+
+SAMPLE_RESULT = {
+    "files": [],
+    "summary": {"total_files": 0, "total_issues": 0, "critical_issues": 0}
+}
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    """Backs the review cache with an in-memory Redis."""
+    client = fakeredis.FakeRedis()
+    mocker.patch("app.services.review_cache.get_redis", return_value=client)
+    return client
+
+def test_cache_key_ignores_cosmetic_differences():
+    diff = "diff --git a/x.py b/x.py\n x = 0\n+print('hi')\n"
+    assert make_cache_key(diff) == make_cache_key(diff.replace("x = 0", "x = 0  ").replace("\n", "\r\n") + "\n\n")
+    assert make_cache_key(diff) != make_cache_key(diff + "+print('bye')\n")
+
+def test_cache_key_keeps_trailing_whitespace_of_changed_lines():
+    # The trailing-whitespace pre-check reports it, so the reviews differ
+    diff = "diff --git a/x.py b/x.py\n+print('hi')\n"
+    assert make_cache_key(diff) != make_cache_key(diff.replace("')", "')  "))
+
+def test_cache_key_depends_on_the_analyzer_settings(mocker):
+    diff = "+x = 1"
+    key = make_cache_key(diff)
+    mocker.patch("app.services.analyzer.settings.ANALYZER_CONTEXT_LINES", 10)
+    assert make_cache_key(diff) != key
+    mocker.patch("app.services.analyzer.LIGHT_MODEL_NAME", "other-light-model")
+    assert make_cache_key(diff) != key
+
+def test_cache_key_depends_on_model_and_prompt_version():
+    diff = "+x = 1"
+    assert make_cache_key(diff, model="a") != make_cache_key(diff, model="b")
+    assert make_cache_key(diff, prompt_version="v1") != make_cache_key(diff, prompt_version="v2")
+
+def test_store_and_hit_counters():
+    key = make_cache_key("+x = 1")
+    assert get_cached_review(key) is None
+    store_review(key, SAMPLE_RESULT)
+    assert get_cached_review(key) == SAMPLE_RESULT
+
+    stats = get_cache_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["hit_rate"] == 0.5
+
+def test_oldest_entries_are_evicted(mocker):
+    mocker.patch.object(review_cache.settings, "REVIEW_CACHE_MAX_ENTRIES", 2)
+    keys = [make_cache_key(f"+x = {i}") for i in range(3)]
+    for key in keys:
+        store_review(key, SAMPLE_RESULT)
+
+    assert get_cached_review(keys[0]) is None
+    assert get_cached_review(keys[2]) == SAMPLE_RESULT
+    assert get_cache_stats()["entries"] == 2
@@ -0,0 +1,33 @@
+import asyncio
+import fakeredis
+import pytest
+
+from app.services.single_flight import make_flight_key, claim_flight, release_flight
+
+@pytest.fixture
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.single_flight.get_redis", return_value=sync_client)
+    mocker.patch("app.services.single_flight.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    return sync_client
+
+def test_flight_key_depends_on_head_sha():
+    assert make_flight_key("https://github.com/o/r", 1, "a") == make_flight_key("https://github.com/O/r/", 1, "a")
+    assert make_flight_key("https://github.com/o/r", 1, "a") != make_flight_key("https://github.com/o/r", 1, "b")
+
+def test_second_claim_gets_the_task_in_flight(fake_redis):
+    key = make_flight_key("https://github.com/o/r", 1, "a")
+
+    assert asyncio.run(claim_flight(key, "task-1")) is None
+    assert asyncio.run(claim_flight(key, "task-2")) == "task-1"
+
+def test_release_only_by_the_owning_task(fake_redis):
+    key = make_flight_key("https://github.com/o/r", 1, "a")
+    asyncio.run(claim_flight(key, "task-1"))
+
+    release_flight(key, "task-2")
+    assert asyncio.run(claim_flight(key, "task-3")) == "task-1"
+
+    release_flight(key, "task-1")
+    assert asyncio.run(claim_flight(key, "task-3")) is None
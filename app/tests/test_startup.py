@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# The API only enqueues work; these are loaded by workers alone
+WORKER_ONLY_MODULES = {
+    "app.services.tasks",
+    "app.services.analyzer",
+    "langchain_core",
+    "langchain_google_genai",
+    "github",
+}
+
+# Cumulative import time of the API application, best of a few runs
+API_IMPORT_BUDGET_SECONDS = 1.5
+RUNS = 3
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def import_times(module):
+    """Runs `python -X importtime` on a module; returns the cumulative seconds of each imported module."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+def test_api_does_not_import_worker_stacks():
+    imported = import_times("app.main")
+
+    assert not [
+        name for name in imported
+        if any(name == module or name.startswith(f"{module}.") for module in WORKER_ONLY_MODULES)
+    ]
+
+# Wall-clock budgets depend on the machine and its load, so they only run on request
+@pytest.mark.skipif(not os.environ.get("RUN_TIMING_TESTS"), reason="set RUN_TIMING_TESTS=1 to check import time")
+def test_api_import_time_is_within_budget():
+    best = min(import_times("app.main")["app.main"] for _ in range(RUNS))
+
+    assert best < API_IMPORT_BUDGET_SECONDS, f"Importing the API took {best:.2f}s"
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+
+from app.services.task_events import stream_task_events, publish_task_event, format_sse
+
+@pytest.fixture
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.task_events.get_redis", return_value=sync_client)
+    mocker.patch("app.services.task_events.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    mocker.patch("app.services.task_meta.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    return sync_client
+
+def test_stream_relays_published_events_until_the_result(fake_redis):
+    async def collect():
+        events = []
+        async for event in stream_task_events("task-1"):
+            if event is None:  # keep-alive
+                continue
+            events.append(event)
+            if len(events) == 1:
+                # The worker publishes after the client has subscribed
+                publish_task_event("task-1", "status", {"status": "PROCESSING", "detail": "Fetching PR diff..."})
+                publish_task_event("task-1", "partial", {"files": [{"name": "a.py", "issues": []}]})
+                publish_task_event("task-1", "result", {"status": "COMPLETED", "results": {}})
+        return events
+
+    events = asyncio.run(collect())
+
+    assert [event["event"] for event in events] == ["status", "status", "partial", "result"]
+    assert events[0]["data"]["status"] == "PENDING"
+
+def test_stream_of_finished_task_returns_result_immediately(fake_redis):
+    fake_redis.set("celery-task-meta-task-1", json.dumps({"status": "SUCCESS", "result": {"files": []}}))
+
+    async def collect():
+        return [event async for event in stream_task_events("task-1")]
+
+    events = asyncio.run(collect())
+
+    assert len(events) == 1
+    assert events[0]["event"] == "result"
+    assert events[0]["data"]["results"] == {"files": []}
+
+def test_format_sse():
+    assert format_sse({"event": "status", "data": {"a": 1}}) == 'event: status\ndata: {"a": 1}\n\n'
+    assert format_sse(None) == ": keep-alive\n\n"
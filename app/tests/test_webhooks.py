@@ -0,0 +1,116 @@
+import hashlib
+import hmac
+import json
+
+import fakeredis
+import pytest
+from fastapi import status
+
+from app.services.github_webhooks import verify_signature, is_superseded
+
+SECRET = "webhook-secret"
+REPO_URL = "https://github.com/test/repo"
+
+@pytest.fixture(autouse=True)
+def fake_redis(mocker):
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    mocker.patch("app.services.github_webhooks.get_redis", return_value=sync_client)
+    mocker.patch("app.services.github_webhooks.get_async_redis", return_value=fakeredis.FakeAsyncRedis(server=server))
+    mocker.patch("app.routes.webhooks.settings.GITHUB_WEBHOOK_SECRET", SECRET)
+    return sync_client
+
+@pytest.fixture
+def mock_enqueue(mocker):
+    return mocker.patch("app.routes.webhooks.celery_app.send_task")
+
+@pytest.fixture
+def mock_revoke(mocker):
+    return mocker.patch("app.routes.webhooks.celery_app.control.revoke")
+
+def deliver(client, payload, event="pull_request", secret=SECRET, content_type="application/json"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    signature = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return client.post(
+        "/api/v1/webhooks/github",
+        content=body,
+        headers={"X-GitHub-Event": event, "X-Hub-Signature-256": signature, "Content-Type": content_type},
+    )
+
+def pr_event(action, head_sha, **pr_fields):
+    return {
+        "action": action,
+        "repository": {"html_url": REPO_URL},
+        "pull_request": {"number": 7, "head": {"sha": head_sha}, "additions": 3, "deletions": 1, "changed_files": 1, **pr_fields},
+    }
+
+def test_verify_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    signature = "sha256=" + hmac.new(SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+    assert verify_signature(SECRET, body, signature)
+    assert not verify_signature(SECRET, body + b" ", signature)
+    assert not verify_signature(SECRET, body, None)
+    assert not verify_signature("", body, signature)
+
+def test_rejects_invalid_signature(client, mock_enqueue):
+    response = deliver(client, pr_event("opened", "aaa"), secret="wrong")
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    mock_enqueue.assert_not_called()
+
+def test_schedules_review_with_debounce(client, mock_enqueue, mock_revoke):
+    response = deliver(client, pr_event("opened", "aaa"))
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    task_id = response.json()["task_id"]
+    kwargs = mock_enqueue.call_args.kwargs
+    assert kwargs["args"] == [REPO_URL, 7]
+    assert kwargs["kwargs"] == {"head_sha": "aaa"}
+    assert kwargs["task_id"] == task_id
+    assert kwargs["countdown"] == 30
+    mock_revoke.assert_not_called()
+
+def test_new_push_supersedes_scheduled_review(client, mock_enqueue, mock_revoke):
+    first = deliver(client, pr_event("opened", "aaa")).json()["task_id"]
+    second = deliver(client, pr_event("synchronize", "bbb")).json()["task_id"]
+
+    assert second != first
+    mock_revoke.assert_called_once_with(first)
+    assert is_superseded(REPO_URL, 7, "aaa")
+    assert not is_superseded(REPO_URL, 7, "bbb")
+
+def test_redelivery_does_not_schedule_again(client, mock_enqueue, mock_revoke):
+    first = deliver(client, pr_event("opened", "aaa")).json()["task_id"]
+    again = deliver(client, pr_event("opened", "aaa")).json()["task_id"]
+
+    assert again == first
+    assert mock_enqueue.call_count == 1
+    mock_revoke.assert_not_called()
+
+def test_close_cancels_scheduled_review(client, mock_enqueue, mock_revoke):
+    task_id = deliver(client, pr_event("opened", "aaa")).json()["task_id"]
+
+    response = deliver(client, pr_event("closed", "aaa"))
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    mock_revoke.assert_called_once_with(task_id)
+    assert is_superseded(REPO_URL, 7, "aaa")
+
+def test_ignores_other_events_and_drafts(client, mock_enqueue):
+    assert deliver(client, {"zen": "hi"}, event="ping").json()["message"] == "pong"
+    assert deliver(client, {"ref": "main"}, event="push").status_code == status.HTTP_202_ACCEPTED
+    deliver(client, pr_event("opened", "aaa", draft=True))
+    deliver(client, pr_event("labeled", "aaa"))
+
+    mock_enqueue.assert_not_called()
+
+def test_rejects_form_encoded_and_malformed_deliveries(client, mock_enqueue):
+    form = deliver(client, b"payload=%7B%7D", content_type="application/x-www-form-urlencoded")
+    missing_repository = deliver(client, {"action": "opened", "pull_request": {"number": 7, "head": {"sha": "aaa"}}})
+    not_json = deliver(client, b"{not json")
+
+    assert form.status_code == status.HTTP_400_BAD_REQUEST
+    assert missing_repository.status_code == status.HTTP_400_BAD_REQUEST
+    assert not_json.status_code == status.HTTP_400_BAD_REQUEST
+    mock_enqueue.assert_not_called()
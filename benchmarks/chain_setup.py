@@ -0,0 +1,39 @@
+"""
+Micro-benchmark: per-task review chain setup cost, before and after chain reuse.
+
+Before, every task built a new ChatGoogleGenerativeAI client, prompt template
+and structured-output chain (`_build_chain()`); now tasks fetch the chain built
+once per worker process (`get_chain()`). No LLM calls are made.
+
+Usage:
+    python -m benchmarks.chain_setup [iterations]
+"""
+import os
+import sys
+import time
+
+# Building a client needs an API key, but nothing is sent with it.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+
+from app.services.analyzer import _build_chain, get_chain
+
+
+def _time_per_call(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations
+
+
+def main(iterations: int = 50) -> None:
+    get_chain()  # Worker start-up (worker_process_init) builds the chain once
+    before = _time_per_call(_build_chain, iterations)
+    after = _time_per_call(get_chain, iterations)
+    print(f"Per-task chain setup over {iterations} iterations:")
+    print(f"  before (new chain per task):  {before * 1000:9.3f} ms")
+    print(f"  after  (shared worker chain): {after * 1000:9.3f} ms")
+    print(f"  speed-up: {before / after:,.0f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,90 @@
+"""
+Fake review LLM for offline benchmarks, and a Celery worker that uses it.
+
+FakeReviewChain stands in for the prompt | structured-output chain of
+app.services.analyzer: it reports one finding per reviewed file, token usage
+estimated from the prompt, and takes `latency + output_tokens / token_rate`
+seconds per call, like a model with a fixed time to first token and a fixed
+generation speed. Everything else in the worker (GitHub client, diff parsing,
+pre-checks, rate limiter, caches, result storage) is the real code.
+
+Usage (as started by benchmarks.load_test):
+    python -m benchmarks.fake_llm [celery worker options...]
+
+The latency and generation speed come from BENCH_LLM_LATENCY_SECONDS and
+BENCH_LLM_TOKENS_PER_SECOND.
+"""
+import asyncio
+import os
+import re
+import sys
+import time
+
+# Building the real chain needs an API key, but nothing is sent with it.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+
+from langchain_core.messages import AIMessage
+
+from app.services import analyzer
+from app.services.prompt_packer import estimate_tokens
+
+FILE_HEADER = re.compile(r"^diff --git a/\S+ b/(\S+)$", re.MULTILINE)
+
+# Output tokens of one reported finding
+TOKENS_PER_ISSUE = 60
+
+
+class FakeReviewChain:
+    """Drop-in replacement for the review chain with configurable speed."""
+
+    def __init__(self, latency: float = 1.0, token_rate: float = 200.0):
+        self.latency = latency
+        self.token_rate = token_rate
+
+    def _output(self, pr_diff: str):
+        paths = FILE_HEADER.findall(pr_diff) or ["diff"]
+        parsed = analyzer.ReviewOutput(files=[
+            analyzer.ReviewedFile(name=path, issues=[analyzer.ReviewIssue(
+                type="style", line=1,
+                description="Benchmark finding.", suggestion="No change needed.",
+            )])
+            for path in paths
+        ])
+        usage = {
+            "input_tokens": estimate_tokens(pr_diff),
+            "output_tokens": TOKENS_PER_ISSUE * len(paths),
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        delay = self.latency + usage["output_tokens"] / self.token_rate
+        return {"raw": AIMessage(content="", usage_metadata=usage), "parsed": parsed, "parsing_error": None}, delay
+
+    def invoke(self, inputs: dict, config=None):
+        output, delay = self._output(inputs["pr_diff"])
+        time.sleep(delay)
+        return output
+
+    async def ainvoke(self, inputs: dict, config=None):
+        output, delay = self._output(inputs["pr_diff"])
+        await asyncio.sleep(delay)
+        return output
+
+
+def install(latency: float, token_rate: float) -> None:
+    """Makes get_chain() return the fake chain for every model of the analyzer."""
+    chain = FakeReviewChain(latency, token_rate)
+    for model in (analyzer.MODEL_NAME, analyzer.LIGHT_MODEL_NAME):
+        analyzer._chains[(model, analyzer.TEMPERATURE, analyzer.PROMPT_VERSION)] = chain
+
+
+def main(argv) -> None:
+    install(
+        latency=float(os.environ.get("BENCH_LLM_LATENCY_SECONDS", "1.0")),
+        token_rate=float(os.environ.get("BENCH_LLM_TOKENS_PER_SECOND", "200")),
+    )
+    # Installed before the pool forks, so every worker process inherits the fake chain
+    from app.core.celery_app import celery_app
+    celery_app.worker_main(["worker", *argv])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
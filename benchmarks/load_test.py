@@ -0,0 +1,393 @@
+"""
+Offline load test: the real API and Celery workers against a stub GitHub API
+and a fake LLM, on one machine with no network access.
+
+Starts a Redis server (unless --redis-url is given), the stub GitHub API
+(benchmarks.stub_github), the API under uvicorn and a worker whose LLM is
+benchmarks.fake_llm. Then it submits --requests analyses with a mix of PR sizes,
+keeping --concurrency of them in flight, and follows each over the SSE stream
+until its result arrives. It reports:
+- throughput (completed reviews per second)
+- P50/P95/P99 end-to-end latency (submit to result event)
+- CPU time and peak RSS of the worker and API process trees
+- Redis commands processed
+
+Exits with status 1 if a --max-p95/--min-rps gate is not met, so it can guard
+against regressions. Linux only (process stats are read from /proc).
+
+Usage:
+    python -m benchmarks.load_test --requests 200 --concurrency 20 \\
+        --mix small=70,medium=25,large=5 --llm-latency 0.5 --json report.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import redis
+import requests
+
+from benchmarks.stub_github import SIZE_NAMES, StubGitHub, pr_number_for
+
+REPO_URL = "https://github.com/benchmark/repo"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+PROCESS_LABELS = {"worker": "Worker", "api": "API"}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        size, _, weight = part.partition("=")
+        if size not in SIZE_NAMES:
+            raise argparse.ArgumentTypeError(f"Unknown PR size '{size}'; expected one of {', '.join(SIZE_NAMES)}.")
+        weights[size] = float(weight or 1)
+    return weights
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+# --- Process statistics (Linux /proc) ---
+
+def _process_tree(pid: int) -> List[int]:
+    pids, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        pids.append(current)
+        try:
+            for tid in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{tid}/children") as f:
+                    stack.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _cpu_seconds(pid: int) -> float:
+    """CPU time (user + system) of a process tree, including reaped children."""
+    total = 0.0
+    for tree_pid in _process_tree(pid):
+        try:
+            with open(f"/proc/{tree_pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime, cutime, cstime (fields 14-17 of stat, counted after the command name)
+        total += sum(int(value) for value in fields[11:15]) / CLOCK_TICKS
+    return total
+
+
+def _rss_bytes(pid: int) -> int:
+    total = 0
+    for tree_pid in _process_tree(pid):
+        try:
+            with open(f"/proc/{tree_pid}/statm") as f:
+                total += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+    return total
+
+
+class ResourceSampler:
+    """Samples the CPU time and RSS of process trees in the background."""
+
+    def __init__(self, pids: Dict[str, int], interval: float = 0.5):
+        self.pids = pids
+        self.interval = interval
+        self.peak_rss = {name: 0 for name in pids}
+        self._cpu_start = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for name, pid in self.pids.items():
+                self.peak_rss[name] = max(self.peak_rss[name], _rss_bytes(pid))
+
+    def start(self):
+        self._cpu_start = {name: _cpu_seconds(pid) for name, pid in self.pids.items()}
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Dict[str, float]]:
+        self._stop.set()
+        self._thread.join()
+        return {
+            name: {
+                "cpu_seconds": _cpu_seconds(pid) - self._cpu_start[name],
+                "peak_rss_mb": self.peak_rss[name] / 2**20,
+            }
+            for name, pid in self.pids.items()
+        }
+
+
+# --- Load driver ---
+
+def run_review(api_url: str, pr_number: int, timeout: float) -> Dict[str, object]:
+    """Submits one analysis and follows its event stream until it finishes."""
+    start = time.perf_counter()
+    response = requests.post(f"{api_url}/api/v1/analyze-pr", json={"repo_url": REPO_URL, "pr_number": pr_number}, timeout=timeout)
+    response.raise_for_status()
+    task_id = response.json()["task_id"]
+
+    outcome = "timeout"
+    with requests.get(f"{api_url}/api/v1/stream/{task_id}", stream=True, timeout=timeout) as stream:
+        event = None
+        for line in stream.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event in ("result", "failure", "revoked"):
+                    outcome = event
+                    break
+                # A task that had already ended when the stream started reports only its status
+                if event == "status" and data.get("status") in ("FAILURE", "REVOKED"):
+                    outcome = "failure" if data["status"] == "FAILURE" else "revoked"
+                    break
+    return {"task_id": task_id, "pr_number": pr_number, "outcome": outcome, "latency": time.perf_counter() - start}
+
+
+def plan_requests(count: int, mix: Dict[str, float], repeat_ratio: float, seed: int) -> List[int]:
+    """
+    Picks the PR numbers to submit. A `repeat_ratio` share of requests repeats
+    an earlier PR (review cache / single-flight hits); the rest are new PRs.
+    """
+    rng = random.Random(seed)
+    sizes, weights = zip(*mix.items())
+    sequences = {size: 0 for size in sizes}
+    numbers: List[int] = []
+    for _ in range(count):
+        if numbers and rng.random() < repeat_ratio:
+            numbers.append(rng.choice(numbers))
+            continue
+        size = rng.choices(sizes, weights)[0]
+        sequences[size] += 1
+        numbers.append(pr_number_for(size, sequences[size]))
+    return numbers
+
+
+def _redis_commands(client: redis.Redis) -> Optional[int]:
+    """Commands processed by the Redis server so far, if it reports them."""
+    try:
+        return client.info("stats")["total_commands_processed"]
+    except redis.ResponseError:
+        # INFO is disabled on some managed and Redis-compatible servers
+        return None
+
+
+def _wait_for_http(url: str, timeout: float, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with status {process.returncode} before {url} came up.")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s.")
+
+
+def _start_redis(tmpdir: str) -> Tuple[subprocess.Popen, str]:
+    binary = shutil.which("redis-server")
+    if binary is None:
+        raise SystemExit("redis-server not found on PATH; install it or pass --redis-url.")
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--save", "", "--appendonly", "no", "--dir", tmpdir],
+        stdout=subprocess.DEVNULL,
+    )
+    client = redis.Redis(port=port)
+    for _ in range(50):
+        try:
+            client.ping()
+            break
+        except redis.ConnectionError:
+            time.sleep(0.1)
+    return process, f"redis://127.0.0.1:{port}/0"
+
+
+def run(args) -> Dict[str, object]:
+    tmpdir = tempfile.mkdtemp(prefix="acra-bench-")
+    processes: List[subprocess.Popen] = []
+    stub = StubGitHub(diffs_dir=args.diffs_dir).start()
+    try:
+        redis_url = args.redis_url
+        if redis_url is None:
+            redis_process, redis_url = _start_redis(tmpdir)
+            processes.append(redis_process)
+        redis_client = redis.Redis.from_url(redis_url)
+        redis_client.flushdb()
+
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "REDIS_URL": redis_url,
+            "GITHUB_API_URL": stub.url,
+            "GITHUB_ACCESS_TOKEN": "",
+            "GOOGLE_API_KEY": "benchmark-key",
+            "LLM_REQUESTS_PER_MINUTE": str(args.llm_rpm),
+            "LLM_TOKENS_PER_MINUTE": str(args.llm_tpm),
+            "RESULTS_ARCHIVE_PATH": os.path.join(tmpdir, "results_archive.sqlite3"),
+            "WORKER_METRICS_PORT": "0",
+            "WORKER_MODE": args.worker_mode,
+            "BENCH_LLM_LATENCY_SECONDS": str(args.llm_latency),
+            "BENCH_LLM_TOKENS_PER_SECOND": str(args.llm_token_rate),
+        }
+        env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        log = open(os.path.join(tmpdir, "services.log"), "wb")
+
+        api_port = _free_port()
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(api_port),
+             "--workers", str(args.api_workers), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        processes.append(api)
+        worker = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_llm", "-Q", "reviews.small,reviews.large",
+             "--concurrency", str(args.worker_concurrency), "--prefetch-multiplier=1", "--loglevel", "warning"],
+            cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        processes.append(worker)
+
+        api_url = f"http://127.0.0.1:{api_port}"
+        _wait_for_http(f"{api_url}/", 60, api)
+        # Warm-up review: waits for the worker to come up and warms every process
+        warm_up = run_review(api_url, pr_number_for("small", 0), timeout=120)
+        if warm_up["outcome"] != "result":
+            raise RuntimeError(f"Warm-up review did not complete ({warm_up['outcome']}); see {log.name}.")
+
+        numbers = plan_requests(args.requests, args.mix, args.repeat_ratio, args.seed)
+        sampler = ResourceSampler({"worker": worker.pid, "api": api.pid})
+        redis_commands_before = _redis_commands(redis_client)
+        github_requests_before = stub.requests
+        sampler.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            reviews = list(executor.map(lambda n: run_review(api_url, n, args.timeout), numbers))
+        elapsed = time.perf_counter() - start
+        resources = sampler.stop()
+        redis_commands_after = _redis_commands(redis_client)
+        redis_commands = None
+        if redis_commands_before is not None and redis_commands_after is not None:
+            redis_commands = redis_commands_after - redis_commands_before
+
+        latencies = [review["latency"] for review in reviews if review["outcome"] == "result"]
+        outcomes: Dict[str, int] = {}
+        for review in reviews:
+            outcomes[review["outcome"]] = outcomes.get(review["outcome"], 0) + 1
+        return {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "worker_mode": args.worker_mode,
+            "mix": args.mix,
+            "outcomes": outcomes,
+            "elapsed_seconds": elapsed,
+            "throughput_rps": len(latencies) / elapsed,
+            "latency_seconds": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "mean": statistics.fmean(latencies) if latencies else 0.0,
+            },
+            "resources": resources,
+            "redis_commands": redis_commands,
+            "redis_commands_per_review": None if redis_commands is None else redis_commands / max(1, len(reviews)),
+            "github_requests": stub.requests - github_requests_before,
+        }
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        stub.stop()
+
+
+def print_report(report: Dict[str, object]) -> None:
+    latency = report["latency_seconds"]
+    print(
+        f"Reviews: {report['requests']} at concurrency {report['concurrency']}, mix {report['mix']}, "
+        f"{report['worker_mode']} worker"
+    )
+    print(f"Outcomes: {report['outcomes']}")
+    print(f"Throughput: {report['throughput_rps']:.2f} reviews/s over {report['elapsed_seconds']:.1f}s")
+    print(f"Latency: p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s")
+    for name, usage in report["resources"].items():
+        print(f"{PROCESS_LABELS[name]}: {usage['cpu_seconds']:.2f} CPU-s, peak RSS {usage['peak_rss_mb']:.0f} MB")
+    if report["redis_commands"] is not None:
+        print(f"Redis: {report['redis_commands']} commands ({report['redis_commands_per_review']:.1f} per review)")
+    else:
+        print("Redis: command count unavailable (INFO not supported by the server)")
+    print(f"GitHub: {report['github_requests']} requests")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10, help="Reviews in flight at once")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("small=70,medium=25,large=5"))
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Share of requests repeating an earlier PR")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--diffs-dir", help="Serve recorded diffs from <dir>/{small,medium,large}/*.diff")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Fake LLM seconds per call before generation")
+    parser.add_argument("--llm-token-rate", type=float, default=200.0, help="Fake LLM output tokens per second")
+    parser.add_argument("--llm-rpm", type=int, default=1_000_000, help="LLM_REQUESTS_PER_MINUTE of the workers")
+    parser.add_argument("--llm-tpm", type=int, default=1_000_000_000, help="LLM_TOKENS_PER_MINUTE of the workers")
+    parser.add_argument("--worker-concurrency", type=int, default=8)
+    parser.add_argument("--worker-mode", choices=["prefork", "async"], default="prefork", help="WORKER_MODE of the worker")
+    parser.add_argument("--api-workers", type=int, default=1)
+    parser.add_argument("--redis-url", help="Use this Redis (its database is flushed) instead of starting one")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for each review")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    parser.add_argument("--max-p95", type=float, help="Fail if the P95 latency exceeds this many seconds")
+    parser.add_argument("--min-rps", type=float, help="Fail if the throughput is below this many reviews/s")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failures = []
+    if args.max_p95 is not None and report["latency_seconds"]["p95"] > args.max_p95:
+        failures.append(f"P95 latency {report['latency_seconds']['p95']:.3f}s exceeds {args.max_p95}s")
+    if args.min_rps is not None and report["throughput_rps"] < args.min_rps:
+        failures.append(f"throughput {report['throughput_rps']:.2f}/s is below {args.min_rps}/s")
+    if report["outcomes"].get("result", 0) != report["requests"]:
+        failures.append(f"not every review completed: {report['outcomes']}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
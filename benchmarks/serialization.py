@@ -0,0 +1,129 @@
+"""
+Micro-benchmark: CPU cost and payload size of getting a review result from the
+LLM's parsed output to the bytes served by /results, before and after the
+structured output fast path.
+
+Before, the result went pydantic v1 model -> .json() -> json.loads -> v2
+validation -> model_dump -> Celery's JSON serializer in the worker, and was
+decoded and validated again by the API on read. Now the parsed output is
+converted once to the canonical models, serialized with orjson for the result
+backend, and stored pre-serialized so the API returns the bytes as-is.
+
+Usage:
+    python -m benchmarks.serialization [issues] [iterations]
+"""
+import json
+import os
+import sys
+import time
+from typing import List
+
+# Importing the analyzer builds no client, but settings want an API key.
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-key")
+
+import orjson
+from kombu.utils.json import dumps as kombu_json_dumps
+from langchain_core.pydantic_v1 import BaseModel
+
+from app.models.analysis import AnalysisResultData, TaskResultResponse
+from app.services.analyzer import ReviewOutput, _to_result
+
+TASK_ID = "a1b2c3d4-e5f6-7890-1234-567890abcdef"
+
+
+# The analyzer's former output models, which doubled as the result schema
+class LegacyIssue(BaseModel):
+    type: str
+    line: int
+    description: str
+    suggestion: str
+
+class LegacyFileAnalysis(BaseModel):
+    name: str
+    issues: List[LegacyIssue]
+
+class LegacySummary(BaseModel):
+    total_files: int
+    total_issues: int
+    critical_issues: int
+
+class LegacyResult(BaseModel):
+    files: List[LegacyFileAnalysis]
+    summary: LegacySummary
+
+
+def _files(issue_count: int, issues_per_file: int = 10) -> list:
+    return [
+        {
+            "name": f"src/module_{start // issues_per_file}.py",
+            "issues": [
+                {
+                    "type": "bug" if n % 5 == 0 else "style",
+                    "line": n + 1,
+                    "description": f"Possible issue number {n} found while reviewing this line of the diff.",
+                    "suggestion": "Consider handling the edge case explicitly and adding a test for it.",
+                }
+                for n in range(start, min(start + issues_per_file, issue_count))
+            ],
+        }
+        for start in range(0, issue_count, issues_per_file)
+    ]
+
+
+def _meta(result: dict) -> dict:
+    # What Celery's result backend stores for a successful task
+    return {"status": "SUCCESS", "result": result, "traceback": None, "children": [], "task_id": TASK_ID,
+            "date_done": "2024-01-01T00:00:00.000000"}
+
+
+def before(parsed: LegacyResult):
+    # Worker: analyzer returns .json(); the task loads, validates and dumps it for Celery
+    result = AnalysisResultData(**json.loads(parsed.json())).model_dump()
+    stored = kombu_json_dumps(_meta(result)).encode("utf-8")
+    # API: decode the meta, validate the response and serialize it
+    meta = json.loads(stored)
+    response = TaskResultResponse(task_id=TASK_ID, status="COMPLETED", results=meta["result"])
+    return stored, response.model_dump_json().encode("utf-8")
+
+
+def after(parsed: ReviewOutput):
+    # Worker: one conversion to the canonical models and orjson for both copies
+    result = _to_result(parsed).model_dump()
+    stored = orjson.dumps(_meta(result))
+    served = orjson.dumps({"task_id": TASK_ID, "status": "COMPLETED", "results": result})
+    # API: the pre-serialized response is returned as-is
+    return stored, served
+
+
+def _cpu_per_call(func, arg, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        func(arg)
+    return (time.process_time() - start) / iterations
+
+
+def main(issue_count: int = 500, iterations: int = 200) -> None:
+    files = _files(issue_count)
+    legacy = LegacyResult.parse_obj({
+        "files": files,
+        "summary": {"total_files": len(files), "total_issues": issue_count, "critical_issues": 0},
+    })
+    parsed = ReviewOutput.parse_obj({"files": files})
+
+    before_cpu = _cpu_per_call(before, legacy, iterations)
+    after_cpu = _cpu_per_call(after, parsed, iterations)
+    before_stored, before_served = before(legacy)
+    after_stored, after_served = after(parsed)
+
+    print(f"Result with {issue_count} issues, {iterations} iterations:")
+    print(f"  CPU per result   before: {before_cpu * 1000:8.3f} ms   after: {after_cpu * 1000:8.3f} ms"
+          f"   ({before_cpu / after_cpu:.1f}x)")
+    print(f"  backend payload  before: {len(before_stored):8,d} B    after: {len(after_stored):8,d} B")
+    print(f"  response         before: {len(before_served):8,d} B    after: {len(after_served):8,d} B")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+    )
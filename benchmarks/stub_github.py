@@ -0,0 +1,175 @@
+"""
+Stub GitHub REST API for offline benchmarks.
+
+Serves the two endpoints a review needs, PR metadata and the PR diff
+(`GET /repos/{owner}/{repo}/pulls/{number}`, as JSON or as a diff depending on
+the Accept header), from a local HTTP server. The size class of a PR is
+encoded in its number (`SIZE_CLASSES[number // PR_NUMBER_STRIDE]`) and its
+diff is generated deterministically from the number, so each PR number has
+unique content (no accidental review cache hits) yet every run is reproducible.
+
+Recorded diffs can be served instead: with `diffs_dir`, PR N of a size class
+gets one of the `*.diff` files of `<diffs_dir>/<size class>/`, plus a one-line
+file unique to N so that different PRs still miss the review cache.
+
+Usage (standalone):
+    python -m benchmarks.stub_github [port] [diffs_dir]
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+# Files and changed lines per file of each size class
+SIZE_CLASSES: Dict[str, Tuple[int, int]] = {
+    "small": (2, 20),
+    "medium": (10, 80),
+    "large": (40, 200),
+}
+SIZE_NAMES = list(SIZE_CLASSES)
+PR_NUMBER_STRIDE = 1_000_000
+
+DIFF_MEDIA_TYPE = "application/vnd.github.v3.diff"
+
+
+def pr_number_for(size: str, sequence: int) -> int:
+    """Returns the PR number the stub serves as the `sequence`-th PR of a size class."""
+    return SIZE_NAMES.index(size) * PR_NUMBER_STRIDE + sequence
+
+
+def size_of(pr_number: int) -> str:
+    return SIZE_NAMES[min(pr_number // PR_NUMBER_STRIDE, len(SIZE_NAMES) - 1)]
+
+
+def _file_diff(path: str, lines: List[str]) -> str:
+    body = "".join(f"+{line}\n" for line in lines)
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        f"new file mode 100644\n"
+        f"index 0000000..1111111\n"
+        f"--- /dev/null\n"
+        f"+++ b/{path}\n"
+        f"@@ -0,0 +1,{len(lines)} @@\n"
+        f"{body}"
+    )
+
+
+def generate_diff(pr_number: int) -> str:
+    """Builds a synthetic Python diff of the PR's size class, unique to its number."""
+    files, lines_per_file = SIZE_CLASSES[size_of(pr_number)]
+    diffs = []
+    for index in range(files):
+        lines = [f"def handler_{pr_number}_{index}(request):"]
+        lines += [f"    value_{n} = request.get('field_{n}', {pr_number + n})" for n in range(lines_per_file - 2)]
+        lines.append("    return value_0")
+        diffs.append(_file_diff(f"src/pr_{pr_number}/module_{index}.py", lines))
+    return "".join(diffs)
+
+
+class StubGitHub:
+    """A stub GitHub API running on a background thread."""
+
+    def __init__(self, port: int = 0, diffs_dir: Optional[str] = None):
+        self.recorded = self._load_recorded(diffs_dir) if diffs_dir else {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @staticmethod
+    def _load_recorded(diffs_dir: str) -> Dict[str, List[str]]:
+        recorded = {}
+        for size in SIZE_NAMES:
+            size_dir = os.path.join(diffs_dir, size)
+            if os.path.isdir(size_dir):
+                recorded[size] = [
+                    open(os.path.join(size_dir, name), encoding="utf-8").read()
+                    for name in sorted(os.listdir(size_dir)) if name.endswith(".diff")
+                ]
+        return recorded
+
+    def diff_for(self, pr_number: int) -> str:
+        diffs = self.recorded.get(size_of(pr_number))
+        if not diffs:
+            return generate_diff(pr_number)
+        diff = diffs[pr_number % len(diffs)]
+        if not diff.endswith("\n"):
+            diff += "\n"
+        return diff + _file_diff(f"BENCHMARK_{pr_number}.txt", [f"Benchmark PR {pr_number}"])
+
+    def metadata_for(self, repo: str, pr_number: int) -> dict:
+        files, lines_per_file = SIZE_CLASSES[size_of(pr_number)]
+        head_sha = hashlib.sha1(f"{repo}#{pr_number}".encode("utf-8")).hexdigest()
+        return {
+            "number": pr_number,
+            "state": "open",
+            "draft": False,
+            "head": {"sha": head_sha},
+            "additions": files * lines_per_file,
+            "deletions": 0,
+            "changed_files": files,
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                parts = self.path.split("?")[0].strip("/").split("/")
+                # repos/{owner}/{repo}/pulls/{number}
+                if len(parts) != 5 or parts[0] != "repos" or parts[3] != "pulls" or not parts[4].isdigit():
+                    self._send(404, "application/json", json.dumps({"message": "Not Found"}).encode("utf-8"))
+                    return
+                repo, pr_number = f"{parts[1]}/{parts[2]}", int(parts[4])
+                if DIFF_MEDIA_TYPE in self.headers.get("Accept", ""):
+                    self._send(200, "text/plain; charset=utf-8", stub.diff_for(pr_number).encode("utf-8"))
+                else:
+                    body = json.dumps(stub.metadata_for(repo, pr_number)).encode("utf-8")
+                    self._send(200, "application/json", body)
+
+            def _send(self, status: int, content_type: str, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                # Generous quota, so the client never waits for a reset
+                self.send_header("X-RateLimit-Remaining", "5000")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StubGitHub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    stub = StubGitHub(
+        port=int(sys.argv[1]) if len(sys.argv) > 1 else 8081,
+        diffs_dir=sys.argv[2] if len(sys.argv) > 2 else None,
+    ).start()
+    print(f"Stub GitHub API listening on {stub.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
-from app.routes import analysis
+from app.routes import analysis, metrics, webhooks
 from app.core.logging import setup_logging
+from app.services.lifespan import api_lifespan
 
 # Setup structured logging
 setup_logging()
@@ -9,6 +10,11 @@ app = FastAPI(
     title="Autonomous Code Review Agent API",
     description="An API for an AI-powered code review agent that analyzes GitHub pull requests.",
     version="0.1.0",
+    # Archives old results and dispatches fairly scheduled analyses in the background
+    lifespan=api_lifespan,
 )
 
-app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
\ No newline at end of file
+app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
+app.include_router(webhooks.router, prefix="/api/v1", tags=["webhooks"])
+# Prometheus scrape endpoint
+app.include_router(metrics.router, tags=["metrics"])
\ No newline at end of file